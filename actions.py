@@ -1,15 +1,18 @@
 class Action:
     """
-    The base action class. Every character has one or more possible actions
+    The base action class. Every hero class has one or more possible actions,
+    one instance is shared by all heroes of the class so the acting
+    character is passed to do
     """
 
-    def __init__(self, char, name, names):
-        self.char = char
+    __slots__ = ("name", "names")
+
+    def __init__(self, name, names):
         self.name = name
         self.names = names
     
     def __str__(self):
         return "%s" % (self.name)
 
-    def do(self, what):
-        return "%s %s" % (self.char.name, self.names)
+    def do(self, char, what):
+        return "%s %s" % (char.name, self.names)
@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+"""
+Cost of building a reply: inline % formatting as the handlers used to
+do it against rendering from the message catalog, for a static message
+(the !help index) and one with fields. Replies go through the locale
+table a channel keeps, Template.render with a dict that is already
+built and MessageCatalog.render are there for comparison.
+
+Run from the repository root: python3 -m benchmarks.catalog
+"""
+
+import timeit
+from catalog import MessageCatalog
+from channel import ChannelContext
+
+NUMBER = 1000000
+
+def main():
+    catalog = MessageCatalog()
+    catalog.load()
+    context = ChannelContext("#bench")
+    context_de = ChannelContext("#bench_de")
+    context_de.set_locale("de")
+    user = "viewer123"
+    template = catalog.table("en")["char.none"]
+    cases = [
+        ("static, inline", lambda: "Available help commands are: %s" % ("do, char and game")),
+        ("static, channel", lambda: context.render("help.index")),
+        ("static, catalog", lambda: catalog.render("en", "help.index")),
+        ("fields, inline", lambda: "@%s You do not have a character! Please create one first, see '!help char' for more information" % (user)),
+        ("fields, template", lambda values={ "user": user }: template.render(values)),
+        ("fields, channel", lambda: context.render("char.none", user=user)),
+        ("fields, channel de", lambda: context_de.render("char.none", user=user)),
+        ("fields, catalog", lambda: catalog.render("en", "char.none", user=user)),
+    ]
+    for name, case in cases:
+        elapsed = min(timeit.repeat(case, number=NUMBER, repeat=3))
+        print("%-22s %8.1f ns" % (name, elapsed / NUMBER * 1e9))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Throughput of the chat handlers as the number of joined channels grows.
+Characters live in an in-memory database behind the CharacterStore cache.
+Every line is parsed once, goes through all handlers (the chat log is
+not started) and is routed to its channel's context, replies are
+collected instead of sent.
+
+Run from the repository root: python3 -m benchmarks.channels
+"""
+
+import random
+import time
+import channel
+from database import Database
+from store import CharacterStore
+from character import Character
+from handlers import HANDLERS
+from irc_message import parse_message
+
+LINES = 100000
+
+def make_lines(channels, count, seed=1):
+    """
+    Builds synthetic chat, about one in twenty lines is a command
+    """
+
+    rng = random.Random(seed)
+    lines = []
+    for i in range(count):
+        chan = channels[rng.randrange(len(channels))]
+        user = "viewer%i" % (rng.randrange(5000))
+        roll = rng.random()
+        if roll < 0.02:
+            text = "!char"
+        elif roll < 0.05:
+            text = "!do run"
+        else:
+            text = "PogChamp what a play %i" % (i)
+        lines.append(":%s!%s@%s.tmi.twitch.tv PRIVMSG %s :%s" % (user, user, user, chan, text))
+    return lines
+
+def run(channel_count):
+    channel._contexts.clear()
+    channels = ["#run%i_channel%i" % (channel_count, i) for i in range(channel_count)]
+    sent = []
+    channel.ChannelContext.send = lambda self, message: sent.append((self.name, message))
+
+    # Every tenth viewer already has a hero in every channel
+    for name in channels:
+        ctx = channel.get_channel(name)
+        for i in range(0, 5000, 10):
+            ctx.add_character("viewer%i" % (i), Character("hero%i" % (i), "viking", "male"))
+
+    lines = make_lines(channels, LINES)
+
+    start = time.perf_counter()
+    for line in lines:
+        message = parse_message(line)
+        for handler in HANDLERS:
+            handler(message)
+    elapsed = time.perf_counter() - start
+    return elapsed, len(sent)
+
+def main():
+    Database().initialize()
+    CharacterStore().initialize(Database(), cache_size=100000)
+    print("%10s %12s %12s %10s" % ("channels", "lines/s", "us/line", "replies"))
+    for channel_count in (1, 10, 100, 500, 1000):
+        elapsed, replies = run(channel_count)
+        print("%10i %12.0f %12.2f %10i" % (channel_count, LINES / elapsed, elapsed / LINES * 1e6, replies))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Cost of logging chat on the handler path: the old print of every line
+(to /dev/null, a terminal is slower still) against queueing it for the
+ChatLogger, then how long the background writer takes and how big the
+files get. Finally the log is replayed through the command handlers.
+
+Run from the repository root: python3 -m benchmarks.chatlog
+"""
+
+import contextlib
+import os
+import tempfile
+import time
+import channel
+from benchmarks.channels import make_lines
+from chatlog import ChatLogger, log_files, replay
+from classes import ClassRegistry
+from database import Database
+from handlers import router
+from irc_message import parse_message
+from store import CharacterStore
+
+LINES = 500000
+
+def main():
+    messages = [parse_message(line) for line in make_lines(["#one", "#two", "#three"], LINES)]
+
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        start = time.perf_counter()
+        for msg in messages:
+            if msg.command == "PRIVMSG":
+                print(msg.nick + ': ' + msg.text)
+        printed = time.perf_counter() - start
+
+    with tempfile.TemporaryDirectory() as directory:
+        logger = ChatLogger()
+        # The writer sleeps until stop, so the first number is only what
+        # the handler pays and the second only the writer's work
+        logger.start(directory, max_queue=LINES, batch_size=LINES + 1, flush_interval=3600, rotate_bytes=16 * 1024 * 1024)
+        start = time.perf_counter()
+        for msg in messages:
+            logger.log(msg)
+        queued = time.perf_counter() - start
+        start = time.perf_counter()
+        logger.stop()
+        written = time.perf_counter() - start
+
+        files = log_files(directory)
+        size = sum(os.path.getsize(f) for f in files)
+        print("%-28s %10.3f us/line" % ("print to /dev/null", printed / LINES * 1e6))
+        print("%-28s %10.3f us/line" % ("ChatLogger.log", queued / LINES * 1e6))
+        print("%-28s %10.3f us/line (%i files, %.1f MB, %.1f bytes/line)" % ("background write", written / LINES * 1e6, len(files), size / 1e6, size / LINES))
+        print("%-28s %10i" % ("dropped", logger.stats()["dropped"]))
+
+        ClassRegistry().load()
+        Database().initialize()
+        CharacterStore().initialize(Database())
+        channel.ChannelContext.send = lambda self, message: None
+        start = time.perf_counter()
+        count = replay(files, [router])
+        elapsed = time.perf_counter() - start
+        print("%-28s %10.0f lines/s (%i lines)" % ("replay through commands", count / elapsed, count))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Raid-scale fights: the pure Python and the NumPy path of combat.resolve
+on the same seeded fight. Checks both end in exactly the same state and
+reports the time per tick of each.
+
+Run from the repository root: python3 -m benchmarks.combat
+"""
+
+import copy
+import random
+import time
+import combat
+from character import Character
+from combat import Combatants, resolve, ACTION_ATTACK, ACTION_HEAL, ACTION_RUN
+from game import _class_tables
+
+CLASSES = [("viking", "male"), ("priest", "female"), ("druid", "f"), ("samurai", "m"), ("amazon", "female")]
+TICKS = 10
+SEED = 1234
+
+def make_fight(participants):
+    rng = random.Random(SEED)
+    c = Combatants()
+    for i in range(participants):
+        class_name, gender = CLASSES[i % len(CLASSES)]
+        char = Character("hero%i" % (i), class_name, gender)
+        char.level = rng.randint(1, 30)
+        c.add("viewer%i" % (i), char)
+
+    ticks = []
+    for _ in range(TICKS):
+        intents = {}
+        for row in range(participants):
+            roll = rng.random()
+            if roll < 0.8:
+                intents[row] = ACTION_ATTACK
+            elif roll < 0.995:
+                intents[row] = ACTION_HEAL
+            else:
+                intents[row] = ACTION_RUN
+        ticks.append(intents)
+    return c, ticks
+
+def run(c, ticks, use_numpy):
+    damage_table, heal_table = _class_tables()
+    boss_hp = 10 ** 12
+    results = []
+    elapsed = 0.0
+    for tick, intents in enumerate(ticks, 1):
+        start = time.perf_counter()
+        boss_hp, result = resolve(c, intents, damage_table, heal_table, boss_hp, SEED, tick, use_numpy)
+        elapsed += time.perf_counter() - start
+        results.append(result.as_tuple())
+    return elapsed / len(ticks), results, boss_hp
+
+def main():
+    numpy = combat._numpy()
+    if numpy is None:
+        print("NumPy is not installed, only the pure Python path is measured")
+
+    print("%12s %14s %14s %8s" % ("participants", "python ms", "numpy ms", "speedup"))
+    for participants in (1000, 10000, 100000):
+        c, ticks = make_fight(participants)
+        python_state = copy.deepcopy(c)
+        python_ms, python_results, python_boss = run(python_state, ticks, False)
+
+        if numpy is None:
+            print("%12i %14.2f %14s %8s" % (participants, python_ms * 1000, "-", "-"))
+            continue
+
+        numpy_state = copy.deepcopy(c)
+        numpy_ms, numpy_results, numpy_boss = run(numpy_state, ticks, True)
+
+        # Same seed, same fight
+        assert python_results == numpy_results
+        assert python_boss == numpy_boss
+        assert python_state.hp == numpy_state.hp and python_state.alive == numpy_state.alive
+
+        print("%12i %14.2f %14.2f %7.2fx" % (participants, python_ms * 1000, numpy_ms * 1000, python_ms / numpy_ms))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Cost of command dispatch on busy chat where almost no line is a command:
+every handler running preparse_msg on every line (the old broadcast)
+against one CommandRouter lookup.
+
+Run from the repository root: python3 -m benchmarks.commands
+"""
+
+import random
+import time
+from commands import CommandRouter
+from irc_message import parse_message
+
+LINES = 200000
+
+def make_messages(command_ratio, seed=1):
+    rng = random.Random(seed)
+    messages = []
+    for i in range(LINES):
+        user = "viewer%i" % (rng.randrange(5000))
+        if rng.random() < command_ratio:
+            text = rng.choice(["!char", "!do run", "!help char", "!char kill"])
+        else:
+            text = "KEKW that was close %i" % (i)
+        messages.append(parse_message(":%s!%s@%s.tmi.twitch.tv PRIVMSG #channel :%s" % (user, user, user, text)))
+    return messages
+
+def preparse_msg(msg, cmd):
+    """
+    The per-handler check every command handler used to run
+    """
+
+    parts = msg.raw.split()
+    user = parts[0][1:].split("!")[0]
+    if parts[1] != "PRIVMSG" or parts[3] != ":" + cmd:
+        return None, user
+    return parts[4:], user
+
+def make_broadcast(counter):
+    handlers = []
+    for cmd in ("!help", "!char", "!do", "!game"):
+        def handler(msg, cmd=cmd):
+            parts, user = preparse_msg(msg, cmd)
+            if parts == None:
+                return
+            counter[0] += 1
+        handlers.append(handler)
+    return handlers
+
+def make_router(counter):
+    def command(msg, parts):
+        counter[0] += 1
+    router = CommandRouter("!")
+    router.register("help", command)
+    router.register("char", command)
+    router.register_subcommand("char", "create", command)
+    router.register_subcommand("char", "kill", command, aliases=["delete"])
+    router.register("do", command)
+    router.register("game", command)
+    return router
+
+def main():
+    print("%9s %14s %14s %8s" % ("commands", "broadcast l/s", "router l/s", "speedup"))
+    for ratio in (0.001, 0.01, 0.1):
+        messages = make_messages(ratio)
+
+        counter = [0]
+        handlers = make_broadcast(counter)
+        start = time.perf_counter()
+        for message in messages:
+            for handler in handlers:
+                handler(message)
+        broadcast = time.perf_counter() - start
+        expected = counter[0]
+
+        counter = [0]
+        router = make_router(counter)
+        start = time.perf_counter()
+        for message in messages:
+            router(message)
+        routed = time.perf_counter() - start
+        assert counter[0] == expected
+
+        print("%8.1f%% %14.0f %14.0f %7.2fx" % (ratio * 100, LINES / broadcast, LINES / routed, broadcast / routed))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Moving characters in and out of the database in bulk. Fills a database
+file one insert_data call per hero (a transaction each), then exports it
+to JSON lines and imports that into a fresh file with batched
+executemany, and checks both files hold the same rows.
+
+Run from the repository root: python3 -m benchmarks.dump [--heroes 100000]
+"""
+
+import argparse
+import os
+import sqlite3
+import tempfile
+import time
+from character import Character
+from database import Database
+from dump import export_characters, import_characters
+from serialization import encode_character
+
+CLASSES = [("viking", "male"), ("priest", "female"), ("druid", "f"), ("samurai", "m"), ("amazon", "female")]
+
+def main():
+    parser = argparse.ArgumentParser(description="Character export and import throughput")
+    parser.add_argument("--heroes", type=int, default=100000)
+    parser.add_argument("--singles", type=int, default=5000, help="heroes written with insert_data, to compare")
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    source = os.path.join(directory, "source.db")
+    target = os.path.join(directory, "target.db")
+    dump = os.path.join(directory, "characters.jsonl.gz")
+
+    heroes = []
+    for i in range(args.heroes):
+        class_name, gender = CLASSES[i % len(CLASSES)]
+        char = Character("hero%i" % (i), class_name, gender)
+        char.level = i % 60 + 1
+        char.xp = i
+        heroes.append(("#channel%i" % (i % 100), "viewer%i" % (i), char))
+
+    # Database is a singleton, the source is filled through it and the
+    # target through a second connection below
+    Database().initialize(source)
+    start = time.perf_counter()
+    for channel, user, char in heroes[:args.singles]:
+        Database().insert_data(channel, user, encode_character(char), (char.level, char.class_name, char.hp, char.xp))
+    single = (time.perf_counter() - start) / args.singles
+    Database().write_many([(channel, user, encode_character(char), char.level, char.class_name, char.hp, char.xp)
+        for channel, user, char in heroes[args.singles:]], [])
+
+    start = time.perf_counter()
+    exported = export_characters(Database(), dump)
+    export_seconds = time.perf_counter() - start
+
+    Database().db.close()
+    Database().db = None
+    Database().initialize(target)
+    start = time.perf_counter()
+    imported = import_characters(Database(), dump)
+    import_seconds = time.perf_counter() - start
+    Database().db.close()
+    Database().db = None
+
+    query = "SELECT channel, username, data, level, class, hp, xp FROM players ORDER BY channel, username"
+    same = sqlite3.connect(source).execute(query).fetchall() == sqlite3.connect(target).execute(query).fetchall()
+
+    print("insert_data:  %10.0f heroes/s (one transaction each)" % (1 / single))
+    print("export:       %10.0f heroes/s, %i heroes, %i bytes gzipped" % (exported / export_seconds, exported, os.path.getsize(dump)))
+    print("import:       %10.0f heroes/s, %i heroes" % (imported / import_seconds, imported))
+    print("round trip:   %s" % ("identical" if same else "DIFFERENT"))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Cost of resolving one game tick as the number of participants grows.
+Every hero has announced an action (mostly attacks, some heals, a few
+flee) before the tick is resolved in one batch.
+
+Run from the repository root: python3 -m benchmarks.game
+"""
+
+import random
+import time
+from character import Character
+from game import Game
+
+CLASSES = [("viking", "male"), ("priest", "female"), ("druid", "f"), ("samurai", "m"), ("amazon", "female")]
+TICKS = 5
+
+def make_game(participants, seed=1):
+    rng = random.Random(seed)
+    game = Game(seed=seed)
+    # Big enough that the boss survives all measured ticks
+    game.start_new(boss_hp=participants * 100, schedule=False)
+    heroes = []
+    for i in range(participants):
+        class_name, gender = CLASSES[i % len(CLASSES)]
+        char = Character("hero%i" % (i), class_name, gender)
+        char.level = rng.randint(1, 30)
+        heroes.append(("viewer%i" % (i), char))
+    return game, heroes, rng
+
+def submit_all(game, heroes, rng):
+    for user, char in heroes:
+        roll = rng.random()
+        if roll < 0.8:
+            action = "attack"
+        elif roll < 0.99:
+            action = "heal" if "heal" in char.Class.actions else "attack"
+        else:
+            action = "run"
+        try:
+            game.submit(user, char, action)
+        except RuntimeError:
+            pass
+
+def main():
+    print("%12s %14s %14s %14s" % ("participants", "submit ms", "resolve ms", "us/hero"))
+    for participants in (1000, 10000, 100000):
+        game, heroes, rng = make_game(participants)
+        submit_time = 0.0
+        resolve_time = 0.0
+        for _ in range(TICKS):
+            start = time.perf_counter()
+            submit_all(game, heroes, rng)
+            submit_time += time.perf_counter() - start
+
+            start = time.perf_counter()
+            game.resolve_tick()
+            resolve_time += time.perf_counter() - start
+
+        submit_ms = submit_time / TICKS * 1000
+        resolve_ms = resolve_time / TICKS * 1000
+        print("%12i %14.2f %14.2f %14.3f" % (participants, submit_ms, resolve_ms, resolve_ms * 1000 / participants))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+Character writes with the journal against a commit per statement. Handler
+threads change characters as fast as they can, with
+
+  commit per change    Database.insert_data for every change (its own
+                       transaction), synchronous=FULL so each one is on
+                       disk like a journaled change, and as configured
+                       (WAL, synchronous=NORMAL, not on disk at once)
+  journal              CharacterStore with a Journal, one fsync per group
+                       of changes, snapshots as usual
+
+and then the time it takes to recover from a crash: a bot writes changes,
+takes a snapshot half way and dies without closing anything, a new one
+replays the journal tail on startup.
+
+Every run is its own process with a fresh database file.
+
+Run from the repository root: python3 -m benchmarks.journal [--changes 20000] [--threads 4]
+"""
+
+import argparse
+import multiprocessing
+import os
+import tempfile
+import time
+from threading import Thread
+
+def _setup(directory):
+    from classes import ClassRegistry
+    from database import Database
+    ClassRegistry().load()
+    Database().initialize(os.path.join(directory, "characters.db"))
+
+def _hammer(changes, threads, change):
+    """
+    Runs change(thread, i) changes times spread over threads, returns the seconds it took
+    """
+
+    def run(thread):
+        for i in range(thread, changes, threads):
+            change(thread, i)
+
+    workers = [Thread(target=run, args=(thread,)) for thread in range(threads)]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return time.perf_counter() - start
+
+def commit_per_change(directory, changes, threads, synchronous, pipe):
+    _setup(directory)
+    from character import Character
+    from database import Database
+    from serialization import encode_character
+
+    Database().db.execute("PRAGMA synchronous=%s" % (synchronous))
+    char = Character("hero", "viking", "male")
+
+    def change(thread, i):
+        char.level = i % 100
+        Database().insert_data("#bench", "user%i" % (i % 1000), encode_character(char),
+            (char.level, char.class_name, char.hp, char.xp))
+
+    pipe.send(_hammer(changes, threads, change))
+
+def journaled(directory, changes, threads, sync, pipe):
+    _setup(directory)
+    from character import Character
+    from database import Database
+    from journal import Journal
+    from store import CharacterStore
+
+    Journal().start(os.path.join(directory, "journal"), sync=sync)
+    CharacterStore().initialize(Database(), flush_interval=60, flush_threshold=10 ** 9, journal=Journal())
+    chars = [Character("hero%i" % (i), "viking", "male") for i in range(threads)]
+
+    def change(thread, i):
+        char = chars[thread]
+        char.level = i % 100
+        CharacterStore().put("#bench", "user%i" % (i % 1000), char)
+
+    seconds = _hammer(changes, threads, change)
+    syncs = Journal().stats()["syncs"]
+    CharacterStore().close()
+    Journal().stop()
+    pipe.send((seconds, syncs))
+
+def crash(directory, changes, pipe):
+    """
+    Writes changes, snapshots half way and dies without closing anything
+    """
+
+    _setup(directory)
+    from character import Character
+    from database import Database
+    from journal import Journal
+    from store import CharacterStore
+
+    Journal().start(os.path.join(directory, "journal"), sync=False)
+    CharacterStore().initialize(Database(), flush_interval=3600, flush_threshold=10 ** 9, journal=Journal())
+    char = Character("hero", "viking", "male")
+    for i in range(changes):
+        char.level = 1 + i % 100
+        CharacterStore().put("#bench", "user%i" % (i % 10000), char)
+        if i == changes // 2:
+            CharacterStore().flush()
+    # The last changes have to have reached the file, not the disk
+    Journal().wait_synced(Journal().seq)
+    pipe.send(("user%i" % ((changes - 1) % 10000), char.level))
+    os._exit(1)
+
+def recover(directory, user, pipe):
+    start = time.perf_counter()
+    _setup(directory)
+    from database import Database
+    from journal import Journal
+    from store import CharacterStore
+
+    Journal().start(os.path.join(directory, "journal"))
+    CharacterStore().initialize(Database(), journal=Journal())
+    seconds = time.perf_counter() - start
+    char = CharacterStore().get("#bench", user)
+    CharacterStore().close()
+    Journal().stop()
+    pipe.send((seconds, char.level))
+
+def run(target, *args):
+    context = multiprocessing.get_context("spawn")
+    directory = tempfile.TemporaryDirectory()
+    pipe, child_pipe = context.Pipe()
+    process = context.Process(target=target, args=(directory.name,) + args + (child_pipe,))
+    process.start()
+    result = pipe.recv()
+    process.join()
+    return directory, result
+
+def main():
+    parser = argparse.ArgumentParser(description="Journaled character writes against a commit per statement")
+    parser.add_argument("--changes", type=int, default=20000)
+    parser.add_argument("--threads", type=int, default=4, help="handler threads changing characters")
+    parser.add_argument("--crash-changes", type=int, default=200000, help="changes written before the crash")
+    args = parser.parse_args()
+
+    print("%i changes from %i threads" % (args.changes, args.threads))
+    directory, seconds = run(commit_per_change, args.changes, args.threads, "FULL")
+    directory.cleanup()
+    print("commit per change, FULL     %9.0f changes/s, one fsync each" % (args.changes / seconds))
+    directory, seconds = run(commit_per_change, args.changes, args.threads, "NORMAL")
+    directory.cleanup()
+    print("commit per change, NORMAL   %9.0f changes/s, not on disk at once" % (args.changes / seconds))
+    directory, (seconds, syncs) = run(journaled, args.changes, args.threads, True)
+    directory.cleanup()
+    print("journal, fsync              %9.0f changes/s, %.1f changes per fsync" % (args.changes / seconds, args.changes / max(syncs, 1)))
+    directory, (seconds, syncs) = run(journaled, args.changes, args.threads, False)
+    directory.cleanup()
+    print("journal, no fsync           %9.0f changes/s" % (args.changes / seconds))
+
+    directory, (user, expected) = run(crash, args.crash_changes)
+    context = multiprocessing.get_context("spawn")
+    pipe, child_pipe = context.Pipe()
+    process = context.Process(target=recover, args=(directory.name, user, child_pipe))
+    process.start()
+    seconds, level = pipe.recv()
+    process.join()
+    directory.cleanup()
+    print("recovery after %i changes (%i after the snapshot): %.0f ms, last change %s" % (
+        args.crash_changes, args.crash_changes - args.crash_changes // 2 - 1, seconds * 1e3,
+        "kept" if level == expected else "LOST"))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+!rank for one channel with many heroes, three ways: decoding every
+character record and sorting (what the blob-only table allowed), a
+COUNT over the indexed stat columns, and the in-memory skip list of
+leaderboard.py. Also reports what keeping the skip list up to date
+costs per character change.
+
+Run from the repository root: python3 -m benchmarks.leaderboard [--heroes 100000]
+"""
+
+import argparse
+import random
+import time
+from classes import ClassRegistry
+from character import Character
+from database import Database
+from leaderboard import Leaderboard
+from serialization import decode_character, encode_character
+from store import CharacterStore
+
+CHANNEL = "#bench"
+
+def main():
+    parser = argparse.ArgumentParser(description="Rank lookups against the number of heroes")
+    parser.add_argument("--heroes", type=int, default=100000)
+    parser.add_argument("--lookups", type=int, default=10000)
+    args = parser.parse_args()
+
+    ClassRegistry().load()
+    Database().initialize()
+    CharacterStore().initialize(Database(), cache_size=args.heroes)
+    rng = random.Random(1)
+    rows = []
+    for i in range(args.heroes):
+        char = Character("hero%i" % (i), "viking", "male")
+        char.level = rng.randrange(1, 60)
+        char.xp = rng.randrange(100000)
+        rows.append((CHANNEL, "user%i" % (i), encode_character(char), char.level, char.class_name, char.hp, char.xp))
+    Database().write_many(rows, [])
+    users = ["user%i" % (rng.randrange(args.heroes)) for _ in range(args.lookups)]
+
+    start = time.perf_counter()
+    for user in users[:3]:
+        chars = [(decode_character(bytes(data)), name) for name, data in
+            Database()._send_query("SELECT username, data FROM players WHERE channel='%s'" % (CHANNEL))]
+        order = sorted(chars, key=lambda pair: (-pair[0].level, -pair[0].xp, pair[1]))
+        [name for _, name in order].index(user)
+    decoding = (time.perf_counter() - start) / 3
+
+    start = time.perf_counter()
+    for user in users[:200]:
+        Database().lock.acquire()
+        try:
+            level, xp = Database().cursor.execute(
+                "SELECT level, xp FROM players WHERE channel=? AND username=?", (CHANNEL, user)).fetchone()
+            Database().cursor.execute(
+                "SELECT COUNT(*) FROM players WHERE channel=? AND (level > ? OR (level = ? AND xp > ?))",
+                (CHANNEL, level, level, xp)).fetchone()
+        finally:
+            Database().lock.release()
+    counting = (time.perf_counter() - start) / 200
+
+    board = Leaderboard(CHANNEL)
+    start = time.perf_counter()
+    board.top(1)
+    loading = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for user in users:
+        board.rank(user)
+    ranking = (time.perf_counter() - start) / len(users)
+
+    char = Character("mover", "viking", "male")
+    start = time.perf_counter()
+    for i in range(len(users)):
+        char.level = rng.randrange(1, 60)
+        board.update("mover", char)
+    updating = (time.perf_counter() - start) / len(users)
+    CharacterStore().close()
+
+    print("%i heroes" % (args.heroes))
+    print("decode and sort     %10.1f us per !rank" % (decoding * 1e6))
+    print("indexed SQL count   %10.1f us per !rank" % (counting * 1e6))
+    print("skip list           %10.1f us per !rank (loaded once in %.0f ms)" % (ranking * 1e6, loading * 1e3))
+    print("skip list update    %10.1f us per character change" % (updating * 1e6))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+End to end load test of the bot. A fake chat server on the loopback
+interface replays synthetic chat at a fixed rate to the bot, which runs
+in a child process with the handlers of main.py, an in-memory database
+and the chat log written to a temporary directory. Reports command latency from the server sending
+a command to it getting the reply, messages per second and the CPU time
+the bot process used per message.
+
+Every viewer has a hero named after them in every channel, so each
+command of the mix gets a reply naming the viewer. Rate limiting of the
+bot's replies is turned off, it would measure Twitch's limit instead.
+
+Run from the repository root: python3 -m benchmarks.load [--rate 2000] [--seconds 10]
+With --cert and --key the server speaks TLS and the bot trusts that certificate
+(which has to be issued for localhost).
+"""
+
+import argparse
+import multiprocessing
+import ssl
+import tempfile
+import time
+
+BOT_NAME = "benchbot"
+
+def run_bot(port, channels, users, workers, ca_file, pipe, database=""):
+    """
+    The bot side, runs in its own process so its CPU time can be told
+    apart from the server's. Several of them can share a database file
+    """
+
+    from classes import ClassRegistry
+    from database import Database
+    from store import CharacterStore
+    from channel import get_channel
+    from character import Character
+    from irc_client import IrcClient
+    from handlers import HANDLERS
+    from chatlog import ChatLogger
+    from fake_irc import USER_NAME
+
+    ClassRegistry().load()
+    Database().initialize(database)
+    CharacterStore().initialize(Database(), cache_size=len(channels) * users + 1000)
+    for channel in channels:
+        ctx = get_channel(channel)
+        for i in range(users):
+            ctx.add_character(USER_NAME % (i), Character(USER_NAME % (i), "viking", "male"))
+
+    client = IrcClient()
+    client.set_rate_limit(10 ** 9, 1)
+    client.set_handler_workers(workers)
+    client.set_ca_file(ca_file)
+    for handler in HANDLERS:
+        client.register_message_handler(handler)
+    log_directory = tempfile.TemporaryDirectory()
+    ChatLogger().start(log_directory.name)
+    client.connect("localhost", port, BOT_NAME, "oauth:bench", channels, use_ssl=ca_file is not None)
+
+    pipe.send("ready")
+    cpu = time.process_time()
+    pipe.recv()
+    cpu = time.process_time() - cpu
+    stats = client.get_handler_stats()
+    client.disconnect()
+    ChatLogger().stop()
+    log_directory.cleanup()
+    CharacterStore().close()
+    pipe.send((cpu, stats))
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the bot against a fake chat server")
+    parser.add_argument("--rate", type=float, default=2000, help="chat lines per second")
+    parser.add_argument("--seconds", type=float, default=10, help="how long to send")
+    parser.add_argument("--channels", type=int, default=10)
+    parser.add_argument("--users", type=int, default=2000, help="viewers per channel")
+    parser.add_argument("--workers", type=int, default=4, help="handler threads of the bot")
+    parser.add_argument("--commands", type=float, default=0.06, help="share of lines that are commands")
+    parser.add_argument("--cert", help="certificate file, enables TLS")
+    parser.add_argument("--key", help="key file of the certificate")
+    args = parser.parse_args()
+
+    from fake_irc import FakeIrcServer, LoadGenerator
+
+    context = None
+    if args.cert:
+        context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+        context.load_cert_chain(args.cert, args.key)
+
+    server = FakeIrcServer(ssl_context=context, record=False)
+    server.start()
+
+    channels = ["#channel%i" % (i) for i in range(args.channels)]
+    # Same shares as the default mix, scaled to --commands
+    mix = { "!char": args.commands / 2, "!do attack": args.commands / 3, "!help me": args.commands / 6 }
+    load = LoadGenerator(server, channels, args.users, args.rate, mix, seed=1)
+
+    # spawn, the server thread is already running in this process
+    context = multiprocessing.get_context("spawn")
+    pipe, child_pipe = context.Pipe()
+    bot = context.Process(target=run_bot, args=(server.port, channels, args.users, args.workers, args.cert, child_pipe))
+    bot.start()
+    pipe.recv()
+    # Give the JOIN lines time to arrive
+    time.sleep(0.5)
+
+    load.start(args.seconds)
+    load.wait()
+    deadline = time.monotonic() + 10
+    while load.pending() and time.monotonic() < deadline:
+        time.sleep(0.05)
+
+    pipe.send("stop")
+    cpu, handler_stats = pipe.recv()
+    bot.join()
+    server.stop()
+
+    stats = load.stats()
+    print("lines %i in %.1f s, %.0f msgs/s, %i commands (%i answered, %i unanswered)" % (
+        stats["lines"], stats["seconds"], stats["lines"] / stats["seconds"], stats["commands"], stats["replies"], stats["unanswered"]))
+    print("command latency ms: p50 %.2f  p90 %.2f  p99 %.2f  max %.2f" % (stats["p50"], stats["p90"], stats["p99"], stats["max"]))
+    print("bot cpu %.2f s, %.1f us per message" % (cpu, cpu / max(stats["lines"], 1) * 1e6))
+    print("handler queue wait ms: p50 %.2f  p99 %.2f" % (handler_stats["p50"], handler_stats["p99"]))
+
+if __name__ == "__main__":
+    main()
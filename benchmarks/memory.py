@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+Heap used by 100k heroes. The flyweight layout (slotted Character, one
+shared HeroClass and Action set per class) against a replica of the
+previous layout, where every hero had its own class instance, actions
+dict and Action objects, all with a __dict__.
+
+Run from the repository root: python3 -m benchmarks.memory
+"""
+
+import gc
+import tracemalloc
+from character import Character
+
+HEROES = 100000
+CLASSES = [("viking", "male"), ("priest", "female"), ("druid", "f"), ("samurai", "m"), ("amazon", "female")]
+
+class OldAction:
+    def __init__(self, char, name, names):
+        self.char = char
+        self.name = name
+        self.names = names
+
+class OldHeroClass:
+    def __init__(self, char, name, gender, hp):
+        self.char = char
+        self.name = name
+        self.gender = gender
+        self.char.max_hp = hp
+        self.char.hp = self.char.max_hp
+        self.actions = { "run": OldAction(char, "run", "runs") }
+
+class OldCharacter:
+    def __init__(self, name, class_name, gender):
+        self.level = 1
+        self.max_hp = 10
+        self.hp = self.max_hp
+        self.name = name
+        self.Class = OldHeroClass(self, class_name, gender, 10)
+
+def measure(factory):
+    names = ["hero%i" % (i) for i in range(HEROES)]
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    heroes = []
+    for i in range(HEROES):
+        class_name, gender = CLASSES[i % len(CLASSES)]
+        heroes.append(factory(names[i], class_name, gender))
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return used
+
+def main():
+    old = measure(OldCharacter)
+    new = measure(Character)
+    print("%i heroes" % (HEROES))
+    print("%16s %10.1f MiB %8.0f bytes/hero" % ("previous layout", old / 2**20, old / HEROES))
+    print("%16s %10.1f MiB %8.0f bytes/hero" % ("flyweight", new / 2**20, new / HEROES))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""
+What the instrumentation costs on the message path: lines are parsed and
+run through the handlers (the chat log is not started) the way the handler
+pool does it, first with metrics off, then on. Replies are collected
+instead of sent.
+
+Run from the repository root: python3 -m benchmarks.metrics
+"""
+
+import time
+import channel
+import metrics
+from benchmarks.channels import make_lines
+from database import Database
+from store import CharacterStore
+from classes import ClassRegistry
+from handlers import HANDLERS
+from irc_client import IrcClient
+from irc_message import parse_message
+
+LINES = 200000
+
+def run(lines, handlers):
+    client = IrcClient()
+    start = time.perf_counter()
+    for line in lines:
+        if metrics.enabled:
+            metrics.LINES_PARSED.inc()
+        client._run_sync_handlers(handlers, parse_message(line))
+    return time.perf_counter() - start
+
+def main():
+    ClassRegistry().load()
+    Database().initialize()
+    CharacterStore().initialize(Database())
+    channel.ChannelContext.send = lambda self, message: None
+
+    lines = make_lines(["#one", "#two"], LINES)
+    run(lines, HANDLERS)
+
+    print("%10s %12s %12s" % ("metrics", "lines/s", "us/line"))
+    for state in ("off", "on", "off"):
+        metrics.enable() if state == "on" else metrics.disable()
+        elapsed = min(run(lines, HANDLERS) for _ in range(3))
+        print("%10s %12.0f %12.3f" % (state, LINES / elapsed, elapsed / LINES * 1e6))
+
+if __name__ == "__main__":
+    main()
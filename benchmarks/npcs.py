@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+NPC spawning and encounters. First the cost of one pick from a spawn
+table with the alias method of npcs.SpawnTable against random.choices,
+for the default table and for one with a thousand NPCs. Then thousands
+of channels each fighting encounters at once: every channel's game
+spawns an NPC from the default table and its heroes attack it until one
+side is down. Reports encounters and ticks per second and the memory
+a game holds on to and allocates per encounter.
+
+Run from the repository root: python3 -m benchmarks.npcs [--channels 5000] [--heroes 5]
+"""
+
+import argparse
+import json
+import random
+import sys
+import time
+import tracemalloc
+from character import Character
+from game import Game
+from npcs import DEFAULT_TABLE, NPCS_FILE, Npc, NpcRegistry, NpcTemplate, SpawnTable
+
+PICKS = 200000
+
+def measure_picks(table, weights):
+    rng = random.Random(1)
+    templates = table.templates
+    cumulative = []
+    total = 0.0
+    for weight in weights:
+        total += weight
+        cumulative.append(total)
+
+    start = time.perf_counter()
+    for _ in range(PICKS):
+        table.pick(rng.getrandbits(53))
+    alias = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(PICKS):
+        rng.choices(templates, weights)
+    choices = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(PICKS):
+        rng.choices(templates, cum_weights=cumulative)
+    cumulated = time.perf_counter() - start
+    return alias, choices, cumulated
+
+def run_encounters(games, heroes):
+    """
+    Fights one encounter in every game, returns the number of ticks
+    """
+
+    ticks = 0
+    for game, party in zip(games, heroes):
+        game.start_new(schedule=False)
+        while game.running:
+            for user, char in party:
+                if char.hp > 0:
+                    try:
+                        game.submit(user, char, "attack")
+                    except RuntimeError:
+                        pass
+            if game.resolve_tick() is None:
+                game.stop()
+            ticks += 1
+    return ticks
+
+def main():
+    parser = argparse.ArgumentParser(description="NPC spawn and encounter throughput")
+    parser.add_argument("--channels", type=int, default=5000)
+    parser.add_argument("--heroes", type=int, default=5, help="heroes fighting in every channel")
+    parser.add_argument("--rounds", type=int, default=3, help="encounters per channel")
+    args = parser.parse_args()
+
+    registry = NpcRegistry()
+    with open(NPCS_FILE, encoding="utf-8") as f:
+        default = [(registry.get(key), float(weight)) for key, weight in json.load(f)["spawn_tables"][DEFAULT_TABLE].items()]
+    big = [(NpcTemplate("npc%i" % (i), { "id": i, "hp": 100 }), 1.0 + i % 17) for i in range(1000)]
+    print("%22s %12s %14s %18s" % ("spawn table", "alias us", "choices us", "cum_weights us"))
+    for name, entries in (("default (%i NPCs)" % (len(default)), default), ("1000 NPCs", big)):
+        alias, choices, cumulated = measure_picks(SpawnTable(name, entries), [weight for _, weight in entries])
+        print("%22s %12.3f %14.3f %18.3f" % (name, alias / PICKS * 1e6, choices / PICKS * 1e6, cumulated / PICKS * 1e6))
+
+    games = [Game(seed=channel) for channel in range(args.channels)]
+    heroes = []
+    for channel in range(args.channels):
+        party = []
+        for i in range(args.heroes):
+            char = Character("hero%i" % (i), "viking", "male")
+            char.level = 20
+            party.append(("viewer%i" % (i), char))
+        heroes.append(party)
+
+    # The first round warms up caches and interned strings
+    run_encounters(games, heroes)
+    for party in heroes:
+        for _, char in party:
+            char.hp = char.max_hp
+
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    start = time.perf_counter()
+    ticks = 0
+    for _ in range(args.rounds):
+        ticks += run_encounters(games, heroes)
+        for party in heroes:
+            for _, char in party:
+                char.hp = char.max_hp
+    seconds = time.perf_counter() - start
+    after, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    encounters = args.channels * args.rounds
+    print("%i channels, %i heroes each: %.0f encounters/s, %.0f ticks/s" % (
+        args.channels, args.heroes, encounters / seconds, ticks / seconds))
+    print("memory kept per channel %.0f bytes, peak above start %.0f bytes per channel (tracemalloc slows the run)" % (
+        (after - before) / args.channels, (peak - before) / args.channels))
+    print("an NPC in a fight: %i bytes, its template is shared" % (sys.getsizeof(Npc())))
+
+if __name__ == "__main__":
+    main()
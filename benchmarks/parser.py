@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Receive path micro-benchmarks: the old str buffer framing with repeated
+split() calls against LineFramer + parse_message on the same byte stream.
+
+Run from the repository root: python3 -m benchmarks.parser
+"""
+
+import time
+from irc_message import LineFramer, parse_message
+
+def make_stream(count, tags):
+    """
+    Builds a burst of chat lines as it would come off the socket
+    """
+
+    prefix = "@badge-info=;badges=subscriber/12;color=#FF0000;display-name=Viewer;emotes=;mod=0 " if tags else ""
+    lines = []
+    for i in range(count):
+        user = "viewer%i" % (i % 977)
+        lines.append("%s:%s!%s@%s.tmi.twitch.tv PRIVMSG #channel :hype hype ünïcödé %i\r\n" % (prefix, user, user, user, i))
+    return "".join(lines).encode("utf-8")
+
+def chunks(stream, size):
+    return [stream[i:i + size] for i in range(0, len(stream), size)]
+
+def old_path(pieces, user):
+    """
+    The previous _message_loop/_process_message: decode every 1024 byte read,
+    grow a str with +=, slice off each line and split() it again per check
+    """
+
+    handled = 0
+    buffer = ""
+    for piece in pieces:
+        buffer += piece.decode("utf-8", errors="replace")
+        while True:
+            message_end = buffer.find('\r\n')
+            if message_end == -1:
+                break
+            message = buffer[:message_end]
+            buffer = buffer[message_end + 2:]
+            if message[:4] == "PING": continue
+            if message.split()[0] == ":tmi.twitch.tv": continue
+            if message.split()[0] == ":" + user + ".tmi.twitch.tv": continue
+            if message.split("!")[0] == ":" + user: continue
+            # What each of the four command handlers did afterwards in preparse_msg
+            for _ in range(4):
+                parts = message.split()
+                handled += parts[1] == "PRIVMSG"
+    return handled
+
+def new_path(pieces, user):
+    """
+    LineFramer filled in place, one parse_message per line
+    """
+
+    handled = 0
+    framer = LineFramer()
+    for piece in pieces:
+        view = framer.get_buffer(len(piece))
+        view[:len(piece)] = piece
+        for line in framer.buffer_updated(len(piece)):
+            message = parse_message(line)
+            if message.command == "PING": continue
+            if message.prefix == "tmi.twitch.tv": continue
+            if message.prefix == user + ".tmi.twitch.tv": continue
+            if message.nick == user: continue
+            # Handlers share the parsed message, the text is split once
+            if message.command == "PRIVMSG":
+                handled += len(message.text.split()) > 0
+    return handled
+
+def measure(function, pieces, repeat=3):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(pieces, "bot")
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+def main():
+    print("%8s %6s %12s %12s %8s" % ("lines", "tags", "old lines/s", "new lines/s", "speedup"))
+    for count in (1000, 20000, 100000):
+        for tags in (False, True):
+            stream = make_stream(count, tags)
+            # The old loop read 1024 bytes at a time, the framer takes what the transport has
+            old = measure(old_path, chunks(stream, 1024))
+            new = measure(new_path, chunks(stream, 65536))
+            print("%8i %6s %12.0f %12.0f %7.2fx" % (count, tags, count / old, count / new, old / new))
+
+    # A single burst that arrives in one read shows the quadratic str slicing
+    stream = make_stream(20000, True)
+    old = measure(old_path, [stream], repeat=1)
+    new = measure(new_path, [stream], repeat=1)
+    print("one %i byte burst: old %.3fs, new %.3fs" % (len(stream), old, new))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+A raid against the inbound pipeline. A fake chat server floods the bot
+with chat far faster than its handlers can keep up (every message costs
+the handler a millisecond, like a slow database would) and pings it
+throughout. Run once with the default queue limits and once with limits
+so high nothing is ever shed or paused, which is how the bot behaved
+before the pipeline was bounded.
+
+Reports what happened to commands (all of them should be answered),
+how much chat was shed, how long PINGs took to be answered, the largest
+inbound queue and the bot's peak memory.
+
+Run from the repository root: python3 -m benchmarks.pipeline [--rate 20000] [--seconds 3]
+"""
+
+import argparse
+import multiprocessing
+import resource
+import time
+
+BOT_NAME = "benchbot"
+
+def run_bot(port, channels, queue, handler_queue, handler_seconds, pipe):
+    from irc_client import IrcClient
+
+    client = IrcClient()
+    client.set_rate_limit(10 ** 9, 1)
+    client.set_handler_workers(1)
+    client.set_inbound_limits(queue, handler_queue)
+
+    def slow_handler(message):
+        if message.command != "PRIVMSG":
+            return
+        if message.text.startswith("!"):
+            client.send_message(message.nick + " ok", message.channel)
+        time.sleep(handler_seconds)
+
+    client.register_message_handler(slow_handler)
+    client.connect("localhost", port, BOT_NAME, "oauth:bench", channels, use_ssl=False)
+    pipe.send("ready")
+    pipe.recv()
+    stats = client.get_pipeline_stats()
+    client.disconnect()
+    # kilobytes on Linux
+    pipe.send((stats, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss))
+
+def run(args, queue, handler_queue):
+    from fake_irc import FakeIrcServer, LoadGenerator
+
+    server = FakeIrcServer(record=False)
+    server.start()
+    channels = ["#channel%i" % (i) for i in range(10)]
+    load = LoadGenerator(server, channels, 5000, args.rate, { "!ping": args.commands }, seed=1)
+
+    pings = []
+    on_line = None
+    def watch(line):
+        if line.startswith("PONG") and pings and pings[-1][1] is None:
+            pings[-1][1] = time.monotonic()
+        on_line(line)
+
+    context = multiprocessing.get_context("spawn")
+    pipe, child_pipe = context.Pipe()
+    bot = context.Process(target=run_bot, args=(server.port, channels, queue, handler_queue, args.handler_ms / 1000, child_pipe))
+    bot.start()
+    pipe.recv()
+    time.sleep(0.5)
+
+    load.start(args.seconds)
+    on_line = server.on_line
+    server.on_line = watch
+    deadline = time.monotonic() + args.seconds
+    while time.monotonic() < deadline:
+        if not pings or pings[-1][1] is not None:
+            pings.append([time.monotonic(), None])
+            server.send_ping()
+        time.sleep(0.1)
+    load.wait()
+    # Until every command is answered or nothing happens for a while
+    answered = -1
+    while load.pending() and answered != len(load.latencies):
+        answered = len(load.latencies)
+        time.sleep(args.settle)
+
+    pipe.send("stop")
+    stats, rss = pipe.recv()
+    bot.join()
+    server.stop()
+
+    result = load.stats()
+    waits = sorted((pong - sent) * 1000 for sent, pong in pings if pong is not None)
+    print("  commands %i, answered %i, unanswered %i, latency ms p50 %.0f p99 %.0f" % (
+        result["commands"], result["replies"], result["unanswered"], result["p50"], result["p99"]))
+    print("  chat lines %i, shed %i, reading paused %i times, handler queue full %i times" % (
+        result["lines"], stats["queue"]["shed"], stats["recv"]["pauses"], stats["dispatch"]["held_back"]))
+    print("  pings %i answered of %i, ms p50 %.0f max %.0f" % (
+        len(waits), len(pings), waits[len(waits) // 2] if waits else 0.0, waits[-1] if waits else 0.0))
+    print("  inbound queue max %i lines, handler tasks pending at the end %i, bot peak rss %.0f MB" % (
+        stats["queue"]["max_depth"], stats["handlers"]["pending"], rss / 1024))
+
+def main():
+    parser = argparse.ArgumentParser(description="Overload the inbound pipeline with a raid")
+    parser.add_argument("--rate", type=float, default=20000, help="chat lines per second")
+    parser.add_argument("--seconds", type=float, default=3)
+    parser.add_argument("--commands", type=float, default=0.01, help="share of lines that are commands")
+    parser.add_argument("--handler-ms", type=float, default=1.0, help="time every message costs the handler")
+    parser.add_argument("--settle", type=float, default=2.0, help="seconds without a reply before giving up on the rest")
+    args = parser.parse_args()
+
+    print("bounded (inbound queue 10000, handler queue 1000):")
+    run(args, 10000, 1000)
+    print("unbounded:")
+    run(args, 10 ** 9, 10 ** 9)
+
+if __name__ == "__main__":
+    main()
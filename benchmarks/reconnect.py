@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Runs IrcClient against a fake chat server that drops the connection at
+random and once asks for a RECONNECT. Checks that the client logs in and
+rejoins every time, that handlers keep getting chat and reports how many
+queued messages made it through. Backoff delays are shortened so the
+run takes seconds.
+
+Run from the repository root: python3 -m benchmarks.reconnect
+"""
+
+import time
+from threading import Lock
+import irc_client
+from irc_client import IrcClient
+from fake_irc import FakeIrcServer
+
+MESSAGES = 2000
+CHANNELS = ["#one", "#two", "#three"]
+
+def wait_for(condition, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+def main():
+    irc_client._BACKOFF_BASE = 0.05
+    irc_client._BACKOFF_MAX = 0.5
+
+    server = FakeIrcServer(drop_chance=0.02, seed=7)
+    server.start()
+
+    heard = []
+    lock = Lock()
+    def counting_handler(msg):
+        lock.acquire()
+        try:
+            heard.append(msg.text)
+        finally:
+            lock.release()
+
+    client = IrcClient()
+    client.set_rate_limit(1000, 1)
+    client.register_message_handler(counting_handler)
+    client.connect(server.host, server.port, "bot", "oauth:fake", CHANNELS, use_ssl=False)
+
+    start = time.perf_counter()
+    for i in range(MESSAGES):
+        client.send_message("message %i" % (i), CHANNELS[i % len(CHANNELS)])
+        if i == MESSAGES // 2:
+            server.send_reconnect()
+        if i % 100 == 0:
+            server.send_chat(CHANNELS[0], "viewer", "hello %i" % (i))
+        time.sleep(0.002)
+
+    def queue_empty():
+        stats = client.get_outbound_stats()
+        return stats["control"] + stats["moderation"] + stats["normal"] == 0 and client.is_connected()
+    drained = wait_for(queue_empty)
+    elapsed = time.perf_counter() - start
+    # Let the last chat lines reach the handler
+    time.sleep(0.2)
+
+    sent = set()
+    for line in server.lines("PRIVMSG"):
+        for part in line.partition(" :")[2].split(" | "):
+            sent.add(part)
+    delivered = sum(1 for i in range(MESSAGES) if "message %i" % (i) in sent)
+    logins = len(server.lines("PASS"))
+    rejoined = all(len([l for l in server.lines("JOIN") if c in l]) >= logins for c in CHANNELS)
+
+    client.disconnect()
+    server.stop()
+
+    print("connections %i, drops by server %i, reconnects %i" % (server.connections, server.drops, client.get_reconnect_count()))
+    print("logins %i, rejoined every channel every time: %s" % (logins, rejoined))
+    print("queue drained: %s in %.2f s" % (drained, elapsed))
+    print("messages delivered %i of %i, lost in dropped connections %i" % (delivered, MESSAGES, MESSAGES - delivered))
+    # Chat sent while the client was away is gone, as on Twitch
+    print("chat lines seen by the handler %i of %i" % (len(heard), MESSAGES // 100))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""
+Character rows: the versioned record from serialization.py against the
+pickle blobs Database.insert_data used to write. Reports encode/decode
+time and bytes per row.
+
+Run from the repository root: python3 -m benchmarks.serialization
+"""
+
+import pickle
+import time
+from character import Character
+from serialization import FORMAT_VERSION, decode_character, encode_character
+
+ROWS = 50000
+CLASSES = [("viking", "male"), ("priest", "female"), ("druid", "f"), ("samurai", "m"), ("amazon", "female")]
+
+def make_characters():
+    chars = []
+    for i in range(ROWS):
+        class_name, gender = CLASSES[i % len(CLASSES)]
+        char = Character("hero%i" % (i), class_name, gender)
+        char.level = 1 + i % 50
+        chars.append(char)
+    return chars
+
+def measure(encode, decode, chars):
+    start = time.perf_counter()
+    rows = [encode(char) for char in chars]
+    encoded = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for row in rows:
+        decode(row)
+    decoded = time.perf_counter() - start
+
+    return encoded, decoded, sum(len(row) for row in rows) / len(rows)
+
+def main():
+    chars = make_characters()
+    results = [
+        ("pickle", measure(lambda char: pickle.dumps(char, protocol=pickle.HIGHEST_PROTOCOL), pickle.loads, chars)),
+        ("record v%i" % (FORMAT_VERSION), measure(encode_character, decode_character, chars)),
+    ]
+
+    print("%10s %14s %14s %12s" % ("format", "encode us/row", "decode us/row", "bytes/row"))
+    for name, (encoded, decoded, size) in results:
+        print("%10s %14.2f %14.2f %12.1f" % (name, encoded / ROWS * 1e6, decoded / ROWS * 1e6, size))
+
+if __name__ == "__main__":
+    main()
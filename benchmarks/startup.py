@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Startup time of the bot, from starting a new Python process running
+main.start_bot to the fake chat server receiving its JOIN, and to the
+reply to a '!help' sent right at that moment (everything the handlers
+need is loaded by then). Every run is a fresh process with its own
+database file and journal, the first run also pays for compiling the
+modules and is left out of the median.
+
+Exits with an error if the median time to JOIN is over --budget, so it
+can catch startup regressions.
+
+Run from the repository root: python3 -m benchmarks.startup [--runs 5] [--budget 200]
+With --cert and --key the server speaks TLS and the bot trusts that certificate
+(which has to be issued for localhost), as it would talk to Twitch.
+"""
+
+import argparse
+import ssl
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+BOT = """
+import sys
+import conf
+conf.HOST, conf.PORT, conf.NAME, conf.OAUTH = "localhost", int(sys.argv[1]), "benchbot", "oauth:bench"
+conf.DATABASE = sys.argv[2] + "/characters.db"
+conf.JOURNAL_DIR = sys.argv[2] + "/journal"
+conf.CHAT_LOG_DIR = sys.argv[2] + "/logs"
+conf.METRICS_PORT = 0
+import main
+from irc_client import IrcClient
+if sys.argv[3]:
+    IrcClient().set_ca_file(sys.argv[3])
+main.start_bot(["#bench"], use_ssl=bool(sys.argv[3]))
+sys.stdin.readline()
+main.stop_bot()
+"""
+
+def run_once(server, cert):
+    joined = threading.Event()
+    replied = threading.Event()
+    times = {}
+
+    def on_line(line):
+        if line.startswith("JOIN") and not joined.is_set():
+            times["join"] = time.perf_counter()
+            joined.set()
+            server.send_chat("#bench", "viewer", "!help")
+        elif line.startswith("PRIVMSG") and not replied.is_set():
+            times["reply"] = time.perf_counter()
+            replied.set()
+
+    server.on_line = on_line
+    directory = tempfile.TemporaryDirectory()
+    start = time.perf_counter()
+    bot = subprocess.Popen([sys.executable, "-c", BOT, str(server.port), directory.name, cert or ""],
+        stdin=subprocess.PIPE, stdout=subprocess.DEVNULL)
+    if not replied.wait(30):
+        bot.kill()
+        raise RuntimeError("The bot did not answer in time")
+    bot.communicate(b"\n")
+    directory.cleanup()
+    return times["join"] - start, times["reply"] - start
+
+def main():
+    parser = argparse.ArgumentParser(description="Time from starting the bot to joining and answering")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget", type=float, default=200, help="ms the median may take to JOIN")
+    parser.add_argument("--cert", help="certificate file, enables TLS")
+    parser.add_argument("--key", help="key file of the certificate")
+    args = parser.parse_args()
+
+    from fake_irc import FakeIrcServer
+
+    context = None
+    if args.cert:
+        context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+        context.load_cert_chain(args.cert, args.key)
+    server = FakeIrcServer(ssl_context=context, record=False)
+    server.start()
+
+    # Python itself, for comparison
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-c", "pass"])
+    interpreter = time.perf_counter() - start
+
+    results = [run_once(server, args.cert) for _ in range(args.runs + 1)]
+    server.stop()
+
+    first_join, first_reply = results[0]
+    join = statistics.median(result[0] for result in results[1:])
+    reply = statistics.median(result[1] for result in results[1:])
+    print("python alone         %7.1f ms" % (interpreter * 1e3))
+    print("first run            %7.1f ms to JOIN, %7.1f ms to the first reply" % (first_join * 1e3, first_reply * 1e3))
+    print("median of %2i runs    %7.1f ms to JOIN, %7.1f ms to the first reply" % (args.runs, join * 1e3, reply * 1e3))
+    if join * 1e3 > args.budget:
+        print("over the budget of %.0f ms to JOIN" % (args.budget))
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""
+Cost of the command throttle per line and how much of a flood it keeps
+away from the handlers. One run has a few hundred spammers hammering
+commands, the other a million different chatters to show that the
+number of tracked viewers stops at max_users.
+
+Run from the repository root: python3 -m benchmarks.throttle
+"""
+
+import random
+import time
+from irc_message import parse_message
+from throttle import CommandThrottle
+
+LINES = 300000
+
+def make_messages(users, command_share, seed=1):
+    rng = random.Random(seed)
+    commands = ["!char", "!do attack", "!help", "!game"]
+    messages = []
+    for i in range(LINES):
+        user = "viewer%i" % (rng.randrange(users))
+        text = rng.choice(commands) if rng.random() < command_share else "LUL %i" % (i)
+        messages.append(parse_message(":%s!%s@%s.tmi.twitch.tv PRIVMSG #chan :%s" % (user, user, user, text)))
+    return messages
+
+def run(name, messages, throttle):
+    # A fake clock running at 1000 lines per second
+    now = [0.0]
+    throttle._clock = lambda: now[0]
+    allow = throttle.allow
+    passed = 0
+    start = time.perf_counter()
+    for message in messages:
+        now[0] += 0.001
+        if allow(message):
+            passed += 1
+    elapsed = time.perf_counter() - start
+    stats = throttle.stats()
+    print("%-20s %10.3f us/line %8i of %i passed, %i limited, %i duplicates, %i viewers tracked" % (
+        name, elapsed / LINES * 1e6, passed, LINES, stats["limited"], stats["duplicates"], stats["users"]))
+
+def main():
+    run("300 spammers", make_messages(300, 0.9), CommandThrottle())
+    run("1M chatters", make_messages(1000000, 0.1), CommandThrottle(max_users=10000))
+
+if __name__ == "__main__":
+    main()
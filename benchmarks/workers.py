@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Messages per second of the bot against the number of worker processes.
+Like benchmarks.load, but the channels are split between 1, 2 and 4 bot
+processes with the consistent hashing of the supervisor, and all of them
+share one SQLite database file in WAL mode. Each run sends a fixed number
+of chat lines as fast as the server can and measures the time until the
+last command got its reply.
+
+More workers only help with as many cores to run them on, on a single
+core the numbers stay flat or get worse.
+
+Run from the repository root: python3 -m benchmarks.workers [--lines 100000] [--workers 1,2,4]
+"""
+
+import argparse
+import multiprocessing
+import os
+import tempfile
+import time
+from benchmarks.load import run_bot
+
+def run(workers, lines, channels, users, rate):
+    from fake_irc import FakeIrcServer, LoadGenerator
+    from sharding import HashRing
+
+    directory = tempfile.TemporaryDirectory()
+    database = os.path.join(directory.name, "characters.db")
+    server = FakeIrcServer(record=False)
+    server.start()
+    load = LoadGenerator(server, channels, users, rate, seed=1)
+
+    shards = HashRing(range(workers)).assign(channels)
+    context = multiprocessing.get_context("spawn")
+    bots = []
+    for index in range(workers):
+        pipe, child_pipe = context.Pipe()
+        bot = context.Process(target=run_bot, args=(server.port, shards[index], users, 2, None, child_pipe, database))
+        bot.start()
+        bots.append((bot, pipe))
+    for _, pipe in bots:
+        pipe.recv()
+    # Give the JOIN lines time to arrive
+    time.sleep(0.5)
+
+    start = time.monotonic()
+    load.start(lines / rate)
+    load.wait()
+    deadline = time.monotonic() + 30
+    while load.pending() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    # Until the last reply, not just the last line sent
+    seconds = time.monotonic() - start
+
+    cpu = 0.0
+    for _, pipe in bots:
+        pipe.send("stop")
+    for bot, pipe in bots:
+        cpu += pipe.recv()[0]
+        bot.join()
+    server.stop()
+    directory.cleanup()
+    return load.stats(), seconds, cpu
+
+def main():
+    parser = argparse.ArgumentParser(description="Messages per second against bot worker processes")
+    parser.add_argument("--lines", type=int, default=100000, help="chat lines per run")
+    parser.add_argument("--rate", type=float, default=200000, help="chat lines per second the server tries to send")
+    parser.add_argument("--channels", type=int, default=16)
+    parser.add_argument("--users", type=int, default=500, help="viewers per channel")
+    parser.add_argument("--workers", default="1,2,4", help="worker counts to run")
+    args = parser.parse_args()
+
+    channels = ["#channel%i" % (i) for i in range(args.channels)]
+    print("%i cpus, %i lines per run" % (os.cpu_count() or 1, args.lines))
+    for workers in [int(n) for n in args.workers.split(",")]:
+        stats, seconds, cpu = run(workers, args.lines, channels, args.users, args.rate)
+        print("%i workers: %.0f msgs/s, %i of %i commands answered, p99 %.1f ms, bot cpu %.1f us per message" % (
+            workers, stats["lines"] / seconds, stats["replies"], stats["commands"], stats["p99"],
+            cpu / max(stats["lines"], 1) * 1e6))
+
+if __name__ == "__main__":
+    main()
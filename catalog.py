@@ -0,0 +1,174 @@
+import json
+import os
+from operator import itemgetter
+from string import Formatter
+from threading import Lock
+from typing import Any, Dict, List
+
+# Every text the bot says in chat, by locale and message id
+MESSAGES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "messages.json")
+
+# Has to have every message, other locales fall back to it
+DEFAULT_LOCALE = "en"
+
+class Template:
+    """
+    One message of the catalog, checked and compiled when the catalog is
+    loaded. Messages without fields are rendered right then and the same
+    string is handed out every time. The others are turned from {name}
+    fields into a positional %s format with the names in order, filling
+    it takes the values out of the dict with one itemgetter call instead
+    of formatting by name
+    """
+
+    __slots__ = ("id", "text", "fields", "order", "rendered", "_compiled", "_values", "_single")
+
+    def __init__(self, id: str, text: str):
+        self.id = id
+        self.text = text
+        parts = []
+        order = []
+        try:
+            for literal, field, spec, conversion in Formatter().parse(text):
+                parts.append(literal.replace("%", "%%"))
+                if field is None:
+                    continue
+                if not field.isidentifier() or spec or conversion:
+                    raise RuntimeError("Message %s may only use plain named fields" % (id))
+                parts.append("%s")
+                order.append(field)
+        except ValueError as e:
+            raise RuntimeError("Message %s is broken: %s" % (id, e))
+
+        self.fields = frozenset(order)
+        self.order = tuple(order)
+        self._compiled = "".join(parts)
+        self.rendered = self._compiled % () if not order else None
+        # A single name gives the value itself, not a tuple of one
+        self._values = itemgetter(*order) if order else None
+        self._single = len(order) == 1
+
+    def render(self, values: Dict[str, Any]) -> str:
+        """
+        The text with the values filled in, raises KeyError for a missing one
+        """
+
+        if self.rendered is not None:
+            return self.rendered
+        if self._single:
+            return self._compiled % (self._values(values),)
+        return self._compiled % self._values(values)
+
+class ChatError(RuntimeError):
+    """
+    An error meant for the chat. It carries a message id and its values
+    instead of finished text, so each channel gets it in its own locale.
+    str() gives the default locale, for the console
+    """
+
+    def __init__(self, message_id: str, **values: Any):
+        self.message_id = message_id
+        self.values = values
+        super(ChatError, self).__init__(message_id)
+
+    def __str__(self):
+        return self.render(DEFAULT_LOCALE)
+
+    def render(self, locale: str) -> str:
+        return MessageCatalog().render(locale, self.message_id, **self.values)
+
+class MessageCatalog():
+    """
+    The messages file maps each locale to its messages, a message maps
+    an id to a text with {named} fields. A locale that lacks a message
+    uses the default locale's, lookups go to one merged table per locale.
+
+    reload() swaps all tables at once, nothing changes if the file is broken
+    """
+
+    _instance: Any = None
+
+    def __new__(self):
+        if self._instance == None:
+            self._instance = super(MessageCatalog, self).__new__(self)
+            self._filename: str = MESSAGES_FILE
+            self._lock = Lock()
+            self._tables: Dict[str, Dict[str, Template]] = {}
+            self._loaded = False
+
+        return self._instance
+
+    def load(self, filename: str = "") -> None:
+        """
+        Reads the messages file (the default one if no filename given)
+        """
+
+        self._lock.acquire()
+        try:
+            if filename != "":
+                self._filename = filename
+
+            try:
+                with open(self._filename, encoding="utf-8") as f:
+                    data = json.load(f)
+                default = { id: Template(id, text) for id, text in data[DEFAULT_LOCALE].items() }
+                tables = { DEFAULT_LOCALE: default }
+                for locale, messages in data.items():
+                    if locale == DEFAULT_LOCALE:
+                        continue
+                    table = dict(default)
+                    for id, text in messages.items():
+                        template = Template(id, text)
+                        # A field the code never fills in would fail in the middle of a chat
+                        if id not in default or not template.fields <= default[id].fields:
+                            raise RuntimeError("Message %s of %s does not match the %s one" % (id, locale, DEFAULT_LOCALE))
+                        table[id] = template
+                    tables[locale] = table
+            except (OSError, ValueError, KeyError, TypeError, AttributeError) as e:
+                raise RuntimeError("Could not load messages from %s: %s" % (self._filename, e))
+
+            self._tables = tables
+            self._loaded = True
+        finally:
+            self._lock.release()
+
+    def reload(self) -> None:
+        self.load()
+
+    def render(self, locale: str, message_id: str, **values: Any) -> str:
+        """
+        The text of a message in a locale with the values filled in
+        """
+
+        try:
+            template = self._tables[locale][message_id]
+        except KeyError:
+            template = self._find(locale, message_id)
+        return template.render(values)
+
+    def table(self, locale: str) -> Dict[str, Template]:
+        """
+        Every message of a locale by id, the default locale's for unknown
+        ones. Callers that render a lot keep the table and look messages
+        up in it directly, it is replaced rather than changed on reload
+        """
+
+        if not self._loaded:
+            self.load()
+        return self._tables.get(locale) or self._tables[DEFAULT_LOCALE]
+
+    def _find(self, locale: str, message_id: str) -> Template:
+        """
+        Looks up a message that is not in the locale's table, loading the
+        catalog first if needed. Unknown locales get the default one
+        """
+
+        template = self.table(locale).get(message_id)
+        if template is None:
+            raise RuntimeError("There is no message %s" % (message_id))
+        return template
+
+    def locales(self) -> List[str]:
+        if not self._loaded:
+            self.load()
+        return list(self._tables)
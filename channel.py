@@ -0,0 +1,195 @@
+from threading import Lock
+from typing import Any, Dict, List, Tuple
+from irc_client import IrcClient
+from catalog import ChatError, DEFAULT_LOCALE, MessageCatalog
+from game import Game
+from leaderboard import Leaderboard
+from store import CharacterStore
+
+class ChannelContext:
+    """
+    Everything the bot keeps for one joined channel: the characters of
+    its viewers (in the shared CharacterStore), their leaderboard and the
+    game running there. Characters must be changed through it so the
+    leaderboard sees every change
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.set_locale(_locales.get(name, DEFAULT_LOCALE))
+        self.leaderboard = Leaderboard(name)
+        self.game = Game(self.send, self.save_heroes, render=self.render)
+
+    def send(self, message: str) -> None:
+        """
+        Sends a message to this channel as the bot user
+        """
+
+        IrcClient().send_message(message, self.name)
+
+    def set_locale(self, locale: str) -> None:
+        """
+        Switches to a locale and keeps its table of the catalog, so a
+        reply is one dict lookup away from its template
+        """
+
+        self.locale = locale
+        self.messages = MessageCatalog().table(locale)
+
+    def render(self, message_id: str, **values: Any) -> str:
+        """
+        A message of the catalog in this channel's locale
+        """
+
+        try:
+            template = self.messages[message_id]
+        except KeyError:
+            raise RuntimeError("There is no message %s" % (message_id))
+        return template.render(values)
+
+    def say(self, message_id: str, **values: Any) -> None:
+        """
+        Sends a message of the catalog in this channel's locale
+        """
+
+        self.send(self.render(message_id, **values))
+
+    def say_error(self, user: str, error: RuntimeError) -> None:
+        """
+        Tells a user why their command failed
+        """
+
+        text = error.render(self.locale) if isinstance(error, ChatError) else str(error)
+        self.say("error", user=user, error=text)
+
+    def get_character(self, user: str) -> Any:
+        """
+        Returns the character of the user, or None if there hasn't been created one
+        """
+
+        return CharacterStore().get(self.name, user)
+
+    def add_character(self, user: str, char: Any) -> None:
+        """
+        Adds a character in the channel for that user
+        """
+
+        if CharacterStore().get(self.name, user) is not None:
+            raise ChatError("char.exists")
+        else:
+            CharacterStore().put(self.name, user, char)
+            self.leaderboard.update(user, char)
+
+    def save_character(self, user: str, char: Any) -> None:
+        """
+        Marks a changed character to be written back
+        """
+
+        CharacterStore().put(self.name, user, char)
+        self.leaderboard.update(user, char)
+
+    def save_heroes(self, heroes: List[Tuple[str, Any]]) -> None:
+        """
+        Writes back the (user, character) pairs of a game that ended, all
+        with one journal sync. Heroes killed or replaced since they joined
+        stay the way they are now
+        """
+
+        stored = CharacterStore().put_many(self.name, heroes, only_current=True)
+        # A kill during the sync is in the store already, the leaderboard
+        # is updated from there rather than with the heroes of the game
+        self.leaderboard.refresh([user for user, _ in stored])
+
+    def kill_character(self, user: str) -> None:
+        """
+        Deletes a character to make place for another
+        """
+
+        if CharacterStore().get(self.name, user) is not None:
+            # Or the game would bring it back when it ends
+            self.game.remove(user)
+            CharacterStore().delete(self.name, user)
+            self.leaderboard.update(user, None)
+        else:
+            raise ChatError("char.no_hero")
+
+_contexts: Dict[str, ChannelContext] = {}
+_contexts_lock = Lock()
+# Channels that don't speak the default locale
+_locales: Dict[str, str] = {}
+
+def get_channel(name: str) -> ChannelContext:
+    """
+    Returns the context of a channel, creating it on first use
+    """
+
+    context = _contexts.get(name)
+    if context is None:
+        _contexts_lock.acquire()
+        try:
+            context = _contexts.get(name)
+            if context is None:
+                context = ChannelContext(name)
+                _contexts[name] = context
+        finally:
+            _contexts_lock.release()
+    return context
+
+def drop_channel(name: str) -> None:
+    """
+    Forgets the context of a channel the bot has left, its game ends
+    like a stopped one so the heroes keep what they have
+    """
+
+    _contexts_lock.acquire()
+    try:
+        context = _contexts.pop(name, None)
+    finally:
+        _contexts_lock.release()
+
+    if context is not None:
+        try:
+            context.game.stop()
+        except ChatError:
+            # No game running
+            pass
+
+def get_channels() -> List[ChannelContext]:
+    """
+    Returns the contexts of all channels that have seen any traffic
+    """
+
+    return list(_contexts.values())
+
+def set_channel_locale(name: str, locale: str) -> None:
+    """
+    Picks the locale a channel's messages are sent in
+    """
+
+    if locale not in MessageCatalog().locales():
+        raise RuntimeError("There is no locale %s" % (locale))
+
+    _contexts_lock.acquire()
+    try:
+        _locales[name] = locale
+        context = _contexts.get(name)
+        if context is not None:
+            context.set_locale(locale)
+    finally:
+        _contexts_lock.release()
+
+def reload_messages() -> None:
+    """
+    Reads the messages file again and hands every channel the new table
+    of its locale. A channel whose locale is gone falls back to the
+    default one
+    """
+
+    catalog = MessageCatalog()
+    _contexts_lock.acquire()
+    try:
+        catalog.reload()
+        for context in _contexts.values():
+            context.set_locale(context.locale)
+    finally:
+        _contexts_lock.release()
@@ -1,39 +1,61 @@
+import random
 from util import first_char_upper
-from classes import Viking, Priest, Druid, Samurai, Amazon
+from classes import ClassRegistry
+from catalog import DEFAULT_LOCALE
 
 class Character:
     """
-    The Character class is what defines a specific user's hero (character)
+    The Character class is what defines a specific user's hero (character).
+    It only holds the hero's own state, everything about the class is
+    in the HeroClass shared by all heroes of that class. hero_id is made
+    up when the hero is created and stored with it, it tells a hero apart
+    from one created later for the same user. Heroes from before it have 0
     """
 
+    __slots__ = ("name", "gender", "level", "hp", "max_hp", "xp", "class_name", "hero_id")
+
     def __init__(self, name, class_name, gender):
+        # Raises if there is no such class
+        hero_class = ClassRegistry().find(class_name)
+        hero_class.check_gender(gender)
+
+        self.class_name = hero_class.name
+        self.name = name
+        self.gender = gender
         self.level = 1
-        # default max hp might be overwritten by class
-        self.max_hp = 10
+        self.max_hp = hero_class.hp
         self.hp = self.max_hp
-        self.name = name
-        if class_name == "viking":
-            self.Class = Viking(self, gender)
-        elif class_name == "priest" or class_name == "nun" or class_name == "monk":
-            self.Class = Priest(self, gender)
-        elif class_name == "druid":
-            self.Class = Druid(self, gender)
-        elif class_name == "samurai":
-            self.Class = Samurai(self, gender)
-        elif class_name == "amazon":
-            self.Class = Amazon(self, gender)
-        else:
-            raise RuntimeError("There is no class %s!" % (class_name))
+        self.xp = 0
+        self.hero_id = random.getrandbits(63) or 1
+
+    @classmethod
+    def restore(cls, name, class_name, gender, level, hp, max_hp, xp=0, hero_id=0):
+        """
+        Rebuilds a stored hero, without the checks a new hero has to pass
+        """
+
+        char = cls.__new__(cls)
+        char.class_name = ClassRegistry().get(class_name).name
+        char.name = name
+        char.gender = gender
+        char.level = level
+        char.hp = hp
+        char.max_hp = max_hp
+        char.xp = xp
+        char.hero_id = hero_id
+        return char
 
-    def __str__(self, stats=False):
-        return "%s %s" % (first_char_upper(str(self.Class)), self.name)
-            
     @property
-    def summary(self):
+    def Class(self):
         """
-        A short string respresenting all important stats
+        The hero class, looked up on every use so a reload of the
+        classes file reaches live heroes too
         """
-        return "%s (level %i, %i/%i HP)" % (str(self), self.level, self.hp, self.max_hp)
 
-    def do(self, what):
-        return self.Class.do(what)
+        return ClassRegistry().get(self.class_name)
+
+    def __str__(self, stats=False):
+        return "%s %s" % (first_char_upper(self.Class.title(self.gender)), self.name)
+            
+    def do(self, what, locale=DEFAULT_LOCALE):
+        return self.Class.do(self, what, locale)
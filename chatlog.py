@@ -0,0 +1,195 @@
+import gzip
+import json
+import os
+import time
+from collections import deque
+from threading import Event, Thread
+from typing import Any, Callable, Dict, Iterator, List
+from irc_message import IrcMessage, parse_message
+import metrics
+
+class ChatLogger():
+    """
+    Writes the chat to gzip compressed JSON lines files, one record
+    {"ts": time received, "raw": the IRC line} per message. Handlers
+    only append the message to a bounded queue, a background thread
+    turns them into JSON and writes them in batches, so a busy chat
+    never waits on the disk. When the queue is full new messages are
+    dropped and counted. A new file is started once the current one has
+    rotate_bytes of (uncompressed) records
+    """
+
+    _instance: Any = None
+
+    def __new__(self):
+        if self._instance == None:
+            self._instance = super(ChatLogger, self).__new__(self)
+            self._queue: Any = deque()
+            self._wakeup = Event()
+            self._thread: Any = None
+            self._stopping = False
+            self._file: Any = None
+            self._file_bytes = 0
+            self.directory = ""
+            self.written = 0
+            self.files = 0
+
+        return self._instance
+
+    def start(self, directory: str, max_queue: int = 100000, batch_size: int = 5000, flush_interval: float = 1.0, rotate_bytes: int = 64 * 1024 * 1024, compresslevel: int = 3) -> None:
+        """
+        Starts the writer thread, log files go to directory
+        """
+
+        if self._thread is not None:
+            raise RuntimeError("The chat logger is already running")
+
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.rotate_bytes = rotate_bytes
+        # Chat compresses well even at low levels, which are several times faster
+        self.compresslevel = compresslevel
+        self._stopping = False
+
+        self._thread = Thread(target=self._write_loop, name="ChatLogThread", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """
+        Writes what is still queued and closes the file
+        """
+
+        if self._thread is None:
+            raise RuntimeError("The chat logger is not running")
+
+        self._stopping = True
+        self._wakeup.set()
+        self._thread.join()
+        self._thread = None
+        self._close_file()
+
+    def is_running(self) -> bool:
+        return self._thread is not None
+
+    def log(self, message: IrcMessage) -> None:
+        """
+        Queues a message for the log, never blocks
+        """
+
+        if self._thread is None:
+            return
+
+        # Several handler threads may get here at once, the queue can end
+        # up a few entries over max_queue which is fine
+        queue = self._queue
+        if len(queue) >= self.max_queue:
+            metrics.CHAT_LOG_DROPPED.inc()
+            return
+        queue.append((time.time(), message))
+        if len(queue) >= self.batch_size:
+            self._wakeup.set()
+
+    def _write_loop(self) -> None:
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            stopping = self._stopping
+            try:
+                self._write_batch()
+            except Exception as e:
+                print('[!] CHAT LOG WRITE FAILED: ' + str(e))
+            if stopping:
+                return
+
+    def _write_batch(self) -> None:
+        """
+        Writes everything queued right now, as one write to the file
+        """
+
+        queue = self._queue
+        count = len(queue)
+        if count == 0:
+            return
+
+        # Only the raw line is kept, parse_message gets everything else
+        # back from it. Formatting the record by hand is several times
+        # faster than dumping a dict
+        dumps = json.dumps
+        records = []
+        for _ in range(count):
+            received, message = queue.popleft()
+            records.append('{"ts":%.3f,"raw":%s}' % (received, dumps(message.raw)))
+        records.append("")
+        data = "\n".join(records).encode("utf-8")
+
+        if self._file is None or self._file_bytes >= self.rotate_bytes:
+            self._open_file()
+        self._file.write(data)
+        # Readable up to here even if the bot dies
+        self._file.flush()
+        self._file_bytes += len(data)
+        self.written += count
+
+    def _open_file(self) -> None:
+        self._close_file()
+        self.files += 1
+        name = "chat-%s-%04i.jsonl.gz" % (time.strftime("%Y%m%d-%H%M%S"), self.files)
+        self._file = gzip.open(os.path.join(self.directory, name), "wb", compresslevel=self.compresslevel)
+        self._file_bytes = 0
+
+    def _close_file(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Queued, written and dropped messages and files started
+        """
+
+        return {
+            "queued": len(self._queue),
+            "written": self.written,
+            "dropped": metrics.CHAT_LOG_DROPPED.value,
+            "files": self.files,
+        }
+
+def log_files(directory: str) -> List[str]:
+    """
+    The log files in a directory, oldest first
+    """
+
+    names = sorted(name for name in os.listdir(directory) if name.startswith("chat-") and name.endswith(".jsonl.gz"))
+    return [os.path.join(directory, name) for name in names]
+
+def read_log(filename: str) -> Iterator[Dict[str, Any]]:
+    """
+    Yields the records of a log file. A file cut short by a crash is read
+    up to the last complete record
+    """
+
+    with gzip.open(filename, "rt", encoding="utf-8") as f:
+        try:
+            for line in f:
+                if line.endswith("\n"):
+                    yield json.loads(line)
+        except EOFError:
+            pass
+
+def replay(filenames: List[str], handlers: List[Callable[[IrcMessage], Any]]) -> int:
+    """
+    Feeds logged messages through handlers in the order they were logged,
+    as fast as they go. Returns how many messages were replayed
+    """
+
+    count = 0
+    for filename in filenames:
+        for record in read_log(filename):
+            message = parse_message(record["raw"])
+            for handler in handlers:
+                handler(message)
+            count += 1
+    return count
@@ -1,89 +1,217 @@
+import json
+import os
+from threading import Lock
+from types import MappingProxyType
+from typing import Any, Dict
 from actions import *
+from catalog import ChatError, DEFAULT_LOCALE, MessageCatalog
+
+# The class definitions loaded at startup, see ClassRegistry
+CLASSES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "classes.json")
 
 class BaseClass:
-    pass
+    __slots__ = ()
 
 class HeroClass(BaseClass):
     """
-    The hero class any hero has
+    The hero class any hero has, built from an entry in the classes file.
+    There is only one instance per class, shared by every hero of it,
+    the hero's own state lives in Character
     """
 
-    def __init__(self, char, name, gender, hp):
-        self.char = char
+    __slots__ = ("id", "name", "description", "hp", "damage", "heal", "genders", "gender_error", "actions", "_titles", "_default_title")
+
+    def __init__(self, name, data):
         self.name = name
-        self.gender = gender
-        self.char.max_hp = hp
-        self.char.hp = self.char.max_hp
-        self.actions = { "run": Action(char, "run", "runs") }
+        # id is what gets stored with a hero, it must never change
+        self.id = int(data["id"])
+        self.description = data.get("description", "")
+        # max hp a new hero of this class starts with
+        self.hp = int(data["hp"])
+        # base damage dealt and hp healed per game action, level is added on top
+        self.damage = int(data.get("damage", 1))
+        self.heal = int(data.get("heal", 0))
+        self.genders = frozenset(data["genders"]) if "genders" in data else None
+        self.gender_error = data.get("gender_error", "A %s cannot be %%s!" % (name))
+        self.actions = MappingProxyType({
+            action: Action(action, names) for action, names in data.get("actions", {}).items()
+        })
+
+        # Every title is worked out once here, not per message
+        titles = data.get("titles", {})
+        female = titles.get("female", "female " + name)
+        male = titles.get("male", "male " + name)
+        self._titles = { "female": female, "f": female, "male": male, "m": male }
+        self._default_title = titles.get("other", name)
 
     def __str__(self):
-        if self.gender == "female" or self.gender == "f":
-            return "female " + self.name
-        elif self.gender == "male" or self.gender == "m":
-            return "male " + self.name
         return self.name
 
-    def do(self, what):
-        if what == None or len(what) == 0:
-            if len(self.actions) == 0:
-                return "%s cannot do any actions right now!" % (self.char.name)
-            else:
-                return "%s can do the following actions: %s" % (self.char.name, " ".join(self.actions))
-        elif what[0] in self.actions:
-            return self.actions[what[0]].do(what[1:])
-        else:
-            raise RuntimeError("%s cannot %s!", (self.char.name, what[0]))
-
-class Viking(HeroClass):
-    """
-    A mighty viking
-    Strength Warrior
-    """
-
-    def __init__(self, char, gender):
-        HeroClass.__init__(self, char, "viking", gender, 13)
+    def __reduce__(self):
+        # Copies and pickles refer to the shared instance
+        return (shared_class, (self.name,))
 
-class Priest(HeroClass):
-    """
-    A monk or nun, depending on gender
-    Healer/Antimage
-    """
+    def title(self, gender):
+        """
+        How a hero of this class and gender is called
+        """
 
-    def __init__(self, char, gender):
-        HeroClass.__init__(self, char, "priest", gender, 8)
+        return self._titles.get(gender, self._default_title)
 
-    def __str__(self):
-        if self.gender == "female" or self.gender == "f":
-            return "nun"
-        elif self.gender == "male" or self.gender == "m":
-            return "monk"
-        return "priest"
+    def check_gender(self, gender):
+        """
+        Raises if a hero of this class cannot have that gender
+        """
 
-class Druid(HeroClass):
-    """
-    A druid, one with nature
-    Healer/Supporter
-    """
+        if self.genders is not None and gender not in self.genders:
+            raise RuntimeError(self.gender_error.replace("%s", gender))
 
-    def __init__(self, char, gender):
-        HeroClass.__init__(self, char, "druid", gender, 9)
+    def do(self, char, what, locale=DEFAULT_LOCALE):
+        if what == None or len(what) == 0:
+            if len(self.actions) == 0:
+                return MessageCatalog().render(locale, "do.none", name=char.name)
+            else:
+                return MessageCatalog().render(locale, "do.list", name=char.name, actions=" ".join(self.actions))
+        elif what[0] in self.actions:
+            return self.actions[what[0]].do(char, what[1:])
+        else:
+            raise ChatError("do.cannot", name=char.name, action=what[0])
 
-class Samurai(HeroClass):
+class ClassRegistry():
     """
-    A proud warrior from the far east
-    Agility Warrior
+    All hero classes, loaded from a JSON file that maps each class name to
+    its definition (id, hp, damage, heal, aliases, gender rules, titles,
+    actions). Names and aliases both resolve with a single dictionary
+    lookup.
+
+    reload() swaps the whole table at once. Classes that were dropped from
+    the file can no longer be picked for new heroes, but heroes that
+    already have one keep working
     """
 
-    def __init__(self, char, gender):
-        HeroClass.__init__(self, char, "samurai", gender, 11)
-
-class Amazon(HeroClass):
+    _instance: Any = None
+
+    def __new__(self):
+        if self._instance == None:
+            self._instance = super(ClassRegistry, self).__new__(self)
+            self._filename: str = CLASSES_FILE
+            self._lock = Lock()
+            self._classes: Dict[str, HeroClass] = {}
+            self._lookup: Dict[str, HeroClass] = {}
+            self._by_id: Dict[int, HeroClass] = {}
+            self._loaded = False
+
+        return self._instance
+
+    def load(self, filename: str = "") -> None:
+        """
+        Reads the classes file (the default one if no filename given) and
+        replaces the current definitions. Nothing changes if the file is broken
+        """
+
+        self._lock.acquire()
+        try:
+            if filename != "":
+                self._filename = filename
+
+            try:
+                with open(self._filename, encoding="utf-8") as f:
+                    data = json.load(f)
+                classes = { name: HeroClass(name, entry) for name, entry in data.items() }
+            except (OSError, ValueError, KeyError, TypeError) as e:
+                raise RuntimeError("Could not load classes from %s: %s" % (self._filename, e))
+
+            lookup: Dict[str, HeroClass] = {}
+            by_id: Dict[int, HeroClass] = {}
+            for name, hero_class in classes.items():
+                for key in [name] + list(data[name].get("aliases", [])):
+                    if key in lookup:
+                        raise RuntimeError("Class name %s is used twice" % (key))
+                    lookup[key] = hero_class
+                if hero_class.id in by_id:
+                    raise RuntimeError("Class id %i is used twice" % (hero_class.id))
+                by_id[hero_class.id] = hero_class
+
+            # Keep retired classes for the heroes that still have them
+            for name, hero_class in self._classes.items():
+                if name not in classes and hero_class.id not in by_id:
+                    classes[name] = hero_class
+                    by_id[hero_class.id] = hero_class
+
+            self._classes = classes
+            self._by_id = by_id
+            self._lookup = lookup
+            self._loaded = True
+        finally:
+            self._lock.release()
+
+    def reload(self) -> None:
+        """
+        Loads the classes file again, live heroes pick up the new definitions
+        """
+
+        self.load()
+
+    def _ensure_loaded(self) -> None:
+        if not self._loaded:
+            self.load()
+
+    def find(self, name: str) -> HeroClass:
+        """
+        Returns the class a player asked for by name or alias
+        """
+
+        hero_class = self._lookup.get(name)
+        if hero_class is None:
+            self._ensure_loaded()
+            hero_class = self._lookup.get(name)
+            if hero_class is None:
+                raise ChatError("class.unknown", name=name)
+        return hero_class
+
+    def get(self, name: str) -> HeroClass:
+        """
+        Returns a class by its own name, including retired ones
+        """
+
+        hero_class = self._classes.get(name)
+        if hero_class is None:
+            self._ensure_loaded()
+            hero_class = self._classes.get(name)
+            if hero_class is None:
+                raise ChatError("class.unknown", name=name)
+        return hero_class
+
+    def get_by_id(self, class_id: int) -> HeroClass:
+        """
+        Returns a class by the id stored with heroes
+        """
+
+        self._ensure_loaded()
+        hero_class = self._by_id.get(class_id)
+        if hero_class is None:
+            raise RuntimeError("There is no class with id %i!" % (class_id))
+        return hero_class
+
+    def max_id(self) -> int:
+        """
+        The highest class id in use, for tables indexed by class id
+        """
+
+        self._ensure_loaded()
+        return max(self._by_id) if self._by_id else 0
+
+    def names(self):
+        """
+        Names of all classes that can be picked for new heroes
+        """
+
+        self._ensure_loaded()
+        return [name for name, hero_class in self._classes.items() if self._lookup.get(name) is hero_class]
+
+def shared_class(name):
     """
-    A warrior woman
-    Archer
+    Returns the shared instance of a hero class by its name
     """
 
-    def __init__(self, char, gender):
-        if gender != "female":
-            raise RuntimeError("An Amazon can only be female!")
-        HeroClass.__init__(self, char, "amazon", gender, 9)
+    return ClassRegistry().get(name)
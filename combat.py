@@ -0,0 +1,244 @@
+from array import array
+from typing import Any, Dict, List, Tuple
+
+# NumPy is optional, without it every fight is resolved by the pure Python path.
+# It is imported by the first fight big enough for it, not at startup
+np: Any = None
+_numpy_checked = False
+
+def _numpy() -> Any:
+    global np, _numpy_checked
+    if not _numpy_checked:
+        try:
+            import numpy
+            np = numpy
+        except ImportError:
+            pass
+        _numpy_checked = True
+    return np
+
+# What players can do in a running game with '!do <action>'
+ACTION_ATTACK = 1
+ACTION_HEAL = 2
+ACTION_RUN = 3
+
+# The boss strikes back at some of the heroes that attacked it
+BOSS_HIT_CHANCE = 0.25
+BOSS_DAMAGE = 3
+
+def hit_threshold(chance: float) -> int:
+    """
+    Rolls are 53 bit integers, a hit is a roll below this
+    """
+
+    return int(chance * (1 << 53))
+
+_HIT_THRESHOLD = hit_threshold(BOSS_HIT_CHANCE)
+_MASK = (1 << 64) - 1
+
+# Fights smaller than this are not worth the NumPy call overhead
+NUMPY_MIN_PARTICIPANTS = 2000
+
+class Combatants:
+    """
+    State of everyone in an encounter, kept column wise: one contiguous
+    array per stat, a hero is a row index. A tick touches each column in
+    one pass (or one vector operation) instead of walking Character objects
+    """
+
+    def __init__(self):
+        self.users: List[str] = []
+        self.chars: List[Any] = []
+        self.rows: Dict[str, int] = {}
+
+        self.hp = array('i')
+        self.max_hp = array('i')
+        self.level = array('i')
+        self.class_id = array('i')
+        self.alive = array('b')
+
+    def __len__(self):
+        return len(self.users)
+
+    def add(self, user: str, char: Any) -> int:
+        """
+        Adds a hero, returns its row
+        """
+
+        row = len(self.users)
+        self.users.append(user)
+        self.chars.append(char)
+        self.rows[user] = row
+
+        self.hp.append(char.hp)
+        self.max_hp.append(char.max_hp)
+        self.level.append(char.level)
+        self.class_id.append(char.Class.id)
+        self.alive.append(1 if char.hp > 0 else 0)
+        return row
+
+class TickResult:
+    """
+    What happened in one tick, used for the summary message
+    """
+
+    __slots__ = ("tick", "attackers", "damage", "healers", "healed", "fled", "hits", "fallen")
+
+    def __init__(self, tick: int):
+        self.tick = tick
+        self.attackers = 0
+        self.damage = 0
+        self.healers = 0
+        self.healed = 0
+        self.fled = 0
+        self.hits = 0
+        self.fallen = 0
+
+    def as_tuple(self) -> Tuple[int, ...]:
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+def resolve(c: Combatants, intents: Dict[int, int], damage_table: List[int], heal_table: List[int], boss_hp: int, seed: int, tick: int, use_numpy: Any = None,
+        boss_damage: int = BOSS_DAMAGE, boss_hit_threshold: int = _HIT_THRESHOLD) -> Tuple[int, TickResult]:
+    """
+    Resolves one tick of a fight: attacks hurt the boss, heals are shared
+    by everyone still standing, then the boss hits back at some attackers.
+    Updates the hp and alive columns and returns the boss's new hp and
+    what happened.
+
+    Whether the boss hits a hero depends only on seed, tick and the hero's
+    row, so both paths give exactly the same outcome. use_numpy None picks
+    NumPy for big fights when it is installed. How hard and how often the
+    boss hits come from the NPC being fought
+    """
+
+    if use_numpy is None:
+        use_numpy = len(c) >= NUMPY_MIN_PARTICIPANTS and _numpy() is not None
+    elif use_numpy and _numpy() is None:
+        raise RuntimeError("NumPy is not installed")
+
+    if use_numpy:
+        return _resolve_numpy(c, intents, damage_table, heal_table, boss_hp, seed, tick, boss_damage, boss_hit_threshold)
+    return _resolve_python(c, intents, damage_table, heal_table, boss_hp, seed, tick, boss_damage, boss_hit_threshold)
+
+def _roll_key(seed: int, tick: int) -> int:
+    return (seed ^ (tick << 32)) & _MASK
+
+def _roll(key: int) -> int:
+    """
+    splitmix64 of key, cut to 53 bits
+    """
+
+    z = (key + 0x9E3779B97F4A7C15) & _MASK
+    z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & _MASK
+    z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & _MASK
+    return (z ^ (z >> 31)) >> 11
+
+def _resolve_python(c: Combatants, intents: Dict[int, int], damage_table: List[int], heal_table: List[int], boss_hp: int, seed: int, tick: int,
+        boss_damage: int, boss_hit_threshold: int) -> Tuple[int, TickResult]:
+    hp = c.hp
+    max_hp = c.max_hp
+    level = c.level
+    class_id = c.class_id
+    alive = c.alive
+    result = TickResult(tick)
+
+    attackers = []
+    for row, action in intents.items():
+        if not alive[row]:
+            continue
+        if action == ACTION_ATTACK:
+            result.damage += damage_table[class_id[row]] + level[row]
+            attackers.append(row)
+        elif action == ACTION_HEAL:
+            power = heal_table[class_id[row]]
+            if power > 0:
+                result.healed += power + level[row]
+                result.healers += 1
+        elif action == ACTION_RUN:
+            alive[row] = 0
+            result.fled += 1
+    result.attackers = len(attackers)
+    boss_hp = max(boss_hp - result.damage, 0)
+
+    # Healing is shared evenly by everyone still standing
+    if result.healed > 0:
+        living = [row for row in range(len(c)) if alive[row]]
+        share = result.healed // len(living) if living else 0
+        if share > 0:
+            for row in living:
+                hp[row] = min(hp[row] + share, max_hp[row])
+
+    if boss_hp > 0:
+        key = _roll_key(seed, tick)
+        for row in attackers:
+            if _roll(key + row) < boss_hit_threshold:
+                result.hits += 1
+                hp[row] -= boss_damage
+                if hp[row] <= 0:
+                    hp[row] = 0
+                    alive[row] = 0
+                    result.fallen += 1
+    return boss_hp, result
+
+def _resolve_numpy(c: Combatants, intents: Dict[int, int], damage_table: List[int], heal_table: List[int], boss_hp: int, seed: int, tick: int,
+        boss_damage: int, boss_hit_threshold: int) -> Tuple[int, TickResult]:
+    result = TickResult(tick)
+    if not intents:
+        return boss_hp, result
+
+    # Views on the array columns, no copies. They must be gone before the
+    # columns grow again, so they never leave this function
+    hp = np.frombuffer(c.hp, dtype=np.int32)
+    max_hp = np.frombuffer(c.max_hp, dtype=np.int32)
+    level = np.frombuffer(c.level, dtype=np.int32)
+    class_id = np.frombuffer(c.class_id, dtype=np.int32)
+    alive = np.frombuffer(c.alive, dtype=np.int8)
+    damage_table = np.asarray(damage_table, dtype=np.int64)
+    heal_table = np.asarray(heal_table, dtype=np.int64)
+
+    rows = np.fromiter(intents.keys(), dtype=np.int64, count=len(intents))
+    actions = np.fromiter(intents.values(), dtype=np.int8, count=len(intents))
+    acting = alive[rows] != 0
+    rows = rows[acting]
+    actions = actions[acting]
+
+    attackers = rows[actions == ACTION_ATTACK]
+    result.attackers = int(attackers.size)
+    result.damage = int((damage_table[class_id[attackers]] + level[attackers]).sum())
+
+    healers = rows[actions == ACTION_HEAL]
+    power = heal_table[class_id[healers]]
+    healers = healers[power > 0]
+    result.healers = int(healers.size)
+    result.healed = int((power[power > 0] + level[healers]).sum())
+
+    runners = rows[actions == ACTION_RUN]
+    alive[runners] = 0
+    result.fled = int(runners.size)
+    boss_hp = max(boss_hp - result.damage, 0)
+
+    # Healing is shared evenly by everyone still standing
+    if result.healed > 0:
+        living = alive != 0
+        count = int(living.sum())
+        share = result.healed // count if count else 0
+        if share > 0:
+            hp[living] = np.minimum(hp[living] + share, max_hp[living])
+
+    if boss_hp > 0 and attackers.size:
+        keys = np.uint64(_roll_key(seed, tick)) + attackers.astype(np.uint64)
+        z = keys + np.uint64(0x9E3779B97F4A7C15)
+        z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+        rolls = (z ^ (z >> np.uint64(31))) >> np.uint64(11)
+
+        hit = attackers[rolls < np.uint64(boss_hit_threshold)]
+        result.hits = int(hit.size)
+        hp[hit] -= boss_damage
+        down = hit[hp[hit] <= 0]
+        hp[down] = 0
+        alive[down] = 0
+        result.fallen = int(down.size)
+
+    del hp, max_hp, level, class_id, alive
+    return boss_hp, result
@@ -0,0 +1,71 @@
+from typing import Any, Callable, Dict, Iterable, List
+from irc_message import IrcMessage
+
+class Command:
+    """
+    A chat command, its handler and optional subcommands. Handlers
+    take the IrcMessage and the list of arguments after the command
+    """
+
+    def __init__(self, name: str, handler: Callable[[IrcMessage, List[str]], Any]):
+        self.name = name
+        self.handler = handler
+        self.subcommands: Dict[str, Callable[[IrcMessage, List[str]], Any]] = {}
+
+class CommandRouter:
+    """
+    Dispatches chat commands to their handlers with a single dictionary
+    lookup. The router itself is a message handler and can be registered
+    with IrcClient. Lines that are not commands cost one prefix check
+    """
+
+    def __init__(self, prefix: str = "!"):
+        self.prefix = prefix
+        self._commands: Dict[str, Command] = {}
+
+    def register(self, name: str, handler: Callable[[IrcMessage, List[str]], Any], aliases: Iterable[str] = ()) -> None:
+        """
+        Registers a handler for a command name (without the prefix), every
+        alias leads to the same command
+        """
+
+        command = Command(name, handler)
+        for key in [name] + list(aliases):
+            if key in self._commands:
+                raise RuntimeError("Command %s is already registered" % (key))
+        for key in [name] + list(aliases):
+            self._commands[key] = command
+
+    def register_subcommand(self, name: str, subcommand: str, handler: Callable[[IrcMessage, List[str]], Any], aliases: Iterable[str] = ()) -> None:
+        """
+        Registers a handler for the first argument of a command, such as
+        create in '!char create'. Arguments that match no subcommand go
+        to the command's own handler
+        """
+
+        if name not in self._commands:
+            raise RuntimeError("There is no command %s" % (name))
+        subcommands = self._commands[name].subcommands
+        for key in [subcommand] + list(aliases):
+            if key in subcommands:
+                raise RuntimeError("Subcommand %s %s is already registered" % (name, key))
+        for key in [subcommand] + list(aliases):
+            subcommands[key] = handler
+
+    def __call__(self, message: IrcMessage) -> None:
+        text = message.trailing
+        if not text or text[0] != self.prefix or message.command != "PRIVMSG":
+            return
+
+        name, _, rest = text[1:].partition(" ")
+        command = self._commands.get(name)
+        if command is None:
+            return
+
+        args = rest.split()
+        if args and command.subcommands:
+            handler = command.subcommands.get(args[0])
+            if handler is not None:
+                handler(message, args[1:])
+                return
+        command.handler(message, args)
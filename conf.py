@@ -3,3 +3,20 @@ PORT = 6697 # default with SSL support is 6697
 NAME = '' # 'Nickofthebot'
 OAUTH = '' # 'oauth:token'
 CHANNEL = '' # '#channelname'
+CHANNELS = [] # ['#another', '#andanother'] joined on the same connection
+RATE_LIMIT = 20 # chat messages per 30 seconds, Twitch allows 100 if the bot is a moderator
+JOIN_RATE_LIMIT = 20 # channels joined per 10 seconds, Twitch allows 2000 for verified bots
+DATABASE = 'characters.db' # empty string keeps everything in memory
+JOURNAL_DIR = 'journal' # every character change is appended here first, empty string (or no DATABASE) turns it off
+JOURNAL_SYNC = True # wait for the journal to reach the disk before answering, off only survives the bot dying, not the machine
+SNAPSHOT_INTERVAL = 60 # seconds between writes of all changed characters to DATABASE when journaling
+HANDLER_WORKERS = 4 # threads running chat handlers, one user's commands still run in order
+INBOUND_QUEUE = 10000 # received lines waiting for the handlers before chat (not commands) is dropped
+HANDLER_QUEUE = 1000 # pending handler tasks before received lines are held back in that queue
+METRICS_PORT = 0 # serve Prometheus metrics on 127.0.0.1 at this port, 0 keeps metrics off
+CHAT_LOG_DIR = 'logs' # chat is logged to gzip JSON lines files here, empty string turns the log off
+THROTTLE_COMMANDS = 5 # commands a viewer may use per THROTTLE_WINDOW seconds, 0 turns throttling off
+THROTTLE_WINDOW = 30
+THROTTLE_EXEMPT = ['broadcaster', 'moderator', 'vip'] # badges that are never throttled
+CHANNEL_LOCALES = {} # {'#channelname': 'de'} locales of messages.json, the others get 'en'
+WORKERS = 1 # bot processes, each with its own connection and a share of the channels; more than one needs DATABASE
@@ -1,6 +1,17 @@
 import sqlite3
-import pickle
-from typing import Any, List, Tuple, Dict
+from threading import Lock
+from typing import Any, Iterator, List, Tuple, Dict
+
+# Stats kept as columns next to the character record, so they can be
+# queried without decoding it. The record stays the source of truth
+STAT_COLUMNS = [("level", "integer"), ("class", "text"), ("hp", "integer"), ("xp", "integer")]
+
+_PLAYERS_TABLE = (
+    "CREATE TABLE IF NOT EXISTS players ("
+    "channel text NOT NULL, username text NOT NULL, data blob, "
+    "level integer, class text, hp integer, xp integer, "
+    "PRIMARY KEY (channel, username)) WITHOUT ROWID"
+)
 
 class Database():
     """
@@ -26,6 +37,7 @@ class Database():
             self._instance = super(Database, self).__new__(self)
             self.db: Any = None
             self.cursor: Any = None
+            self.lock: Any = None
 
         return self._instance
 
@@ -33,64 +45,212 @@ class Database():
         if self.db is not None:
             self.db.close()
 
-    def initialize(self, filename: str="") -> None:
+    def initialize(self, filename: str="", legacy_channel: str="") -> None:
         """
         Opens connection to local database and creates a cursor.
         If no filename provided, the database will be created
-        in memory and get destroyed upon exiting the program
+        in memory and get destroyed upon exiting the program.
+        File databases use WAL so readers never wait for a flush,
+        several processes can use the same file. A file from before
+        channels has its characters moved to legacy_channel
         """
         
         if self.db == None:
             if filename == "":
-                self.db = sqlite3.connect(":memory:")
+                self.db = sqlite3.connect(":memory:", check_same_thread=False)
             else:
-                self.db = sqlite3.connect(filename)
+                # Bot workers in other processes may share the file, a writer
+                # waits for their commit instead of failing with 'locked'
+                self.db = sqlite3.connect(filename, check_same_thread=False, timeout=30)
+                self.db.execute("PRAGMA journal_mode=WAL")
+                # With WAL a commit only has to reach the log, not the disk
+                self.db.execute("PRAGMA synchronous=NORMAL")
             
+            self.lock = Lock()
             self.cursor = self.db.cursor()
+            try:
+                self._migrate_legacy(legacy_channel)
+            except Exception:
+                self.db.close()
+                self.db = None
+                raise
+            self._send_query(_PLAYERS_TABLE)
+            # Tables from before the stat columns get them added, their rows
+            # have NULL stats until written again
+            columns = [row[1] for row in self._send_query("PRAGMA table_info(players)")]
+            for column, kind in STAT_COLUMNS:
+                if column not in columns:
+                    self._send_query("ALTER TABLE players ADD COLUMN %s %s" % (column, kind))
+            self._send_query(
+                    "CREATE INDEX IF NOT EXISTS players_rank ON players (channel, level DESC, xp DESC)"
+                )
+            # Last journal event each snapshot of the players table contains
             self._send_query(
-                    "CREATE TABLE players (username text, data text)"
+                    "CREATE TABLE IF NOT EXISTS snapshots (journal text PRIMARY KEY, seq integer NOT NULL)"
                 )
         else:
             raise RuntimeError('The database is already initialized')
 
+    def _migrate_legacy(self, channel: str) -> None:
+        """
+        The first versions kept a players (username, data) table with
+        pickled characters of the one channel the bot was in. It is
+        rebuilt with channels and the (channel, username) key in one
+        transaction, the first row of a user wins like it did on reads.
+        The records stay pickles, they are upgraded when read
+        """
+
+        # Taken for writing at once, other workers wait for the migration
+        self.db.execute("BEGIN IMMEDIATE")
+        try:
+            columns = [row[1] for row in self.db.execute("PRAGMA table_info(players)")]
+            if columns and "channel" not in columns:
+                if channel == "":
+                    raise RuntimeError("The database has characters from before channels, "
+                        "a channel to move them to is needed")
+                self.db.execute("ALTER TABLE players RENAME TO players_legacy")
+                self.db.execute(_PLAYERS_TABLE)
+                self.db.execute(
+                        "INSERT OR IGNORE INTO players (channel, username, data) "
+                        "SELECT ?, username, data FROM players_legacy "
+                        "WHERE username IS NOT NULL ORDER BY rowid", [channel]
+                    )
+                self.db.execute("DROP TABLE players_legacy")
+                print('[i] MOVED THE CHARACTERS OF THE OLD DATABASE TO: ' + channel)
+            self.db.commit()
+        except Exception:
+            self.db.rollback()
+            raise
+
     def _send_query(self, query: str) -> List[Any]:
         """
         Sends and commits a query, returns a list, each element
         of the list is a tuple returned by the database
         """
 
-        self.cursor.execute(query)
-        self.db.commit()
-        return self.cursor.fetchall()
+        self.lock.acquire()
+        try:
+            self.cursor.execute(query)
+            self.db.commit()
+            return self.cursor.fetchall()
+        finally:
+            self.lock.release()
 
-    def insert_data(self, user: str, data: Any) -> None:
+    def insert_data(self, channel: str, user: str, data: bytes, stats: Tuple[Any, ...] = (None, None, None, None)) -> None:
         """
-        Checks and inserts the data if destination exists
+        Inserts or replaces the data of one user, stats are
+        (level, class, hp, xp)
         """
-        serialized: str = pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL)
-        
-        self.cursor.execute(
-            "INSERT INTO players (username, data) VALUES (?, ?)", [user, sqlite3.Binary(serialized)]
-        )
-        self.db.commit()
 
-    def get_data(self, user: str) -> Any:
+        self.write_many([(channel, user, data) + tuple(stats)], [])
+
+    def get_data(self, channel: str, user: str) -> Any:
         """
         Retrieves data if source exists
         """
 
-        self.cursor.execute("SELECT * FROM players WHERE username=?", [user])
-        self.db.commit()
-
-        retrieved_data: str = self.cursor.fetchall()
+        self.lock.acquire()
+        try:
+            self.cursor.execute(
+                "SELECT data FROM players WHERE channel=? AND username=?", [channel, user]
+            )
+            retrieved_data: List[Any] = self.cursor.fetchall()
+        finally:
+            self.lock.release()
         
-        if retrieved_data != []: return pickle.loads(retrieved_data[0][1])
+        if retrieved_data != []: return bytes(retrieved_data[0][0])
         else: return None
 
-    def delete_data(self, user: str) -> None:
+    def delete_data(self, channel: str, user: str) -> None:
         """
         Wipes the entry if exists
         """
 
-        self.cursor.execute("DELETE FROM players WHERE username=?", [user])
-        self.db.commit()
+        self.write_many([], [(channel, user)])
+
+    def get_stats(self, channel: str) -> List[Tuple[Any, ...]]:
+        """
+        (username, level, class, hp, xp, data) of every user in a channel,
+        data is only returned for rows that have no stats yet
+        """
+
+        self.lock.acquire()
+        try:
+            self.cursor.execute(
+                "SELECT username, level, class, hp, xp, CASE WHEN level IS NULL THEN data END "
+                "FROM players WHERE channel=?", [channel]
+            )
+            return self.cursor.fetchall()
+        finally:
+            self.lock.release()
+
+    def iter_rows(self, channel: str = "", batch: int = 1000) -> Iterator[Tuple[Any, ...]]:
+        """
+        Streams the (channel, user, data, level, class, hp, xp) rows of
+        one channel, or of all of them without one, in key order. Fetched
+        batch rows at a time, so the table never has to fit in memory and
+        the lock is only held while a batch is read
+        """
+
+        cursor = self.db.cursor()
+        self.lock.acquire()
+        try:
+            if channel == "":
+                cursor.execute("SELECT channel, username, data, level, class, hp, xp FROM players ORDER BY channel, username")
+            else:
+                cursor.execute("SELECT channel, username, data, level, class, hp, xp FROM players WHERE channel=? ORDER BY username", [channel])
+        finally:
+            self.lock.release()
+
+        try:
+            while True:
+                self.lock.acquire()
+                try:
+                    rows = cursor.fetchmany(batch)
+                finally:
+                    self.lock.release()
+                if not rows:
+                    return
+                for row in rows:
+                    yield row
+        finally:
+            cursor.close()
+
+    def get_journal_seq(self, journal: str) -> int:
+        """
+        The last event of a journal the players table contains, 0 if none
+        """
+
+        self.lock.acquire()
+        try:
+            self.cursor.execute("SELECT seq FROM snapshots WHERE journal=?", [journal])
+            row = self.cursor.fetchone()
+        finally:
+            self.lock.release()
+        return row[0] if row is not None else 0
+
+    def write_many(self, rows: List[Tuple[Any, ...]], deleted: List[Tuple[str, str]], snapshot: Any = None) -> None:
+        """
+        Writes (channel, user, data, level, class, hp, xp) rows and deletes
+        (channel, user) entries, all in a single transaction with one commit.
+        snapshot is the (journal, seq) the rows bring the table up to
+        """
+
+        self.lock.acquire()
+        try:
+            with self.db:
+                if rows:
+                    self.db.executemany(
+                        "INSERT OR REPLACE INTO players (channel, username, data, level, class, hp, xp) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?)", rows
+                    )
+                if deleted:
+                    self.db.executemany(
+                        "DELETE FROM players WHERE channel=? AND username=?", deleted
+                    )
+                if snapshot is not None:
+                    self.db.execute(
+                        "INSERT OR REPLACE INTO snapshots (journal, seq) VALUES (?, ?)", snapshot
+                    )
+        finally:
+            self.lock.release()
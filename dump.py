@@ -0,0 +1,95 @@
+import gzip
+import json
+from typing import Any, Dict, Iterator, List, Tuple
+from character import Character
+from serialization import decode_character, encode_character
+
+# Rows written to the database per transaction on import
+IMPORT_BATCH = 5000
+
+def _open(filename: str, mode: str) -> Any:
+    """
+    Files ending in .gz are gzip compressed
+    """
+
+    if filename.endswith(".gz"):
+        return gzip.open(filename, mode + "t", encoding="utf-8")
+    return open(filename, mode, encoding="utf-8")
+
+def character_to_dict(channel: str, user: str, char: Character) -> Dict[str, Any]:
+    return {
+        "channel": channel,
+        "user": user,
+        "name": char.name,
+        "class": char.class_name,
+        "gender": char.gender,
+        "level": char.level,
+        "hp": char.hp,
+        "max_hp": char.max_hp,
+        "xp": char.xp,
+        "hero_id": char.hero_id,
+    }
+
+def character_from_dict(entry: Dict[str, Any]) -> Tuple[str, str, Character]:
+    """
+    (channel, user, character) of an exported line, raises if the class
+    does not exist
+    """
+
+    char = Character.restore(str(entry["name"]), str(entry["class"]), str(entry.get("gender", "")),
+        int(entry["level"]), int(entry["hp"]), int(entry["max_hp"]), int(entry.get("xp", 0)),
+        int(entry.get("hero_id", 0)))
+    return str(entry["channel"]), str(entry["user"]), char
+
+def export_characters(database: Any, filename: str, channel: str = "") -> int:
+    """
+    Writes the characters of a channel (all of them without one) as JSON
+    lines, returns how many. Records of any version are decoded, so the
+    file always has the current fields and reads without the bot's code.
+    Rows are streamed from the database, memory use does not grow with it
+    """
+
+    count = 0
+    with _open(filename, "w") as f:
+        for row_channel, user, data, _, _, _, _ in database.iter_rows(channel):
+            char = decode_character(bytes(data))
+            f.write(json.dumps(character_to_dict(row_channel, user, char), ensure_ascii=False, separators=(",", ":")))
+            f.write("\n")
+            count += 1
+    return count
+
+def read_characters(filename: str) -> Iterator[Tuple[str, str, Character]]:
+    """
+    (channel, user, character) of every line of an export
+    """
+
+    with _open(filename, "r") as f:
+        for number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                yield character_from_dict(json.loads(line))
+            except (ValueError, KeyError, TypeError, RuntimeError) as e:
+                raise RuntimeError("Line %i of %s is not a character: %s" % (number, filename, e))
+
+def import_characters(database: Any, filename: str, batch: int = IMPORT_BATCH) -> int:
+    """
+    Writes every character of an export into the database, replacing
+    the ones already there, returns how many. batch rows go in with one
+    executemany and one commit, not one transaction per character.
+    Meant for a stopped bot: a running one would overwrite them again
+    from its cache and journal
+    """
+
+    count = 0
+    rows: List[Tuple[Any, ...]] = []
+    for channel, user, char in read_characters(filename):
+        rows.append((channel, user, encode_character(char), char.level, char.class_name, char.hp, char.xp))
+        if len(rows) >= batch:
+            database.write_many(rows, [])
+            count += len(rows)
+            rows = []
+    if rows:
+        database.write_many(rows, [])
+        count += len(rows)
+    return count
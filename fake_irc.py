@@ -0,0 +1,339 @@
+import asyncio
+import random
+import re
+import ssl
+from threading import Lock, Thread
+from typing import Any, Dict, List, Tuple
+
+class FakeIrcServer:
+    """
+    A small stand-in for Twitch's chat server on the loopback interface,
+    enough of it to log the bot in, join channels and chat. Runs its own
+    event loop in a thread. With drop_chance every chat line received may
+    cut the connection, to see how the client copes with a flaky network
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, drop_chance: float = 0.0, seed: Any = None, ssl_context: Any = None, record: bool = True):
+        self.host = host
+        self.port = port
+        self.drop_chance = drop_chance
+        self.ssl_context = ssl_context
+        self.record = record
+        self._random = random.Random(seed)
+
+        self._lock = Lock()
+        # Every line received from the clients, in order, without \r\n.
+        # Under load nobody wants them all kept, see record and on_line
+        self.received: List[str] = []
+        # Called with each received line on the server's event loop
+        self.on_line: Any = None
+        self.connections = 0
+        self.drops = 0
+
+        self._loop: Any = None
+        self._server: Any = None
+        self._thread: Any = None
+        self._writers: List[Any] = []
+        # Channels each connection has joined, chat only goes to those
+        self._joined: Dict[Any, Any] = {}
+
+    def start(self) -> None:
+        """
+        Starts listening, port is the real port afterwards if 0 was given
+        """
+
+        if self._loop is not None:
+            raise RuntimeError("The server is already running")
+
+        self._loop = asyncio.new_event_loop()
+        self._thread = Thread(target=self._loop.run_forever, name="FakeIrcServerThread", daemon=True)
+        self._thread.start()
+        asyncio.run_coroutine_threadsafe(self._listen(), self._loop).result()
+
+    def stop(self) -> None:
+        if self._loop is None:
+            raise RuntimeError("The server is not running")
+
+        asyncio.run_coroutine_threadsafe(self._shutdown(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+        self._loop = None
+
+    async def _listen(self) -> None:
+        self._server = await asyncio.start_server(self._serve, self.host, self.port, ssl=self.ssl_context)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def _shutdown(self) -> None:
+        self._server.close()
+        for writer in list(self._writers):
+            writer.close()
+        await self._server.wait_closed()
+
+    async def _serve(self, reader: Any, writer: Any) -> None:
+        self._lock.acquire()
+        try:
+            self.connections += 1
+        finally:
+            self._lock.release()
+
+        self._writers.append(writer)
+        self._lock.acquire()
+        try:
+            self._joined[writer] = set()
+        finally:
+            self._lock.release()
+        nick = "justinfan"
+        try:
+            while True:
+                data = await reader.readline()
+                if not data:
+                    break
+                line = data.decode("utf-8").rstrip("\r\n")
+                if self.record:
+                    self._lock.acquire()
+                    try:
+                        self.received.append(line)
+                    finally:
+                        self._lock.release()
+                if self.on_line is not None:
+                    self.on_line(line)
+
+                command, _, rest = line.partition(" ")
+                if command == "NICK":
+                    nick = rest
+                    writer.write((":tmi.twitch.tv 001 %s :Welcome, GLHF!\r\n" % (nick)).encode("utf-8"))
+                elif command == "JOIN":
+                    for channel in rest.split(","):
+                        self._add_joined(writer, channel)
+                        writer.write((":%s!%s@%s.tmi.twitch.tv JOIN %s\r\n" % (nick, nick, nick, channel)).encode("utf-8"))
+                elif command == "PART":
+                    for channel in rest.split(","):
+                        self._joined[writer].discard(channel)
+                elif command == "PING":
+                    writer.write(("PONG %s\r\n" % (rest)).encode("utf-8"))
+                elif command == "PRIVMSG" and self.drop_chance and self._random.random() < self.drop_chance:
+                    self._lock.acquire()
+                    try:
+                        self.drops += 1
+                    finally:
+                        self._lock.release()
+                    writer.transport.abort()
+                    break
+        except (ConnectionError, ssl.SSLError):
+            pass
+        finally:
+            self._writers.remove(writer)
+            self._lock.acquire()
+            try:
+                del self._joined[writer]
+            finally:
+                self._lock.release()
+            writer.close()
+
+    def _add_joined(self, writer: Any, channel: str) -> None:
+        self._lock.acquire()
+        try:
+            self._joined[writer].add(channel)
+        finally:
+            self._lock.release()
+
+    def joined(self) -> List[List[str]]:
+        """
+        The channels each open connection has joined, chat sent to them
+        from here on reaches it
+        """
+
+        self._lock.acquire()
+        try:
+            return [sorted(channels) for channels in self._joined.values()]
+        finally:
+            self._lock.release()
+
+    def _broadcast(self, data: bytes) -> None:
+        for writer in self._writers:
+            writer.write(data)
+
+    def _send_to_channel(self, channel: str, data: bytes) -> None:
+        for writer in self._writers:
+            if channel in self._joined[writer]:
+                writer.write(data)
+
+    def send_raw(self, line: str) -> None:
+        """
+        Sends a protocol line to every connected client
+        """
+
+        self._loop.call_soon_threadsafe(self._broadcast, (line + "\r\n").encode("utf-8"))
+
+    def send_chat(self, channel: str, user: str, text: str, tags: str = "") -> None:
+        """
+        Sends a chat message as if user wrote it in channel, to the
+        clients that joined it
+        """
+
+        prefix = "@%s " % (tags) if tags else ""
+        line = "%s:%s!%s@%s.tmi.twitch.tv PRIVMSG %s :%s\r\n" % (prefix, user, user, user, channel, text)
+        self._loop.call_soon_threadsafe(self._send_to_channel, channel, line.encode("utf-8"))
+
+    def send_ping(self) -> None:
+        self.send_raw("PING :tmi.twitch.tv")
+
+    def send_reconnect(self) -> None:
+        """
+        Asks the clients to reconnect, like Twitch does before a restart
+        """
+
+        self.send_raw(":tmi.twitch.tv RECONNECT")
+
+    def drop_all(self) -> None:
+        """
+        Cuts every connection without a goodbye
+        """
+
+        def drop():
+            for writer in self._writers:
+                writer.transport.abort()
+        self._loop.call_soon_threadsafe(drop)
+
+    def lines(self, command: str = None) -> List[str]:
+        """
+        Returns the received lines, only those of one command if given
+        """
+
+        self._lock.acquire()
+        try:
+            if command is None:
+                return list(self.received)
+            return [line for line in self.received if line.split(" ", 1)[0] == command]
+        finally:
+            self._lock.release()
+
+# Load generator users are called this, heroes are named after their users
+USER_NAME = "viewer%i"
+_USER_PATTERN = re.compile(r"viewer\d+")
+
+class LoadGenerator:
+    """
+    Replays synthetic chat through a FakeIrcServer at a steady rate of
+    lines per second. mix maps command lines to their share of all lines,
+    the rest is plain chat. A user has at most one command waiting for a
+    reply at a time; replies are matched to it by the user's name, so
+    the mix should only hold commands whose reply names the user or the
+    hero (heroes named after their users). That gives end to end command
+    latency: from the line leaving the server to the reply coming back
+    """
+
+    def __init__(self, server: FakeIrcServer, channels: List[str], users: int = 1000, rate: float = 1000.0, mix: Dict[str, float] = None, seed: Any = None):
+        self.server = server
+        self.channels = channels
+        self.users = users
+        self.rate = rate
+        self.mix = mix if mix is not None else { "!char": 0.03, "!do attack": 0.02, "!help me": 0.01 }
+        self._random = random.Random(seed)
+
+        self._commands: List[Tuple[float, str]] = []
+        total = 0.0
+        for text, share in self.mix.items():
+            total += share
+            self._commands.append((total, text))
+
+        # Send time of the command each (channel, user) waits on
+        self._pending: Dict[Tuple[str, str], float] = {}
+        self.latencies: List[float] = []
+        self.lines = 0
+        self.commands = 0
+        self.elapsed = 0.0
+        self._future: Any = None
+
+    def start(self, duration: float) -> None:
+        """
+        Sends chat for duration seconds, on the server's event loop
+        """
+
+        self.server.on_line = self._on_line
+        self._future = asyncio.run_coroutine_threadsafe(self._run(duration), self.server._loop)
+
+    def wait(self, timeout: float = None) -> None:
+        """
+        Waits until all lines are sent
+        """
+
+        self._future.result(timeout)
+
+    def pending(self) -> int:
+        """
+        Commands still waiting for a reply
+        """
+
+        return len(self._pending)
+
+    async def _run(self, duration: float) -> None:
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        while True:
+            now = loop.time()
+            if now - start >= duration:
+                break
+            due = int((now - start) * self.rate) - self.lines
+            if due > 0:
+                batches: Dict[str, List[bytes]] = {}
+                for _ in range(due):
+                    channel, line = self._line(now)
+                    batches.setdefault(channel, []).append(line)
+                    self.lines += 1
+                for channel, lines in batches.items():
+                    self.server._send_to_channel(channel, b"".join(lines))
+            await asyncio.sleep(0.005)
+        self.elapsed = loop.time() - start
+
+    def _line(self, now: float) -> Tuple[str, bytes]:
+        channel = self.channels[self._random.randrange(len(self.channels))]
+        user = USER_NAME % (self._random.randrange(self.users))
+        text = "Kappa %i" % (self.lines)
+
+        roll = self._random.random()
+        for threshold, command in self._commands:
+            if roll < threshold:
+                key = (channel, user)
+                if key not in self._pending:
+                    self._pending[key] = now
+                    self.commands += 1
+                    text = command
+                break
+
+        return channel, (":%s!%s@%s.tmi.twitch.tv PRIVMSG %s :%s\r\n" % (user, user, user, channel, text)).encode("utf-8")
+
+    def _on_line(self, line: str) -> None:
+        command, _, rest = line.partition(" ")
+        if command != "PRIVMSG":
+            return
+        channel, _, text = rest.partition(" :")
+        now = self.server._loop.time()
+        for part in text.split(" | "):
+            match = _USER_PATTERN.search(part)
+            if match is None:
+                continue
+            sent = self._pending.pop((channel, match.group(0)), None)
+            if sent is not None:
+                self.latencies.append(now - sent)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Lines and commands sent, replies matched and latency percentiles in ms
+        """
+
+        latencies = sorted(self.latencies)
+        result: Dict[str, Any] = {
+            "lines": self.lines,
+            "commands": self.commands,
+            "replies": len(latencies),
+            "unanswered": len(self._pending),
+            "seconds": self.elapsed,
+        }
+        for name, fraction in (("p50", 0.5), ("p90", 0.9), ("p99", 0.99), ("max", 1.0)):
+            if latencies:
+                result[name] = latencies[min(int(len(latencies) * fraction), len(latencies) - 1)] * 1000
+            else:
+                result[name] = 0.0
+        return result
@@ -1,12 +1,293 @@
+import heapq
+import random
+import time
+from threading import Condition, Lock, Thread
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from classes import ClassRegistry
+from catalog import ChatError, DEFAULT_LOCALE, MessageCatalog
+from combat import Combatants, TickResult, resolve, ACTION_ATTACK, ACTION_HEAL, ACTION_RUN
+from npcs import DEFAULT_TABLE, Npc, NpcRegistry
+
+# What players can do in a running game with '!do <action>'
+GAME_ACTIONS = { "attack": ACTION_ATTACK, "heal": ACTION_HEAL, "run": ACTION_RUN }
 
 class Game:
     """
-    Main game class. Manages the game.
+    Main game class. Manages the game of one channel: an NPC from a spawn
+    table shows up, heroes announce what they do with '!do' during a tick,
+    all of it is resolved at once when the tick ends and the channel gets
+    a single summary message
     """
-    
-    def start_new(self):
+
+    def __init__(self, send: Callable[[str], Any] = None, save: Callable[[List[Tuple[str, Any]]], Any] = None, tick: float = 5.0, seed: Any = None, render: Callable[..., str] = None):
+        self.send = send
+        # Gets the (user, character) pairs of a game that ended, all at once
+        self.save = save
+        # Turns message ids into text, the channel's locale if it gives one
+        self.render = render if render is not None else _render_default
+        self.tick_length = tick
+        self.running = False
+        # Fights can be replayed exactly from the seed
+        self.seed = seed if seed is not None else random.getrandbits(64)
+        # Picks the NPCs, the same seed spawns the same ones
+        self._random = random.Random(self.seed)
+        # None lets combat.resolve pick NumPy for big fights if it is installed
+        self.use_numpy: Any = None
+
+        self._lock = Lock()
+        self._intents: Dict[int, int] = {}
+        self.combatants = Combatants()
+        self.tick = 0
+        # Respawned for every fight, not created again
+        self.boss = Npc()
+        # Tells ticks of an earlier game apart from the current one
+        self.generation = 0
+
+    @property
+    def boss_hp(self) -> int:
+        return self.boss.hp
+
+    @property
+    def boss_max_hp(self) -> int:
+        return self.boss.max_hp
+
+    def start_new(self, boss_hp: Any = None, schedule: bool = True, table: str = DEFAULT_TABLE, npc: Any = None) -> None:
+        """
+        Starts a new game (existing chars can join) against an NPC picked
+        from the spawn table, or the given NpcTemplate. boss_hp overrides
+        the hp the NPC comes with
+        """
+
+        template = npc if npc is not None else NpcRegistry().table(table).sample(self._random)
+
+        self._lock.acquire()
+        try:
+            if self.running:
+                raise ChatError("game.already_running")
+            self.running = True
+            self.generation += 1
+            self._intents = {}
+            self.combatants = Combatants()
+            self.tick = 0
+            self.boss.spawn(template, boss_hp)
+        finally:
+            self._lock.release()
+
+        if schedule:
+            TickScheduler().schedule(self, self.tick_length)
+
+    def stop(self) -> None:
+        """
+        Ends the game without a winner, heroes keep what they have
+        """
+
+        self._lock.acquire()
+        try:
+            if not self.running:
+                raise ChatError("game.not_running")
+            heroes = self._finish(False)
+        finally:
+            self._lock.release()
+        self._save(heroes)
+
+    def submit(self, user: str, char: Any, action: str) -> None:
+        """
+        Records what a hero does this tick (the last command counts),
+        joining the game on the first one
+        """
+
+        if action not in GAME_ACTIONS:
+            raise ChatError("game.cannot", name=char.name, action=action)
+
+        self._lock.acquire()
+        try:
+            if not self.running:
+                raise ChatError("game.not_running")
+            row = self.combatants.rows.get(user)
+            if row is None:
+                if char.hp <= 0:
+                    raise ChatError("game.too_weak", name=char.name)
+                row = self.combatants.add(user, char)
+            elif not self.combatants.alive[row]:
+                raise ChatError("game.out", name=char.name)
+            self._intents[row] = GAME_ACTIONS[action]
+        finally:
+            self._lock.release()
+
+    def remove(self, user: str) -> None:
         """
-        Starts a new game (existing chars can join)
+        Takes a user's hero out of the running game, it is not written
+        back when the game ends. For heroes that were killed meanwhile
         """
 
-        pass
+        self._lock.acquire()
+        try:
+            c = self.combatants
+            row = c.rows.pop(user, None)
+            if row is not None:
+                c.alive[row] = 0
+                c.chars[row] = None
+                self._intents.pop(row, None)
+        finally:
+            self._lock.release()
+
+    def resolve_tick(self) -> Optional[str]:
+        """
+        Resolves every action of the tick in one batch and returns the
+        summary for the channel (None if nobody did anything)
+        """
+
+        heroes: List[Tuple[str, Any]] = []
+        self._lock.acquire()
+        try:
+            if not self.running:
+                return None
+            intents = self._intents
+            self._intents = {}
+            if not intents:
+                return None
+            self.tick += 1
+
+            damage_table, heal_table = _class_tables()
+            boss = self.boss
+            boss.hp, result = resolve(self.combatants, intents, damage_table, heal_table,
+                boss.hp, self.seed, self.tick, self.use_numpy, boss.template.damage, boss.template.hit_threshold)
+            summary = self._summary(result)
+
+            if boss.hp <= 0:
+                heroes = self._finish(True)
+                summary += " " + self.render("game.won", npc=self.render(boss.template.message_id))
+            elif not any(self.combatants.alive):
+                heroes = self._finish(False)
+                summary += " " + self.render("game.lost", npc=self.render(boss.template.message_id))
+        finally:
+            self._lock.release()
+        self._save(heroes)
+        return summary
+
+    def _summary(self, r: TickResult) -> str:
+        render = self.render
+        parts = []
+        if r.attackers:
+            parts.append(render("game.round_attack", count=r.attackers, damage=r.damage))
+        if r.healers:
+            parts.append(render("game.round_heal", count=r.healers, healed=r.healed))
+        if r.fled:
+            parts.append(render("game.round_flee", count=r.fled))
+        if r.hits:
+            parts.append(render("game.round_hits", count=r.hits))
+        if r.fallen:
+            parts.append(render("game.round_fall", count=r.fallen))
+        events = ", ".join(parts) or render("game.round_nothing")
+        return render("game.round", tick=r.tick, events=events, hp=self.boss_hp, max_hp=self.boss_max_hp)
+
+    def _finish(self, won: bool) -> List[Tuple[str, Any]]:
+        """
+        Writes the outcome back to the characters and returns them with
+        their users for _save. Lock must be held
+        """
+
+        self.running = False
+        heroes = []
+        c = self.combatants
+        for row in range(len(c)):
+            char = c.chars[row]
+            if char is None:
+                # Removed from the game
+                continue
+            # Fallen heroes make it home with their last breath
+            char.hp = max(c.hp[row], 1)
+            # xp for every round the fight lasted, tougher NPCs give more
+            char.xp += self.tick * self.boss.template.xp
+            if won and c.alive[row]:
+                char.level += 1
+            heroes.append((c.users[row], char))
+        return heroes
+
+    def _save(self, heroes: List[Tuple[str, Any]]) -> None:
+        """
+        Hands the heroes of a game that ended to save in one batch. Not
+        under the lock: saving waits for the journal, the tick thread of
+        every channel must not
+        """
+
+        if heroes and self.save is not None:
+            self.save(heroes)
+
+def _render_default(message_id: str, **values: Any) -> str:
+    return MessageCatalog().render(DEFAULT_LOCALE, message_id, **values)
+
+def _class_tables():
+    """
+    Damage and heal power indexed by class id
+    """
+
+    registry = ClassRegistry()
+    size = registry.max_id() + 1
+    damage = [0] * size
+    heal = [0] * size
+    for name in registry.names():
+        hero_class = registry.get(name)
+        damage[hero_class.id] = hero_class.damage
+        heal[hero_class.id] = hero_class.heal
+    return damage, heal
+
+class TickScheduler():
+    """
+    One thread that ends the ticks of all running games, whatever number of
+    channels there are. Games are kept in a heap ordered by when their
+    current tick ends
+    """
+
+    _instance: Any = None
+
+    def __new__(self):
+        if self._instance == None:
+            self._instance = super(TickScheduler, self).__new__(self)
+            self._heap: List[Any] = []
+            self._counter = 0
+            self._condition = Condition()
+            self._thread: Any = None
+
+        return self._instance
+
+    def schedule(self, game: Game, delay: float) -> None:
+        """
+        Ends the current tick of game after delay seconds
+        """
+
+        self._condition.acquire()
+        try:
+            self._counter += 1
+            heapq.heappush(self._heap, (time.monotonic() + delay, self._counter, game, game.generation))
+            if self._thread is None:
+                self._thread = Thread(target=self._run, name="GameTickThread", daemon=True)
+                self._thread.start()
+            self._condition.notify()
+        finally:
+            self._condition.release()
+
+    def _run(self) -> None:
+        while True:
+            self._condition.acquire()
+            try:
+                while not self._heap or self._heap[0][0] > time.monotonic():
+                    timeout = self._heap[0][0] - time.monotonic() if self._heap else None
+                    self._condition.wait(timeout)
+                _, _, game, generation = heapq.heappop(self._heap)
+            finally:
+                self._condition.release()
+
+            if game.generation != generation:
+                # That game was stopped and a new one started since
+                continue
+
+            try:
+                summary = game.resolve_tick()
+                if summary is not None and game.send is not None:
+                    game.send(summary)
+            except Exception as e:
+                print('[!] GAME TICK FAILED: ' + str(e))
+
+            if game.running:
+                self.schedule(game, game.tick_length)
@@ -0,0 +1,236 @@
+from channel import get_channel
+from chatlog import ChatLogger
+from character import Character
+from commands import CommandRouter
+from game import GAME_ACTIONS
+from npcs import DEFAULT_TABLE
+
+# IMPORTANT:
+# The HANDLERS variable has to contain names of the
+# functions that take one IrcMessage argument and
+# return either nothing, or built-in type None
+#
+# Chat commands are not handlers of their own, they are
+# registered with the router below which looks them up
+# by name, so lines that are no command return right away
+#
+# Command functions take the message and the list of
+# arguments after the command (or subcommand). Every
+# channel has its own context (characters, game),
+# commands look it up by the channel of the message
+#
+# Replies are ids of messages.json, ctx.say renders
+# them in the locale of the channel
+
+# Heroes listed by !top without and at most with a count
+TOP_DEFAULT = 5
+TOP_MAX = 10
+
+# Section for defining handler functions
+def log_handler(msg):
+    # Queued for the chat log, written by its own thread
+    ChatLogger().log(msg)
+
+# Section for defining command functions
+def help_command(msg, parts):
+    """
+    The parser for !help messages to the bot
+    """
+
+    ctx = get_channel(msg.channel)
+
+    # Parse sub category for !help
+    if len(parts) == 0:
+        ctx.say("help.index")
+    elif parts[0] == "char":
+        ctx.say("help.char")
+    elif parts[0] == "game":
+        ctx.say("help.game")
+    elif parts[0] == "do":
+        ctx.say("help.do")
+    else:
+        ctx.say("help.unknown", user=msg.nick, topic=parts[0])
+
+def char_command(msg, parts):
+    """
+    The parser for !char messages to the bot without a known subcommand
+    """
+
+    user = msg.nick
+    ctx = get_channel(msg.channel)
+
+    if len(parts) == 0:
+        # Get character if there is one available
+        char = ctx.get_character(user)
+        if char == None:
+            ctx.say("char.none", user=user)
+        else:
+            ctx.say("char.summary", hero=str(char), level=char.level, hp=char.hp, max_hp=char.max_hp)
+    else:
+        ctx.say("char.unknown", user=user, command=parts[0])
+
+def char_create_command(msg, parts):
+    """
+    The parser for !char create messages to the bot
+    """
+
+    user = msg.nick
+    ctx = get_channel(msg.channel)
+
+    if len(parts) != 3:
+        ctx.say("char.create_usage", user=user)
+        return
+    name = parts[0]
+    gender = parts[1].lower()
+    class_name = parts[2].lower()
+    try:
+        ctx.add_character(user, Character(name, class_name, gender))
+        ctx.say("char.created", name=name)
+    except RuntimeError as e:
+        ctx.say_error(user, e)
+
+def char_kill_command(msg, parts):
+    """
+    The parser for !char kill (or delete) messages to the bot
+    """
+
+    user = msg.nick
+    ctx = get_channel(msg.channel)
+    char = ctx.get_character(user)
+
+    try:
+        ctx.kill_character(user)
+        ctx.say("char.killed", hero=str(char))
+    except RuntimeError as e:
+        ctx.say_error(user, e)
+
+def do_command(msg, parts):
+    """
+    The parser for !do messages to the bot
+    """
+
+    user = msg.nick
+    ctx = get_channel(msg.channel)
+
+    # Get character if there is one available
+    char = ctx.get_character(user)
+
+    if char == None:
+        ctx.say("char.none", user=user)
+    elif ctx.game.running and len(parts) > 0 and parts[0] in GAME_ACTIONS and parts[0] in char.Class.actions:
+        # Resolved with everybody else's at the end of the round
+        try:
+            ctx.game.submit(user, char, parts[0])
+        except RuntimeError as e:
+            ctx.say_error(user, e)
+    else:
+        try:
+            # Only says what the hero does, nothing about it changes
+            ctx.send(char.do(parts, ctx.locale))
+        except RuntimeError as e:
+            ctx.say_error(user, e)
+
+def top_command(msg, parts):
+    """
+    The parser for !top messages to the bot, lists the best heroes
+    of the channel
+    """
+
+    ctx = get_channel(msg.channel)
+    count = min(int(parts[0]), TOP_MAX) if len(parts) > 0 and parts[0].isdigit() and int(parts[0]) > 0 else TOP_DEFAULT
+
+    top = ctx.leaderboard.top(count)
+    if len(top) == 0:
+        ctx.say("top.none")
+        return
+    heroes = ", ".join(ctx.render("top.entry", rank=rank, user=user, level=level, class_name=class_name, xp=xp)
+        for rank, (user, (level, class_name, hp, xp)) in enumerate(top, 1))
+    ctx.say("top.list", heroes=heroes)
+
+def rank_command(msg, parts):
+    """
+    The parser for !rank messages to the bot, the place of the
+    sender's hero on the leaderboard of the channel
+    """
+
+    user = msg.nick
+    ctx = get_channel(msg.channel)
+
+    rank = ctx.leaderboard.rank(user)
+    if rank == None:
+        ctx.say("char.none", user=user)
+    else:
+        place, total, (level, class_name, hp, xp) = rank
+        ctx.say("rank.show", user=user, rank=place, total=total, level=level, xp=xp)
+
+def game_command(msg, parts):
+    """
+    The parser for !game messages to the bot
+    """
+
+    user = msg.nick
+    ctx = get_channel(msg.channel)
+    game = ctx.game
+
+    if len(parts) == 0:
+        if game.running:
+            ctx.say("game.status", heroes=len(game.combatants), npc=ctx.render(game.boss.template.message_id),
+                hp=game.boss_hp, max_hp=game.boss_max_hp)
+        else:
+            ctx.say("game.status_none")
+        return
+
+    # Check for privileges (owner, mod)
+    if not is_privileged(msg):
+        ctx.say("game.privileged", user=user)
+        return
+
+    # Run game
+    try:
+        if parts[0] == "start":
+            # '!game start [spawn table | boss hp]'
+            table, boss_hp = DEFAULT_TABLE, None
+            if len(parts) > 1:
+                if parts[1].isdigit():
+                    boss_hp = int(parts[1])
+                    if boss_hp < 1:
+                        ctx.say("game.start_usage", user=user)
+                        return
+                else:
+                    table = parts[1].lower()
+            game.start_new(boss_hp, table=table)
+            ctx.say("game.started", npc=ctx.render(game.boss.template.message_id), hp=game.boss_max_hp)
+        elif parts[0] == "stop":
+            game.stop()
+            ctx.say("game.stopped")
+        else:
+            ctx.say("game.unknown", user=user, command=parts[0])
+    except RuntimeError as e:
+        ctx.say_error(user, e)
+
+def is_privileged(msg):
+    """
+    Checks if the sender is the broadcaster or a moderator of the channel
+    """
+
+    if msg.nick == msg.channel[1:]:
+        return True
+    tags = msg.tags
+    return tags.get("mod") == "1" or "broadcaster/" in tags.get("badges", "")
+
+# Registering commands with the router
+router = CommandRouter("!")
+router.register("help", help_command)
+router.register("char", char_command)
+router.register_subcommand("char", "create", char_create_command)
+router.register_subcommand("char", "kill", char_kill_command, aliases=["delete"])
+router.register("do", do_command)
+router.register("game", game_command)
+router.register("top", top_command)
+router.register("rank", rank_command)
+
+# HANDLERS variable has to be below handler functions
+HANDLERS = [
+    log_handler,
+    router
+]
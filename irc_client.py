@@ -1,12 +1,49 @@
-import socket
-from threading import Thread, Lock
-from typing import Callable, List, Any
-import certifi
+import asyncio
+import inspect
+import random
+import traceback
+from threading import Thread, Lock, get_ident
+from typing import Callable, Dict, List, Any, Union
 import ssl
+import time
+import metrics
+from irc_message import IrcMessage, LineFramer, parse_message
+from pipeline import InboundQueue, StageStats
+from rate_limit import CHANNELS_PER_LINE, OutboundQueue, TokenBucket, PRIORITY_NORMAL
+from workers import KeyedExecutor
+
+
+# Reconnect delays grow from _BACKOFF_BASE up to _BACKOFF_MAX seconds, a random
+# part of it is used so many bots don't come back in the same instant
+_BACKOFF_BASE = 1.0
+_BACKOFF_MAX = 60.0
+# A connection that lasted this long resets the backoff
+_HEALTHY_AFTER = 30.0
+# Twitch pings every five minutes, silence for longer means a dead connection
+_IDLE_TIMEOUT = 360.0
+_CONNECT_TIMEOUT = 30.0
+
+# Lines taken from the inbound queue at once; after each batch the event
+# loop gets to read from the socket and send again
+_INBOUND_BATCH = 200
+# How often a full handler queue is checked for room, in seconds
+_DISPATCH_POLL = 0.005
 
 class IrcClient():
     """
-    Class for connecting to Twitch's IRC chat server. Uses socket with SSL functionality
+    Class for connecting to Twitch's IRC chat server. The connection is driven by
+    an asyncio event loop running in its own thread, so reading from the socket
+    never waits for message handlers to finish. Incoming lines are parsed once
+    and handlers get the resulting IrcMessage.
+
+    Received lines pass through bounded stages (recv and frame, parse,
+    filter, dispatch). When the handlers fall behind, plain chat is shed
+    first; PING is always answered and commands are never dropped, reading
+    from the socket pauses for them instead.
+
+    Once connected the client stays connected: if the server goes away or
+    asks for it (RECONNECT) it logs in again with backoff and rejoins all
+    channels. Handlers and queued outbound messages are kept meanwhile
     """
 
     _instance: Any = None
@@ -19,56 +56,98 @@ class IrcClient():
             self._port: int
             self._user: str
             self._oauth: str
-            self._channel: str
-
-            self._connection: Any = None
+            self._use_ssl = True
+            self._ca_file: Any = None
+            # Made on the first connection, reconnects use it again
+            self._ssl_context: Any = None
+            # Called once by the first message, see set_handler_loader
+            self._handler_loader: Any = None
+            # Why the loader failed, every later load_handlers() raises it
+            self._handler_load_error = ""
+            self._handler_loader_lock = Lock()
+            self._channels: List[str] = []
+
+            self._loop: Any = None
+            self._transport: Any = None
+            self._closed: Any = None
+            self._sender_task: Any = None
+            self._sender_wakeup: Any = None
+            self._supervisor_task: Any = None
+            self._stopping = False
+            self._reconnect_requested = False
+            self._last_received = 0.0
+            self._reconnects = 0
+            self._throttle: Any = None
+
+            # Twitch allows 20 chat messages per 30 seconds (100 as moderator)
+            self._outbound = OutboundQueue(TokenBucket.for_limit(20, 30))
+            self._message_thread: Any = None
+            self._handler_executor: Any = None
+            self._handler_workers = 4
 
             self._connection_lock = Lock()
-            self._send_lock = Lock()
             self._message_handlers_lock = Lock()
 
-            self._message_handlers: List[Callable[[str], None]] = []
+            self._message_handlers: List[Callable[[IrcMessage], Any]] = []
+
+            # Received lines go through stages: the protocol frames them,
+            # answers PINGs and queues the rest (recv, frame), _drain_inbound
+            # parses, filters and dispatches them to the handlers in batches
+            self._inbound = InboundQueue()
+            self._drain_scheduled = False
+            # Lines are held back while this many handler tasks are pending
+            self._handler_queue_limit = 1000
+            self._reading_paused = False
+            self._recv_stats: Dict[str, int] = { "bytes": 0, "lines": 0, "pings": 0, "pauses": 0 }
+            self._stages: Dict[str, StageStats] = { "parse": StageStats(), "filter": StageStats(), "dispatch": StageStats() }
+            self._filtered = 0
+            self._held_back = 0
 
         return self._instance
 
     def __del__(self):
-        if self._connection is not None:
+        if self._loop is not None:
             self.disconnect()
-    
-    def connect(self, host: str, port: int, user: str, oauth: str, channel: str) -> None:
+
+    def connect(self, host: str, port: int, user: str, oauth: str, channel: Union[str, List[str]], use_ssl: bool = True) -> None:
         """
-        Connects to the IRC chat using socket, saves socket object to self._connection
-        SSL certificated provided by certifi module
+        Starts the event loop thread and connects to the IRC chat using
+        asyncio streams. SSL certificates provided by certifi module.
+        channel can be a single channel or a list, all of them share
+        the one connection. Only the first attempt can fail, after it
+        the connection is kept up by _supervise
         """
 
         self._connection_lock.acquire()
-        
-        try:
-            if self._connection is None:
-                self._connection = socket.socket()
-                self._connection = ssl.wrap_socket(self._connection,
-                    ca_certs=certifi.where(),
-                    server_side=False)
-
-                try:
-                    self._connection.connect((host, port))
-                except socket.gaierror:
-                    raise RuntimeError("Connection attempt failed")
-
-                self._connection.send(f'PASS {oauth}\r\n'.encode('utf-8'))
-                self._connection.send(f'NICK {user}\r\n'.encode('utf-8'))
-                self._connection.send(f'USER {user} {host} : {user}\r\n'.encode('utf-8'))
-                self._connection.send(f'JOIN {channel}\r\n'.encode('utf-8'))
 
+        try:
+            if self._loop is None:
                 self._host = host
                 self._port = port
                 self._user = user
                 self._oauth = oauth
-                self._channel = channel
-
-                self._message_thread = Thread(target=self._message_loop, name="IrcMessageThread")
+                self._channels = [channel] if isinstance(channel, str) else list(channel)
+                self._use_ssl = use_ssl
+                self._stopping = False
+
+                self._loop = asyncio.new_event_loop()
+                # Sync handlers run here, messages of the same user in order
+                self._handler_executor = KeyedExecutor(self._handler_workers, "IrcHandlerThread")
+                self._message_thread = Thread(target=self._loop.run_forever, name="IrcMessageThread")
                 self._message_thread.start()
 
+                try:
+                    asyncio.run_coroutine_threadsafe(self._open(), self._loop).result()
+                except (OSError, asyncio.TimeoutError):
+                    # Before Python 3.11 a timeout is not an OSError
+                    self._stop_loop()
+                    raise RuntimeError("Connection attempt failed")
+                except Exception:
+                    self._stop_loop()
+                    raise
+
+                self._loop.call_soon_threadsafe(self._start_supervisor)
+
             else:
                 raise RuntimeError('The client is already connected')
         finally:
@@ -76,100 +155,591 @@ class IrcClient():
 
     def disconnect(self) -> None:
         """
-        Performs safe disconnect informing host about it
-        _connection should be None after that
+        Performs safe disconnect informing host about it, then stops
+        the event loop thread. _transport should be None after that
         """
 
         self._connection_lock.acquire()
-        connection = self._connection
-        self._connection = None
-        self._connection_lock.release()
-
-        if connection is not None:
-            connection.send(f'PART {self._channel}\r\n'.encode('utf-8'))
-            connection.shutdown(socket.SHUT_RDWR)
-            connection.close()
-        else:
-            raise RuntimeError('The client is not connected')
+        try:
+            if self._loop is None:
+                raise RuntimeError('The client is not connected')
+
+            self._stopping = True
+            asyncio.run_coroutine_threadsafe(self._close(), self._loop).result()
+            self._stop_loop()
+        finally:
+            self._connection_lock.release()
 
-        if self._message_thread is not None:
-            self._message_thread.join()
-        else:
-            raise RuntimeError('The message thread is not running')
-    
     def is_connected(self) -> bool:
         """
         Checks if connection is established, returns boolean
         """
 
-        if self._connection is None:
+        if self._transport is None:
             return False
         else:
             return True
-    
-    def _send_data(self, data) -> None:
+
+    async def _open(self) -> None:
+        """
+        Opens the SSL connection and sends the login sequence, from then on
+        _IrcProtocol feeds received lines to _receive_line. Runs on the event loop
+        """
+
+        context = self._get_ssl_context() if self._use_ssl else None
+        self._closed = self._loop.create_future()
+        self._reading_paused = False
+        self._transport, _ = await asyncio.wait_for(self._loop.create_connection(
+            lambda: _IrcProtocol(self), self._host, self._port, ssl=context), _CONNECT_TIMEOUT)
+        self._last_received = self._loop.time()
+
+        # Tags carry badges (mod, vip) and RECONNECT comes with the commands capability
+        self._write(b'CAP REQ :twitch.tv/tags twitch.tv/commands\r\n')
+        self._write(f'PASS {self._oauth}\r\n'.encode('utf-8'))
+        self._write(f'NICK {self._user}\r\n'.encode('utf-8'))
+        self._write(f'USER {self._user} {self._host} : {self._user}\r\n'.encode('utf-8'))
+        # Paced by the JOIN limit, a reconnect with hundreds of channels
+        # would otherwise have most of them ignored
+        self._outbound.push_joins(self._channels, restart=True)
+
+        self._sender_wakeup = asyncio.Event()
+        self._sender_task = self._loop.create_task(self._send_loop())
+
+    def _get_ssl_context(self) -> Any:
+        """
+        The SSL context of the connection. Reading the certificate bundle
+        takes longer than the rest of a connect, so it is only done once
+        """
+
+        if self._ssl_context is None:
+            if self._ca_file is not None:
+                cafile = self._ca_file
+            else:
+                # Only needed to find the bundle, not for anything else
+                import certifi
+                cafile = certifi.where()
+            self._ssl_context = ssl.create_default_context(cafile=cafile)
+        return self._ssl_context
+
+    async def _close(self) -> None:
         """
-        Sends raw data taking into account connection/packet limitations
+        Parts the channels and closes the connection. Runs on the event loop
         """
 
-        self._send_lock.acquire()
+        if self._supervisor_task is not None:
+            self._supervisor_task.cancel()
+            self._supervisor_task = None
+        self._stop_sender()
 
+        if self._transport is None:
+            # In the middle of reconnecting
+            return
+
+        for command in _join_commands('PART', self._channels):
+            self._write(command)
+        self._transport.close()
         try:
-            data_sent = 0
-            while data_sent < len(data):
-                data_sent += self._connection.send(data[data_sent:])
-        finally:
-            self._send_lock.release()
+            await asyncio.wait_for(asyncio.shield(self._closed), 5)
+        except asyncio.TimeoutError:
+            # The server never finished the SSL shutdown
+            if self._transport is not None:
+                self._transport.abort()
+
+    def _connection_lost(self, exc: Any) -> None:
+        """
+        Called by the protocol once the connection is gone
+        """
+
+        self._transport = None
+        # Whatever is still queued waits for the next connection
+        self._stop_sender()
+        if self._closed is not None and not self._closed.done():
+            self._closed.set_result(exc)
+
+    def _stop_sender(self) -> None:
+        if self._sender_task is not None:
+            self._sender_task.cancel()
+            self._sender_task = None
+
+    def _start_supervisor(self) -> None:
+        self._supervisor_task = self._loop.create_task(self._supervise())
+
+    async def _supervise(self) -> None:
+        """
+        Waits for the connection to end and opens a new one unless the
+        client is stopping. Delays grow exponentially with full jitter,
+        a RECONNECT from the server is followed right away
+        """
+
+        attempt = 0
+        while not self._stopping:
+            opened_at = self._loop.time()
+            await self._wait_closed()
+            if self._stopping:
+                return
+            if self._loop.time() - opened_at >= _HEALTHY_AFTER:
+                attempt = 0
+            print('[!] CONNECTION LOST')
+
+            while not self._stopping:
+                if self._reconnect_requested:
+                    self._reconnect_requested = False
+                    delay = 0.0
+                else:
+                    delay = random.uniform(0, min(_BACKOFF_MAX, _BACKOFF_BASE * 2 ** attempt))
+                    attempt += 1
+                print('[i] RECONNECTING IN %.1f S' % (delay))
+                await asyncio.sleep(delay)
+
+                try:
+                    await self._open()
+                except (OSError, asyncio.TimeoutError) as e:
+                    print('[!] RECONNECT FAILED: ' + (str(e) or type(e).__name__))
+                    continue
+                except Exception:
+                    # Whatever it was, giving up would leave the bot offline for good
+                    print('[!] RECONNECT FAILED:')
+                    traceback.print_exc()
+                    continue
+                self._reconnects += 1
+                metrics.RECONNECTS.inc()
+                print('[i] RECONNECTED TO: ' + ", ".join(self._channels))
+                break
+
+    async def _wait_closed(self) -> None:
+        """
+        Returns once the connection is closed, aborts it if the server has
+        been silent for too long
+        """
+
+        while True:
+            try:
+                await asyncio.wait_for(asyncio.shield(self._closed), _IDLE_TIMEOUT / 4)
+                return
+            except asyncio.TimeoutError:
+                if self._loop.time() - self._last_received > _IDLE_TIMEOUT and self._transport is not None:
+                    self._transport.abort()
+
+    def _stop_loop(self) -> None:
+        """
+        Stops the event loop, joins its thread and waits for queued sync handlers
+        """
+
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._message_thread.join()
+        self._loop.close()
+        self._handler_executor.shutdown(wait=True)
+
+        self._loop = None
+        self._transport = None
+        self._closed = None
+        self._message_thread = None
+        self._handler_executor = None
+        self._drain_scheduled = False
 
-    def _message_loop(self) -> None:
+    def _write(self, data: bytes) -> None:
         """
-        Waits for message data to be recieved, after that
-        calls _process_message
+        Writes raw data to the connection. Must be called on the event loop
         """
 
-        buffer = ""
-        while self._connection is not None:
-            message_end = buffer.find('\r\n')
-            if message_end == -1:
-                buffer += self._connection.recv(1024).decode('utf-8')
+        if self._transport is not None:
+            self._transport.write(data)
+
+    def _send_data(self, data: bytes) -> None:
+        """
+        Sends raw protocol data ahead of all chat messages. Safe to call from
+        any thread, the write itself happens on the event loop so the caller
+        never waits on the socket
+        """
+
+        if self._loop is None:
+            raise RuntimeError('The client is not connected')
+
+        self._outbound.push_control(data)
+        self._wake_sender()
+
+    def _wake_sender(self) -> None:
+        """
+        Tells _send_loop there is something new in the outbound queue
+        """
+
+        loop = self._loop
+        wakeup = self._sender_wakeup
+        if loop is None or wakeup is None:
+            return
+
+        if self._message_thread is not None and self._message_thread.ident == get_ident():
+            wakeup.set()
+        else:
+            loop.call_soon_threadsafe(wakeup.set)
+
+    async def _send_loop(self) -> None:
+        """
+        Writes queued lines as fast as the rate limit allows, sleeping until
+        a token is free or something new is queued
+        """
+
+        while True:
+            self._sender_wakeup.clear()
+            data, wait = self._outbound.pop()
+            if data is not None:
+                self._write(data)
+            elif wait is None:
+                await self._sender_wakeup.wait()
             else:
-                message = buffer[:message_end]
-                buffer = buffer[message_end + 2:]
-                self._process_message(message)
+                try:
+                    await asyncio.wait_for(self._sender_wakeup.wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+
+    def set_rate_limit(self, messages: int, period: float) -> None:
+        """
+        Sets how many chat messages may be sent in any window of period
+        seconds, use 100 per 30 seconds if the bot is a moderator
+        """
+
+        self._outbound.bucket = TokenBucket.for_limit(messages, period)
+
+    def set_join_rate_limit(self, channels: int, period: float) -> None:
+        """
+        Sets how many channels may be joined in any window of period
+        seconds, Twitch allows 20 per 10 seconds (2000 for verified bots)
+        """
+
+        self._outbound.join_bucket = TokenBucket.for_limit(channels, period)
 
-    def send_message(self, message: str) -> None:
+    def set_ca_file(self, ca_file: str) -> None:
         """
-        Wraps a string in IRC specific stuff, also encodes to UTF-8 to
-        be sent using _send_raw
+        Trusts the certificates in ca_file instead of certifi's bundle, for
+        test servers with their own certificate. None goes back to certifi
         """
 
-        if self._connection is None:
+        self._ca_file = ca_file
+        self._ssl_context = None
+
+    def set_throttle(self, throttle: Any) -> None:
+        """
+        Sets the CommandThrottle that commands must pass before any handler
+        sees them, None turns throttling off
+        """
+
+        self._throttle = throttle
+
+    def get_throttle_stats(self) -> Dict[str, Any]:
+        """
+        Returns the throttle's counters
+        """
+
+        if self._throttle is None:
+            raise RuntimeError('Throttling is off')
+        return self._throttle.stats()
+
+    def set_handler_workers(self, workers: int) -> None:
+        """
+        Sets how many threads run sync handlers, takes effect on the next connect
+        """
+
+        self._handler_workers = workers
+
+    def get_handler_stats(self) -> Dict[str, Any]:
+        """
+        Returns handler queue latency percentiles (ms) and task counters
+        """
+
+        if self._handler_executor is None:
             raise RuntimeError('The client is not connected')
+        return self._handler_executor.stats()
+
+    def set_inbound_limits(self, queue: int, handler_queue: int = 1000) -> None:
+        """
+        Sets how many received lines may wait to be parsed before chat is
+        shed (commands and server lines keep coming until twice as many,
+        then reading stops for a while) and how many handler tasks may be
+        pending before lines are held back in that queue
+        """
 
-        self._send_data(f'PRIVMSG {self._channel} :{message}\r\n'.encode('utf-8'))
+        if handler_queue < 1:
+            raise RuntimeError("The handler queue needs room for at least one task")
+        self._inbound.set_limits(queue)
+        self._handler_queue_limit = handler_queue
 
-    def _process_message(self, message) -> None:
+    def get_pipeline_stats(self) -> Dict[str, Dict[str, Any]]:
         """
-        Checks if the message was user-sent and calls all handlers using that message
+        Returns counters, timings (us per line, ms for the slowest batch)
+        and queue depths of every stage a received line goes through
+        """
+
+        stages: Dict[str, Dict[str, Any]] = {}
+        stages["recv"] = dict(self._recv_stats, paused=self._reading_paused)
+        stages["queue"] = self._inbound.stats()
+        for name, stage in self._stages.items():
+            stages[name] = stage.stats()
+        stages["filter"]["dropped"] = self._filtered
+        stages["dispatch"]["held_back"] = self._held_back
+        if self._handler_executor is not None:
+            stages["handlers"] = self._handler_executor.stats()
+        return stages
+
+    def get_reconnect_count(self) -> int:
+        """
+        Returns how many times the connection was lost and opened again
+        """
+
+        return self._reconnects
+
+    def get_outbound_stats(self) -> Dict[str, Any]:
         """
-        if message[:4] == "PING":
-            self._send_data(f'PONG {message[4:]}\r\n'.encode('utf-8'))
+        Returns outbound queue depth, sent, dropped and coalesced counters
+        """
+
+        return self._outbound.stats()
+
+    def join(self, channel: str) -> None:
+        """
+        Joins another channel over the existing connection
+        """
+
+        if self._loop is None:
+            raise RuntimeError('The client is not connected')
+        if channel in self._channels:
+            raise RuntimeError('Already joined %s' % (channel))
+
+        self._channels.append(channel)
+        self._outbound.push_joins([channel])
+        self._wake_sender()
+
+    def part(self, channel: str) -> None:
+        """
+        Leaves a channel, the connection stays open for the others
+        """
+
+        if self._loop is None:
+            raise RuntimeError('The client is not connected')
+        if channel not in self._channels:
+            raise RuntimeError('Not joined to %s' % (channel))
+
+        self._channels.remove(channel)
+        self._outbound.cancel_join(channel)
+        self._send_data(f'PART {channel}\r\n'.encode('utf-8'))
+
+    def get_channels(self) -> List[str]:
+        """
+        Returns the channels currently joined
+        """
+
+        return list(self._channels)
+
+    def send_message(self, message: str, channel: str = None, priority: int = PRIORITY_NORMAL) -> None:
+        """
+        Queues a chat message, it is sent as soon as the rate limit allows.
+        Moderation messages (PRIORITY_MODERATION) skip ahead of normal ones.
+        The channel may only be left out while the client is in a single channel
+        """
+
+        if self._loop is None:
+            raise RuntimeError('The client is not connected')
+
+        if channel is None:
+            if len(self._channels) != 1:
+                raise RuntimeError('No channel given for the message')
+            channel = self._channels[0]
+
+        if self._outbound.push(channel, message, priority):
+            self._wake_sender()
+
+    def _receive_line(self, line: str) -> None:
+        """
+        First stage, for every line the protocol frames: PING is answered
+        right here and never waits behind anything, everything else is
+        queued for _drain_inbound. When the queue is full reading stops
+        """
+
+        self._recv_stats["lines"] += 1
+        if line.startswith("PING"):
+            self._recv_stats["pings"] += 1
+            self._write(f'PONG :{parse_message(line).text}\r\n'.encode('utf-8'))
+            return
+
+        inbound = self._inbound
+        if not inbound.push(line, time.perf_counter()):
+            if metrics.enabled:
+                metrics.INBOUND_SHED.inc()
+            return
+        if not self._drain_scheduled:
+            # Runs once this read is done, with every line it framed
+            self._drain_scheduled = True
+            self._loop.call_soon(self._drain_inbound)
+        if inbound.is_full() and not self._reading_paused and self._transport is not None:
+            # The server's lines wait in the socket buffers meanwhile
+            self._reading_paused = True
+            self._recv_stats["pauses"] += 1
+            self._transport.pause_reading()
+
+    def _drain_inbound(self) -> None:
+        """
+        Takes a batch of queued lines and runs it through the parse,
+        filter and dispatch stages, then lets the loop read and send
+        before the next batch. Waits while the handler pool has too much
+        pending, so work piles up in the bounded inbound queue (where chat
+        is shed) and not in the pool. A plain callback on the event loop,
+        cheaper to wake for every read than a task
+        """
+
+        self._drain_scheduled = False
+        inbound = self._inbound
+        if not inbound or self._loop is None:
+            return
+        executor = self._handler_executor
+        if executor is not None and executor.pending() >= self._handler_queue_limit:
+            self._held_back += 1
+            self._drain_scheduled = True
+            self._loop.call_later(_DISPATCH_POLL, self._drain_inbound)
+            return
+
+        stages = self._stages
+        start = time.perf_counter()
+        batch = inbound.pop_batch(_INBOUND_BATCH, start)
+        messages = [parse_message(line) for line, _ in batch]
+        parsed = time.perf_counter()
+        stages["parse"].observe(len(batch), parsed - start)
+        if metrics.enabled:
+            metrics.LINES_PARSED.inc(len(batch))
+
+        messages = [message for message in messages if self._filter(message)]
+        filtered = time.perf_counter()
+        stages["filter"].observe(len(batch), filtered - parsed)
+        self._filtered += len(batch) - len(messages)
+
+        for message in messages:
+            self._dispatch(message)
+        stages["dispatch"].observe(len(messages), time.perf_counter() - filtered)
+
+        if self._reading_paused and len(inbound) <= inbound.resume_at:
+            self._reading_paused = False
+            if self._transport is not None:
+                self._transport.resume_reading()
+        if inbound and not self._drain_scheduled:
+            self._drain_scheduled = True
+            self._loop.call_soon(self._drain_inbound)
+
+    def _filter(self, message: IrcMessage) -> bool:
+        """
+        Filter stage: handles RECONNECT and drops the server's own lines,
+        the bot's echoes and commands over the throttle's limits. Returns
+        whether the handlers should see the message
+        """
+
+        if message.command == "RECONNECT":
+            # Twitch is about to restart the server, log in again right away
+            self._reconnect_requested = True
+            if self._transport is not None:
+                self._transport.close()
+            return False
+        user = self._user.lower()
+        if message.prefix == "tmi.twitch.tv": return False
+        if message.prefix == user + ".tmi.twitch.tv": return False
+        if message.nick == user: return False
+        throttle = self._throttle
+        if throttle is not None and message.command == "PRIVMSG" and not throttle.allow(message):
+            return False
+        return True
+
+    def _dispatch(self, message: IrcMessage) -> None:
+        """
+        Dispatch stage: coroutine handlers are scheduled as tasks on the
+        event loop, plain functions are queued to the handler pool keyed
+        by the sender, so one user's commands never overtake each other
+        """
+
+        if self._handler_loader is not None:
+            # Loading may take a while, it must not hold up the event loop
+            self._handler_executor.submit(message.nick, self._load_handlers, message)
             return
-        if message.split()[0] == ":tmi.twitch.tv": return
-        if message.split()[0] == ":" + self._user.lower() + ".tmi.twitch.tv".format(): return
-        if message.split("!")[0] == ":" + self._user.lower(): return
 
         self._message_handlers_lock.acquire()
         try:
-            for message_handler in self._message_handlers:
-                message_handler(message)
+            handlers = list(self._message_handlers)
+        finally:
+            self._message_handlers_lock.release()
+
+        sync_handlers = []
+        for message_handler in handlers:
+            if inspect.iscoroutinefunction(message_handler):
+                self._loop.create_task(self._run_async_handler(message_handler, message))
+            else:
+                sync_handlers.append(message_handler)
+
+        if sync_handlers:
+            self._handler_executor.submit(message.nick, self._run_sync_handlers, sync_handlers, message)
+
+    def _load_handlers(self, message: IrcMessage) -> None:
+        """
+        Runs the handler loader for one of the first messages and hands it
+        to the handlers it registered. If the loader fails the message is
+        dropped, whoever calls load_handlers() next gets the error
+        """
+
+        try:
+            self.load_handlers()
+        except Exception:
+            traceback.print_exc()
+            return
+
+        self._message_handlers_lock.acquire()
+        try:
+            handlers = list(self._message_handlers)
         finally:
             self._message_handlers_lock.release()
 
-    def register_message_handler(self, message_handler: Callable[[str], None]) -> None:
+        sync_handlers = []
+        for message_handler in handlers:
+            if inspect.iscoroutinefunction(message_handler):
+                self._loop.call_soon_threadsafe(self._loop.create_task, self._run_async_handler(message_handler, message))
+            else:
+                sync_handlers.append(message_handler)
+        self._run_sync_handlers(sync_handlers, message)
+
+    def _run_sync_handlers(self, handlers: List[Callable[[IrcMessage], None]], message: IrcMessage) -> None:
+        """
+        Compatibility shim for plain function handlers, runs them in order
+        on one of the handler threads
+        """
+
+        if not metrics.enabled:
+            for message_handler in handlers:
+                try:
+                    message_handler(message)
+                except Exception:
+                    traceback.print_exc()
+            return
+
+        for message_handler in handlers:
+            start = time.perf_counter()
+            try:
+                message_handler(message)
+            except Exception:
+                traceback.print_exc()
+            metrics.HANDLER_SECONDS.observe(time.perf_counter() - start, _handler_name(message_handler))
+
+    async def _run_async_handler(self, message_handler: Callable[[IrcMessage], Any], message: IrcMessage) -> None:
+        """
+        Awaits a coroutine handler, reporting errors instead of losing them in the task
+        """
+
+        start = time.perf_counter()
+        try:
+            await message_handler(message)
+        except Exception:
+            traceback.print_exc()
+        if metrics.enabled:
+            # Includes the time the task spent waiting on others
+            metrics.HANDLER_SECONDS.observe(time.perf_counter() - start, _handler_name(message_handler))
+
+    def register_message_handler(self, message_handler: Callable[[IrcMessage], Any]) -> None:
         """
         Registers a callable function to be a message handler. Each handler can only
-        take one string parameter and should return nothing
+        take one IrcMessage parameter and should return nothing. Handlers may be plain
+        functions or coroutine functions (async def)
         """
 
         self._message_handlers_lock.acquire()
@@ -181,11 +751,52 @@ class IrcClient():
         finally:
             self._message_handlers_lock.release()
 
-    def unregister_message_handler(self, message_handler: Callable[[str], None]) -> None:
+    def set_handler_loader(self, loader: Callable[[], List[Callable[[IrcMessage], Any]]]) -> None:
+        """
+        Defers setting up the handlers until the first message for them
+        arrives, so connecting does not wait for it. loader is called once,
+        on a handler thread or by load_handlers(), and returns the handlers
+        to register
+        """
+
+        self._handler_loader_lock.acquire()
+        try:
+            self._handler_loader = loader
+            self._handler_load_error = ""
+        finally:
+            self._handler_loader_lock.release()
+
+    def load_handlers(self) -> None:
+        """
+        Runs the handler loader now if it has not run yet. Messages that
+        arrive meanwhile wait for it on the handler threads. Raises if the
+        loader failed, here or earlier on a handler thread, the bot cannot
+        do anything without its handlers
+        """
+
+        self._handler_loader_lock.acquire()
+        try:
+            loader = self._handler_loader
+            if loader is not None:
+                try:
+                    for message_handler in loader():
+                        self.register_message_handler(message_handler)
+                except Exception as e:
+                    self._handler_load_error = "%s: %s" % (type(e).__name__, e)
+                    raise
+                finally:
+                    # A loader that failed is not tried for every message
+                    self._handler_loader = None
+            elif self._handler_load_error != "":
+                raise RuntimeError("Loading the handlers failed: " + self._handler_load_error)
+        finally:
+            self._handler_loader_lock.release()
+
+    def unregister_message_handler(self, message_handler: Callable[[IrcMessage], Any]) -> None:
         """
         removes a message handler
         """
-        
+
         self._message_handlers_lock.acquire()
         try:
             if message_handler in self._message_handlers:
@@ -194,3 +805,42 @@ class IrcClient():
                 raise RuntimeError("Tried to remove non existant handler")
         finally:
             self._message_handlers_lock.release()
+
+class _IrcProtocol(asyncio.BufferedProtocol):
+    """
+    Receives data for IrcClient straight into the LineFramer buffer
+    """
+
+    def __init__(self, client: IrcClient):
+        self._client = client
+        self._framer = LineFramer()
+
+    def get_buffer(self, sizehint: int) -> memoryview:
+        return self._framer.get_buffer(sizehint)
+
+    def buffer_updated(self, nbytes: int) -> None:
+        client = self._client
+        client._last_received = client._loop.time()
+        client._recv_stats["bytes"] += nbytes
+        if metrics.enabled:
+            metrics.RECV_BYTES.inc(nbytes)
+        for line in self._framer.buffer_updated(nbytes):
+            client._receive_line(line)
+
+    def connection_lost(self, exc: Any) -> None:
+        self._client._connection_lost(exc)
+
+def _handler_name(handler: Any) -> str:
+    return getattr(handler, "__name__", type(handler).__name__)
+
+def _join_commands(command: str, channels: List[str]) -> List[bytes]:
+    """
+    Builds JOIN/PART lines for many channels, Twitch takes a comma separated
+    list so a few hundred channels only need a handful of lines
+    """
+
+    lines = []
+    for start in range(0, len(channels), CHANNELS_PER_LINE):
+        names = ",".join(channels[start:start + CHANNELS_PER_LINE])
+        lines.append(f'{command} {names}\r\n'.encode('utf-8'))
+    return lines
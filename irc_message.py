@@ -0,0 +1,219 @@
+from typing import Dict, List, Any
+
+# IRCv3 allows 8191 bytes of tags on top of the classic 512 byte message
+MAX_LINE_LENGTH = 8191 + 512
+
+_TAG_ESCAPES = {":": ";", "s": " ", "\\": "\\", "r": "\r", "n": "\n"}
+
+class IrcMessage:
+    """
+    One parsed IRC line:
+    @tags :prefix COMMAND param param :trailing
+
+    Tags are only unescaped when first accessed, most handlers never look at them
+    """
+
+    __slots__ = ("raw", "prefix", "command", "params", "trailing", "_raw_tags", "_tags")
+
+    def __init__(self, raw: str, raw_tags: str, prefix: str, command: str, params: List[str], trailing: Any):
+        self.raw = raw
+        self._raw_tags = raw_tags
+        self._tags: Any = None
+        self.prefix = prefix
+        self.command = command
+        self.params = params
+        self.trailing = trailing
+
+    def __str__(self):
+        return self.raw
+
+    @property
+    def tags(self) -> Dict[str, str]:
+        """
+        IRCv3 message tags as a dictionary, empty if there are none
+        """
+
+        if self._tags is None:
+            self._tags = _parse_tags(self._raw_tags)
+        return self._tags
+
+    @property
+    def nick(self) -> str:
+        """
+        Nickname of the sender, empty for server messages
+        """
+
+        end = self.prefix.find("!")
+        if end == -1:
+            return ""
+        return self.prefix[:end]
+
+    @property
+    def channel(self) -> str:
+        """
+        The channel a PRIVMSG/JOIN/PART was sent to, empty if there is none
+        """
+
+        if self.params and self.params[0][:1] == "#":
+            return self.params[0]
+        return ""
+
+    @property
+    def text(self) -> str:
+        """
+        The trailing parameter (chat text for PRIVMSG), empty if there is none
+        """
+
+        if self.trailing is None:
+            return ""
+        return self.trailing
+
+def parse_message(line: str) -> IrcMessage:
+    """
+    Parses a single line (without the CRLF) in one pass from left to right
+    """
+
+    raw_tags = ""
+    prefix = ""
+    rest = line
+
+    if rest[:1] == "@":
+        raw_tags, _, rest = rest.partition(" ")
+        raw_tags = raw_tags[1:]
+
+    if rest[:1] == ":":
+        prefix, _, rest = rest.partition(" ")
+        prefix = prefix[1:]
+
+    middle, separator, trailing = rest.partition(" :")
+    if not separator:
+        trailing = None
+
+    words = middle.split()
+    if words:
+        command = words[0].upper()
+        params = words[1:]
+    else:
+        command = ""
+        params = []
+
+    return IrcMessage(line, raw_tags, prefix, command, params, trailing)
+
+def _parse_tags(raw_tags: str) -> Dict[str, str]:
+    """
+    Splits and unescapes the tag section of a message
+    """
+
+    tags: Dict[str, str] = {}
+    if raw_tags == "":
+        return tags
+
+    for item in raw_tags.split(";"):
+        key, _, value = item.partition("=")
+        if "\\" in value:
+            value = _unescape_tag(value)
+        tags[key] = value
+    return tags
+
+def _unescape_tag(value: str) -> str:
+    """
+    Undoes IRCv3 tag value escaping (\\: \\s \\\\ \\r \\n)
+    """
+
+    out = []
+    i = 0
+    while i < len(value):
+        c = value[i]
+        if c == "\\" and i + 1 < len(value):
+            out.append(_TAG_ESCAPES.get(value[i + 1], value[i + 1]))
+            i += 2
+        else:
+            if c != "\\":
+                out.append(c)
+            i += 1
+    return "".join(out)
+
+class LineFramer:
+    """
+    Splits the incoming byte stream into CRLF terminated lines.
+
+    Data is read straight into one preallocated bytearray (get_buffer and
+    buffer_updated follow asyncio.BufferedProtocol, the view also works with
+    socket.recv_into) and only complete lines are decoded, so multi-byte
+    UTF-8 characters split between two reads are never broken
+    """
+
+    def __init__(self, size: int = 65536):
+        self._buffer = bytearray(size)
+        self._view = memoryview(self._buffer)
+        # Unprocessed data lives in _buffer[_start:_end], _scan is where
+        # the search for the next CRLF continues
+        self._start = 0
+        self._end = 0
+        self._scan = 0
+
+    def get_buffer(self, sizehint: int = -1) -> memoryview:
+        """
+        Returns a writable view of the free space at the end of the buffer
+        """
+
+        size = len(self._buffer)
+        wanted = max(sizehint, 4096)
+        if size - self._end < wanted:
+            pending = self._end - self._start
+            if self._start > 0:
+                # Move the partial line to the front instead of growing
+                self._buffer[:pending] = self._view[self._start:self._end]
+                self._scan -= self._start
+                self._start = 0
+                self._end = pending
+            if size - self._end < wanted:
+                # A fresh buffer, views handed out earlier may still be alive
+                buffer = bytearray(size + max(size, wanted))
+                buffer[:self._end] = self._view[:self._end]
+                self._buffer = buffer
+                self._view = memoryview(buffer)
+        return self._view[self._end:]
+
+    def buffer_updated(self, nbytes: int) -> List[str]:
+        """
+        Marks nbytes of the view from get_buffer as filled and returns
+        all lines that are now complete
+        """
+
+        self._end += nbytes
+        lines = []
+        buffer = self._buffer
+        start = self._start
+        end = self._end
+        # A CR at the very end may be the first half of a CRLF
+        scan = max(self._scan - 1, start)
+
+        while True:
+            found = buffer.find(b"\r\n", scan, end)
+            if found == -1:
+                break
+            if found - start <= MAX_LINE_LENGTH:
+                lines.append(str(self._view[start:found], "utf-8", "replace"))
+            start = found + 2
+            scan = start
+
+        if end - start > MAX_LINE_LENGTH:
+            # No line ending in sight, drop the garbage
+            start = end
+        if start == end:
+            start = end = 0
+
+        self._start = start
+        self._end = end
+        self._scan = end
+        return lines
+
+    def feed(self, data: bytes) -> List[str]:
+        """
+        Copies a chunk of received data into the buffer and returns complete lines
+        """
+
+        view = self.get_buffer(len(data))
+        view[:len(data)] = data
+        return self.buffer_updated(len(data))
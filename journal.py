@@ -0,0 +1,338 @@
+import os
+import struct
+import time
+import zlib
+from threading import Condition, Lock, Thread
+from typing import Any, Dict, Iterator, List, Tuple
+import metrics
+
+# Kinds of events. A hero that is created, acts or loses hp is written
+# whole, replaying the last record of a hero gives its latest state
+CHARACTER_SAVED = 1
+CHARACTER_KILLED = 2
+
+# payload length, crc32 of the rest, sequence number, event kind;
+# then channel and user lengths, channel, user, character record
+_HEADER = struct.Struct("<IIQB")
+_NAMES = struct.Struct("<HH")
+
+# Wait before writing a batch again that could not be written
+RETRY_SECONDS = 1.0
+
+def encode_event(seq: int, kind: int, channel: str, user: str, data: bytes) -> bytes:
+    channel_bytes = channel.encode("utf-8")
+    user_bytes = user.encode("utf-8")
+    payload = _NAMES.pack(len(channel_bytes), len(user_bytes)) + channel_bytes + user_bytes + data
+    body = struct.pack("<QB", seq, kind) + payload
+    return _HEADER.pack(len(payload), zlib.crc32(body), seq, kind) + payload
+
+def read_segment(filename: str) -> Iterator[Tuple[int, int, str, str, bytes]]:
+    """
+    (seq, kind, channel, user, data) of every event in a journal file. A
+    record that was only partly written when the bot died ends the file
+    """
+
+    with open(filename, "rb") as f:
+        content = f.read()
+
+    offset = 0
+    while offset + _HEADER.size <= len(content):
+        length, crc, seq, kind = _HEADER.unpack_from(content, offset)
+        start = offset + _HEADER.size
+        payload = content[start:start + length]
+        if len(payload) != length or zlib.crc32(struct.pack("<QB", seq, kind) + payload) != crc:
+            return
+        channel_length, user_length = _NAMES.unpack_from(payload)
+        position = _NAMES.size
+        channel = payload[position:position + channel_length].decode("utf-8")
+        position += channel_length
+        user = payload[position:position + user_length].decode("utf-8")
+        position += user_length
+        yield seq, kind, channel, user, payload[position:]
+        offset = start + length
+
+class Journal():
+    """
+    Append-only log of every character change, so the CharacterStore can
+    write the database rarely and still lose nothing when the bot dies.
+    Events get increasing sequence numbers and go to segment files named
+    after the first of them. Appending only queues the record; one thread
+    writes everything queued and syncs it to disk with a single fsync
+    (group commit), so many handlers waiting at once share one sync.
+    A batch that cannot be written stays queued and is tried again, its
+    events only count as synced once they are on disk.
+
+    The store's flush is the snapshot: it records the last sequence number
+    it contains in the database and segments holding nothing newer are
+    deleted. On startup the store replays the events after that number
+    """
+
+    _instance: Any = None
+
+    def __new__(self):
+        if self._instance == None:
+            self._instance = super(Journal, self).__new__(self)
+            self._lock = Lock()
+            # Writer waits on the first, appenders waiting for the disk on the second
+            self._pending = Condition(self._lock)
+            self._synced = Condition(self._lock)
+            self._buffer: List[bytes] = []
+            self._thread: Any = None
+            self._stopping = False
+            self._file: Any = None
+            self._path = ""
+            self._file_bytes = 0
+            self._rotate = False
+            # Why the events still queued when the journal stopped were lost
+            self._error = ""
+            self.directory = ""
+            self.name = ""
+            self.seq = 0
+            self.durable = 0
+            self.appended = 0
+            self.syncs = 0
+
+        return self._instance
+
+    def start(self, directory: str, name: str = "journal", sync: bool = True, segment_bytes: int = 16 * 1024 * 1024) -> None:
+        """
+        Opens the journal in directory and starts the writer thread. name
+        tells the snapshots of several journals in one database apart.
+        Without sync the records are written but not fsynced, they
+        survive the bot dying but not the machine
+        """
+
+        if self._thread is not None:
+            raise RuntimeError("The journal is already running")
+
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.name = name
+        self.sync = sync
+        self.segment_bytes = segment_bytes
+        self._stopping = False
+        self._rotate = True
+        self._error = ""
+
+        # Carry on after the last event on disk
+        self.seq = 0
+        segments = self.segments()
+        if segments:
+            for seq, _, _, _, _ in read_segment(segments[-1][1]):
+                self.seq = seq
+            self.seq = max(self.seq, segments[-1][0] - 1)
+        self.durable = self.seq
+
+        self._thread = Thread(target=self._write_loop, name="JournalThread", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """
+        Writes and syncs what is still queued and closes the file
+        """
+
+        if self._thread is None:
+            raise RuntimeError("The journal is not running")
+
+        self._lock.acquire()
+        try:
+            self._stopping = True
+            self._pending.notify()
+        finally:
+            self._lock.release()
+        self._thread.join()
+        self._thread = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def is_running(self) -> bool:
+        return self._thread is not None
+
+    def segments(self) -> List[Tuple[int, str]]:
+        """
+        (first sequence number, filename) of the journal files, oldest first
+        """
+
+        segments = []
+        for name in os.listdir(self.directory):
+            if name.startswith("journal-") and name.endswith(".log"):
+                segments.append((int(name[8:-4]), os.path.join(self.directory, name)))
+        segments.sort()
+        return segments
+
+    def skip_to(self, seq: int) -> None:
+        """
+        Makes the next event come after seq, for a snapshot that is newer
+        than anything left in the journal
+        """
+
+        self._lock.acquire()
+        try:
+            if seq > self.seq:
+                self.seq = seq
+                self.durable = max(self.durable, seq)
+        finally:
+            self._lock.release()
+
+    def append(self, kind: int, channel: str, user: str, data: bytes) -> int:
+        """
+        Queues an event and returns its sequence number, wait_synced(seq)
+        returns once it is on disk
+        """
+
+        self._lock.acquire()
+        try:
+            self.seq += 1
+            seq = self.seq
+            self._buffer.append(encode_event(seq, kind, channel, user, data))
+            if len(self._buffer) == 1:
+                self._pending.notify()
+            return seq
+        finally:
+            self._lock.release()
+
+    def wait_synced(self, seq: int) -> None:
+        """
+        Returns once the event seq is on disk, raises if the journal
+        stopped without being able to write it
+        """
+
+        self._lock.acquire()
+        try:
+            while self.durable < seq:
+                if self._error != "":
+                    raise RuntimeError("Journal event %i was not written: %s" % (seq, self._error))
+                if self._thread is None:
+                    break
+                self._synced.wait()
+        finally:
+            self._lock.release()
+
+    def _write_loop(self) -> None:
+        while True:
+            self._lock.acquire()
+            try:
+                while not self._buffer and not self._stopping:
+                    self._pending.wait()
+                batch = self._buffer
+                self._buffer = []
+                last = self.seq
+                stopping = self._stopping
+            finally:
+                self._lock.release()
+
+            if batch:
+                start = time.perf_counter()
+                try:
+                    self._write_batch(batch)
+                except Exception as e:
+                    print('[!] JOURNAL WRITE FAILED: ' + str(e))
+                    self._lock.acquire()
+                    try:
+                        # Older than anything queued since, it goes first
+                        self._buffer[:0] = batch
+                        if stopping:
+                            self._error = str(e) or type(e).__name__
+                            self._synced.notify_all()
+                            return
+                    finally:
+                        self._lock.release()
+                    time.sleep(RETRY_SECONDS)
+                    continue
+                metrics.JOURNAL_SYNC_SECONDS.observe(time.perf_counter() - start)
+
+            self._lock.acquire()
+            try:
+                self.durable = last
+                self.appended += len(batch)
+                self.syncs += 1 if batch else 0
+                self._synced.notify_all()
+            finally:
+                self._lock.release()
+            if stopping:
+                return
+
+    def _write_batch(self, batch: List[bytes]) -> None:
+        if self._file is None or self._rotate or self._file_bytes >= self.segment_bytes:
+            # Named after the first event in it
+            first = _HEADER.unpack_from(batch[0])[2]
+            if self._file is not None:
+                self._file.close()
+            self._path = os.path.join(self.directory, "journal-%020i.log" % (first))
+            self._file = open(self._path, "ab")
+            self._file_bytes = 0
+            self._rotate = False
+
+        data = b"".join(batch)
+        position = self._file.tell()
+        try:
+            self._file.write(data)
+            self._file.flush()
+            if self.sync:
+                os.fsync(self._file.fileno())
+        except Exception:
+            # A record cut off in the middle would end the segment for
+            # replay, the retry has to start where this write did
+            self._drop_partial(position)
+            raise
+        self._file_bytes += len(data)
+
+    def _drop_partial(self, position: int) -> None:
+        """
+        Cuts the segment back to position after a failed write. The file
+        is closed first so nothing still buffered lands after the cut, the
+        next write opens it again
+        """
+
+        try:
+            self._file.close()
+        except Exception:
+            pass
+        self._file = None
+        os.truncate(self._path, position)
+
+    def replay(self, after: int) -> Iterator[Tuple[int, int, str, str, bytes]]:
+        """
+        Every event with a sequence number above after, oldest first
+        """
+
+        segments = self.segments()
+        for index, (first, filename) in enumerate(segments):
+            if index + 1 < len(segments) and segments[index + 1][0] <= after + 1:
+                # Everything in it is older than the snapshot
+                continue
+            for event in read_segment(filename):
+                if event[0] > after:
+                    yield event
+
+    def truncate(self, seq: int) -> int:
+        """
+        Deletes the segments that only hold events up to seq, which a
+        snapshot has made redundant, returns how many. The segment in use
+        is closed at the next write so it can go the next time
+        """
+
+        self._lock.acquire()
+        try:
+            self._rotate = True
+        finally:
+            self._lock.release()
+
+        removed = 0
+        segments = self.segments()
+        for index in range(len(segments) - 1):
+            if segments[index + 1][0] <= seq + 1:
+                os.remove(segments[index][1])
+                removed += 1
+        return removed
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "seq": self.seq,
+            "durable": self.durable,
+            "appended": self.appended,
+            "syncs": self.syncs,
+            "per_sync": self.appended / self.syncs if self.syncs else 0.0,
+            "segments": len(self.segments()) if self.directory else 0,
+        }
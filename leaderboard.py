@@ -0,0 +1,234 @@
+import random
+from threading import Lock
+from typing import Any, Dict, List, Optional, Tuple
+from database import Database
+from serialization import decode_character
+from store import CharacterStore
+
+# Skip lists of up to 2^32 entries stay balanced with this many levels
+_MAX_LEVELS = 32
+
+class _Node:
+    __slots__ = ("key", "next", "width")
+
+    def __init__(self, key: Any, height: int):
+        self.key = key
+        self.next: List[Any] = [None] * height
+        # How many positions next[level] is ahead of this node
+        self.width = [1] * height
+
+class SkipList:
+    """
+    Sorted keys with the number of positions each link skips, so finding
+    the rank of a key is as cheap as finding the key: O(log n) expected
+    for insert, remove and rank. Keys must be unique and comparable
+    """
+
+    def __init__(self, seed: Any = None):
+        self._head = _Node(None, _MAX_LEVELS)
+        self._size = 0
+        self._random = random.Random(seed)
+
+    def __len__(self):
+        return self._size
+
+    def _path(self, key: Any) -> Tuple[List[Any], List[int]]:
+        """
+        The last node before key on every level and its position (the head is 0)
+        """
+
+        update = [None] * _MAX_LEVELS
+        steps = [0] * _MAX_LEVELS
+        node = self._head
+        position = 0
+        for level in range(_MAX_LEVELS - 1, -1, -1):
+            next = node.next[level]
+            while next is not None and next.key < key:
+                position += node.width[level]
+                node = next
+                next = node.next[level]
+            update[level] = node
+            steps[level] = position
+        return update, steps
+
+    def insert(self, key: Any) -> None:
+        update, steps = self._path(key)
+        height = 1
+        while height < _MAX_LEVELS and self._random.random() < 0.5:
+            height += 1
+
+        node = _Node(key, height)
+        position = steps[0]
+        for level in range(height):
+            previous = update[level]
+            node.next[level] = previous.next[level]
+            previous.next[level] = node
+            node.width[level] = previous.width[level] - (position - steps[level])
+            previous.width[level] = position - steps[level] + 1
+        for level in range(height, _MAX_LEVELS):
+            update[level].width[level] += 1
+        self._size += 1
+
+    def remove(self, key: Any) -> None:
+        update, _ = self._path(key)
+        node = update[0].next[0]
+        if node is None or node.key != key:
+            raise RuntimeError("%s is not in the list" % (key,))
+
+        for level in range(len(node.next)):
+            update[level].width[level] += node.width[level] - 1
+            update[level].next[level] = node.next[level]
+        for level in range(len(node.next), _MAX_LEVELS):
+            update[level].width[level] -= 1
+        self._size -= 1
+
+    def rank(self, key: Any) -> Optional[int]:
+        """
+        Position of key counting from 1, None if it is not in the list
+        """
+
+        update, steps = self._path(key)
+        node = update[0].next[0]
+        if node is None or node.key != key:
+            return None
+        return steps[0] + 1
+
+    def extend_sorted(self, keys: List[Any]) -> None:
+        """
+        Fills an empty list from keys that are already sorted, in O(n)
+        instead of one insert after another
+        """
+
+        if self._size:
+            raise RuntimeError("The list is not empty")
+
+        tails = [self._head] * _MAX_LEVELS
+        positions = [0] * _MAX_LEVELS
+        position = 0
+        for position, key in enumerate(keys, 1):
+            height = 1
+            while height < _MAX_LEVELS and self._random.random() < 0.5:
+                height += 1
+            node = _Node(key, height)
+            for level in range(height):
+                tails[level].next[level] = node
+                tails[level].width[level] = position - positions[level]
+                tails[level] = node
+                positions[level] = position
+        for level in range(_MAX_LEVELS):
+            tails[level].width[level] = position + 1 - positions[level]
+        self._size = position
+
+    def first(self, count: int) -> List[Any]:
+        keys = []
+        node = self._head.next[0]
+        while node is not None and len(keys) < count:
+            keys.append(node.key)
+            node = node.next[0]
+        return keys
+
+class Leaderboard:
+    """
+    The heroes of one channel ordered by level, then xp. It is read once
+    from the stat columns of the database (plus whatever the store has not
+    written yet) the first time somebody asks, after that every change of
+    a character is applied to it, so !top and !rank never touch the
+    database. Each channel belongs to one bot process, so the in-memory
+    order is never behind another process's writes
+    """
+
+    def __init__(self, channel: str):
+        self.channel = channel
+        self._lock = Lock()
+        self._list = SkipList()
+        # user -> (level, class, hp, xp)
+        self._stats: Dict[str, Tuple[int, str, int, int]] = {}
+        self._loaded = False
+
+    def _load(self) -> None:
+        """
+        Lock must be held. Changes that arrive meanwhile wait for the lock
+        and are applied afterwards
+        """
+
+        pending = CharacterStore().pending(self.channel)
+        for user, level, class_name, hp, xp, data in Database().get_stats(self.channel):
+            if level is None:
+                # Written before the stat columns existed
+                char = decode_character(bytes(data))
+                level, class_name, hp, xp = char.level, char.class_name, char.hp, char.xp
+            self._stats[user] = (level, class_name, hp, xp)
+        self._list.extend_sorted(sorted((-stats[0], -stats[3], user) for user, stats in self._stats.items()))
+        for user, char in pending.items():
+            self._set(user, None if char is None else (char.level, char.class_name, char.hp, char.xp))
+        self._loaded = True
+
+    def _set(self, user: str, stats: Any) -> None:
+        old = self._stats.get(user)
+        if old == stats:
+            return
+        if old is not None:
+            self._list.remove((-old[0], -old[3], user))
+            del self._stats[user]
+        if stats is not None:
+            self._list.insert((-stats[0], -stats[3], user))
+            self._stats[user] = stats
+
+    def update(self, user: str, char: Any) -> None:
+        """
+        Takes the new stats of a character, None once it is deleted
+        """
+
+        self._lock.acquire()
+        try:
+            # Not asked for yet, the load will find the change in the store
+            if self._loaded:
+                self._set(user, None if char is None else (char.level, char.class_name, char.hp, char.xp))
+        finally:
+            self._lock.release()
+
+    def refresh(self, users: List[str]) -> None:
+        """
+        Takes the stats of users from the store as they are now. For
+        writes that waited on something in between, a change made to a
+        user meanwhile (like a kill) is not overwritten with an old one
+        """
+
+        store = CharacterStore()
+        self._lock.acquire()
+        try:
+            if self._loaded:
+                for user in users:
+                    char = store.get(self.channel, user)
+                    self._set(user, None if char is None else (char.level, char.class_name, char.hp, char.xp))
+        finally:
+            self._lock.release()
+
+    def rank(self, user: str) -> Optional[Tuple[int, int, Tuple[int, str, int, int]]]:
+        """
+        (rank, number of heroes, stats) of a user, None without a hero
+        """
+
+        self._lock.acquire()
+        try:
+            if not self._loaded:
+                self._load()
+            stats = self._stats.get(user)
+            if stats is None:
+                return None
+            return self._list.rank((-stats[0], -stats[3], user)), len(self._list), stats
+        finally:
+            self._lock.release()
+
+    def top(self, count: int) -> List[Tuple[str, Tuple[int, str, int, int]]]:
+        """
+        (user, stats) of the best count heroes
+        """
+
+        self._lock.acquire()
+        try:
+            if not self._loaded:
+                self._load()
+            return [(user, self._stats[user]) for _, _, user in self._list.first(count)]
+        finally:
+            self._lock.release()
@@ -1,222 +1,329 @@
 #!/usr/bin/env python3
+import os
 from irc_client import IrcClient
-from database import Database
-from character import Character
-from game import Game
+from metrics import MetricsServer, SamplingProfiler
+from throttle import CommandThrottle
 from conf import *
-from util import check_config, get_msg, get_usr
+from util import check_config
 
-# creating and initializing client object
-if check_config(HOST, PORT, NAME, OAUTH, CHANNEL):
-    IrcClient().connect(HOST, PORT, NAME, OAUTH, CHANNEL)
-    print('[i] CONNECTED TO: ' + CHANNEL)
-else:
-    raise RuntimeError("Incorrect format of config data!")
+# Everything else is imported by load_handlers, after the bot has joined
+# its channels; restarts during deploys should not keep the chat waiting
 
-# creating and initializing database object
-Database().initialize()
+# Index of this process when running as one of several workers (None
+# otherwise), ports and log directories are told apart by it
+_worker = None
 
-# A simple dictionary that will get wiped every restart for now ^^
-user_db = {}
-
-# The game.
-game = Game()
-
-def send(m):
+def start_bot(channels, rate_limit=RATE_LIMIT, worker=None, use_ssl=True):
     """
-    Sends a message to currently connected chat room as the bot user. This
-    function should be used as the underlying code may change
+    Connects to the channels first and then loads everything the
+    handlers need, messages that arrive meanwhile wait for it
     """
 
-    IrcClient().send_message(m)
+    global _worker
+    _worker = worker
 
-def preparse_msg(msg, cmd):
-    """
-    Does some parsing and returns the command arguments as well as
-    the name of the user requesting it
-    """
+    # Metrics cost next to nothing until they are switched on,
+    # here or with 'metrics on' from the console
+    if METRICS_PORT:
+        port = MetricsServer().start(METRICS_PORT + (_worker or 0))
+        print('[i] METRICS ON: http://127.0.0.1:%i/metrics' % (port))
 
-    # Split message by whitespaces
-    parts = msg.split()
-    # Extract user name
-    user = parts[0][1:].split("!")[0]
-    # Check if it is a PRIVMSG (chat message) and if it starts with cmd
-    if parts[1] != "PRIVMSG" or parts[3] != ":" + cmd:
-        return None, user
-    # Remove first entries, so that we only have to worry about things after cmd
-    return parts[4:], user
-
-def get_character(user):
-    """
-    Returns the character of the user, or None if there hasn't been created one
-    """
+    # creating and initializing client object
+    IrcClient().set_rate_limit(rate_limit, 30)
+    # The JOIN limit is per account too, workers share it like the chat limit
+    IrcClient().set_join_rate_limit(max(JOIN_RATE_LIMIT // (WORKERS if worker is not None else 1), 1), 10)
+    IrcClient().set_handler_workers(HANDLER_WORKERS)
+    IrcClient().set_inbound_limits(INBOUND_QUEUE, HANDLER_QUEUE)
+    if THROTTLE_COMMANDS:
+        IrcClient().set_throttle(CommandThrottle(user_limit=THROTTLE_COMMANDS, window=THROTTLE_WINDOW, exempt_badges=THROTTLE_EXEMPT))
+    IrcClient().set_handler_loader(load_handlers)
+    IrcClient().connect(HOST, PORT, NAME, OAUTH, channels, use_ssl)
+    print('[i] CONNECTED TO: ' + (", ".join(channels) or "no channels"))
 
-    global user_db
-    if user in user_db:
-        return user_db[user]
-    else:
-        return None
+    # Unless a message got there first, either way a loader that failed
+    # raises here. A bot without handlers would sit in the channels and
+    # ignore every command, it goes away instead (a worker gets restarted)
+    try:
+        IrcClient().load_handlers()
+    except Exception:
+        IrcClient().disconnect()
+        raise
 
-def add_character(user, char):
+def load_handlers():
     """
-    Adds a character in the db for that user
+    Loads classes, messages and characters and returns the handlers
     """
 
-    global user_db
-    if user in user_db:
-        raise RuntimeError("The old hero has to die first!")
-    else:
-        user_db[user] = char
+    from database import Database
+    from store import CharacterStore
+    from classes import ClassRegistry
+    from channel import set_channel_locale
+    from catalog import MessageCatalog
+    from chatlog import ChatLogger
+    from journal import Journal
+    from npcs import NpcRegistry
 
-def kill_character(user):
-    """
-    Deletes a character to make place for another
-    """
+    # loading the hero classes, 'reload classes' reads the file again
+    ClassRegistry().load()
 
-    global user_db
-    if user in user_db:
-        del user_db[user]
-    else:
-        raise RuntimeError("There is no hero to kill!")
+    # loading the chat messages, 'reload messages' reads the file again
+    MessageCatalog().load()
+    for channel, locale in CHANNEL_LOCALES.items():
+        set_channel_locale(channel, locale)
 
+    # loading the NPCs and spawn tables (names are in the messages),
+    # 'reload npcs' reads the file again
+    NpcRegistry().load()
 
-# IMPORTANT:
-# The HANDLERS variable has to contain names of the
-# functions that take one string argument and
-# return either nothing, or built-in type None
-#
-# Hondler functions will be given the message, it is
-# their duty to determin if the message is important
-# for them or not, if not they should return ASAP
-# so to not block rest of the handlers from executing
+    # creating and initializing database object, characters
+    # are read from it on demand and written back in batches
+    Database().initialize(DATABASE, legacy_channel=CHANNEL)
+    if JOURNAL_DIR and DATABASE:
+        # Every change is journaled at once, so the batches (snapshots)
+        # can be far apart; what the last one missed is replayed here
+        Journal().start(JOURNAL_DIR if _worker is None else os.path.join(JOURNAL_DIR, "worker%i" % (_worker)),
+            "journal" if _worker is None else "worker%i" % (_worker), JOURNAL_SYNC)
+        CharacterStore().initialize(Database(), flush_interval=SNAPSHOT_INTERVAL, journal=Journal())
+    else:
+        CharacterStore().initialize(Database())
 
-# Section for defining handler functions
-def print_handler(msg):
-	print(get_usr(msg) + ': ' + get_msg(msg))
-    #print(msg)
+    # Chat goes to compressed log files written in the background
+    if CHAT_LOG_DIR:
+        ChatLogger().start(CHAT_LOG_DIR if _worker is None else os.path.join(CHAT_LOG_DIR, "worker%i" % (_worker)))
 
-def help_handler(msg):
-    """
-    The parser for !help messages to the bot
-    """
+    from handlers import HANDLERS
+    return HANDLERS
 
-    # Get the preparsed message
-    parts, user = preparse_msg(msg, "!help")
-    if parts == None:
-        return
-    
-    # Parse sub category for !help
-    if len(parts) == 0:
-        send("Available help commands are: do, char and game")
-    elif parts[0] == "char":
-        send("Help for character creation and development")
-    elif parts[0] == "game":
-        send("Help for game mechanics")
-    elif parts[0] == "do":
-        send("Help for do action mechanics")
-    else:
-        send("@%s There is not help page for %s!" % (user, parts[0]))
+def stop_bot():
+    from store import CharacterStore
+    from chatlog import ChatLogger
+    from journal import Journal
+
+    IrcClient().disconnect()
+    CharacterStore().close()
+    if Journal().is_running():
+        Journal().stop()
+    if ChatLogger().is_running():
+        ChatLogger().stop()
 
-def char_handler(msg):
+def run_command(command):
     """
-    The parser for !char messages to the bot
+    Runs one console command, returns False once the bot should exit.
+    Other functions can easily be implemented, the execution time on
+    those shouldn't matter since rest of the program is running in
+    separate threads
     """
 
-    # Get the preparsed message
-    parts, user = preparse_msg(msg, "!char")
-    if parts == None:
-        return
-    
-    # Get character if there is one available
-    char = get_character(user)
-
-    # Parse sub category for !char
-    if len(parts) == 0:
-        if char == None:
-            send("@%s You do not have a character! Please create one first, see '!help char' for more information" % (user))
-        else:
-            send(char.summary)
-    elif parts[0] == "create":
-        if len(parts) != 4:
-            send("@%s This command must be used like this: '!char create <name> <gender> <class>'!" % (user))
-            return
-        name = parts[1]
-        gender = parts[2].lower()
-        class_name = parts[3].lower()
+    from classes import ClassRegistry
+    from channel import drop_channel, reload_messages, set_channel_locale
+    from catalog import MessageCatalog
+    from chatlog import ChatLogger
+    from journal import Journal
+    from npcs import NpcRegistry
+
+    if command == 'exit':
+        stop_bot()
+        print('[i] DISCONNECTED')
+        return False
+    elif command[:5] == 'send ':
+        channel, _, message = command[5:].partition(' ')
+        IrcClient().send_message(message, channel)
+    elif command == 'queue':
+        print('[i] OUTBOUND: ' + str(IrcClient().get_outbound_stats()))
+    elif command == 'throttle':
+        try:
+            print('[i] THROTTLE: ' + str(IrcClient().get_throttle_stats()))
+        except RuntimeError as e:
+            print('[!] ' + str(e))
+    elif command == 'journal':
+        print('[i] JOURNAL: ' + str(Journal().stats()))
+    elif command == 'chatlog':
+        print('[i] CHAT LOG: ' + str(ChatLogger().stats()))
+    elif command == 'workers':
+        print('[i] HANDLERS: ' + str(IrcClient().get_handler_stats()))
+    elif command == 'pipeline':
+        for stage, stats in IrcClient().get_pipeline_stats().items():
+            print('[i] PIPELINE %s: %s' % (stage.upper(), stats))
+    elif command[:7] == 'metrics':
+        try:
+            if command[8:10] == 'on':
+                port = MetricsServer().start(int(command[11:] or METRICS_PORT or 9100) + (_worker or 0))
+                print('[i] METRICS ON: http://127.0.0.1:%i/metrics' % (port))
+            elif command[8:] == 'off':
+                MetricsServer().stop()
+                print('[i] METRICS OFF')
+            else:
+                print('[i] METRICS ' + ('ON' if MetricsServer().is_running() else 'OFF'))
+        except (RuntimeError, OSError, ValueError) as e:
+            print('[!] ' + str(e))
+    elif command == 'profile start':
+        try:
+            SamplingProfiler().start()
+            print('[i] PROFILING, stop with: profile stop [file]')
+        except RuntimeError as e:
+            print('[!] ' + str(e))
+    elif command[:12] == 'profile stop':
+        try:
+            stacks = SamplingProfiler().stop()
+            print('[i] %i SAMPLES' % (SamplingProfiler().samples))
+            for function, seen in SamplingProfiler.top(stacks):
+                print('[i] %6i %s' % (seen, function))
+            if command[13:]:
+                SamplingProfiler().write(command[13:], stacks)
+                print('[i] STACKS WRITTEN TO: ' + command[13:])
+        except (RuntimeError, OSError) as e:
+            print('[!] ' + str(e))
+    elif command == 'reload classes':
+        try:
+            ClassRegistry().reload()
+            print('[i] CLASSES RELOADED: ' + ", ".join(ClassRegistry().names()))
+        except RuntimeError as e:
+            print('[!] ' + str(e))
+    elif command == 'reload messages':
         try:
-            add_character(user, Character(name, class_name, gender))
-            send("A new hero with the name of %s has entered the stage!" % (name))
+            reload_messages()
+            print('[i] MESSAGES RELOADED: ' + ", ".join(MessageCatalog().locales()))
         except RuntimeError as e:
-            send("@%s %s" % (user, str(e)))
-    elif parts[0] == "kill" or parts[0] == "delete":
+            print('[!] ' + str(e))
+    elif command == 'reload npcs':
         try:
-            kill_character(user)
-            send("%s has passed away!" % (str(char)))
+            NpcRegistry().reload()
+            print('[i] NPCS RELOADED: ' + ", ".join(NpcRegistry().names()) + ' (tables: ' + ", ".join(NpcRegistry().tables()) + ')')
         except RuntimeError as e:
-            send("@%s %s" % (user, str(e)))
+            print('[!] ' + str(e))
+    elif command[:7] == 'locale ':
+        channel, _, locale = command[7:].partition(' ')
+        try:
+            set_channel_locale(channel, locale)
+            print('[i] LOCALE OF %s: %s' % (channel, locale))
+        except RuntimeError as e:
+            print('[!] ' + str(e))
+    elif command[:5] == 'join ':
+        try:
+            IrcClient().join(command[5:])
+            print('[i] JOINED: ' + command[5:])
+        except RuntimeError as e:
+            print('[!] ' + str(e))
+    elif command[:5] == 'part ':
+        try:
+            IrcClient().part(command[5:])
+            drop_channel(command[5:])
+            print('[i] LEFT: ' + command[5:])
+        except RuntimeError as e:
+            print('[!] ' + str(e))
     else:
-        #send("@%s Unknown !char command %s!" % (user, parts[0]))
-        send("@%s Unknown !char command [!char %s]!" % (user, parts[0]))
+        print('[i] UNKNOWN COMMAND: ' + command)
+    return True
 
-def do_handler(msg):
+def run_worker(index, channels, rate_limit, pipe):
     """
-    The parser for !do messages to the bot
+    One bot process of the supervisor, takes its console commands from the pipe
     """
 
-    # Get the preparsed message
-    parts, user = preparse_msg(msg, "!do")
-    if parts == None:
-        return
-    
-    
-    # Get character if there is one available
-    char = get_character(user)
-
-    # Parse sub category for !char
-    if char == None:
-        send("@%s You do not have a character! Please create one first, see '!help char' for more information" % (user))
-    else:
-        send(char.do(parts))
-        
-def game_handler(msg):
+    start_bot(channels, rate_limit, index)
+    while run_command(pipe.recv()):
+        pass
+
+def run_supervisor(channels):
     """
-    The parser for !game messages to the bot
+    Starts WORKERS bot processes and hands console commands to them:
+    join, part and send go to the worker that owns the channel, 'status'
+    lists the workers and everything else goes to all of them
     """
 
-    # Get the preparsed message
-    parts, user = preparse_msg(msg, "!game")
-    if parts == None:
+    from supervisor import Supervisor
+
+    supervisor = Supervisor(WORKERS, channels, run_worker, RATE_LIMIT)
+    supervisor.start()
+    while True:
+        command: str = input()
+        try:
+            if command == 'exit':
+                supervisor.stop()
+                print('[i] DISCONNECTED')
+                break
+            elif command == 'status':
+                for worker in supervisor.status():
+                    print('[i] WORKER: ' + str(worker))
+            elif command[:5] == 'join ':
+                supervisor.join(command[5:])
+            elif command[:5] == 'part ':
+                supervisor.part(command[5:])
+            elif command[:5] == 'send ' or command[:7] == 'locale ':
+                supervisor.send(command.split(' ')[1], command)
+            else:
+                supervisor.broadcast(command)
+        except RuntimeError as e:
+            print('[!] ' + str(e))
+
+def run_offline(args):
+    """
+    The modes that work on the database or the game without connecting
+    to chat. The bot should not be running on the same database while
+    characters are imported
+    """
+
+    if args.mode == 'simulate':
+        from simulate import run_simulation, print_report
+
+        print_report(run_simulation(args.actions, args.workers, args.party, args.level, args.table, args.seed))
         return
 
-    # Check for privileges (owner, mod)
-    
-    # Run game
-    #game
-
-# HANDLERS variable has to be below handler functions
-HANDLERS = [
-    print_handler,
-    help_handler,
-    char_handler,
-    do_handler,
-    game_handler
-]
-
-# Registering handlers to be used when processing messages
-for handler in HANDLERS:
-    IrcClient().register_message_handler(handler)
-
-# Loop waiting for user input, other functions can easily
-# be implemented, the execution time on those shouldn't
-# matter since rest of the program is running in a
-# separate thread
-while True:
-    command: str = input()
-    if command == 'exit':
-        IrcClient().disconnect()
-        print('[i] DISCONNECTED')
-        break
-    elif command[:5] == 'send ':
-        IrcClient().send_message(command[5:])
+    from database import Database
+    from dump import export_characters, import_characters
+
+    Database().initialize(args.database, legacy_channel=CHANNEL)
+    try:
+        if args.mode == 'export':
+            count = export_characters(Database(), args.file, args.channel)
+            print('[i] %i CHARACTERS EXPORTED TO: %s' % (count, args.file))
+        elif args.mode == 'import':
+            count = import_characters(Database(), args.file)
+            print('[i] %i CHARACTERS IMPORTED FROM: %s' % (count, args.file))
+    except (RuntimeError, OSError) as e:
+        print('[!] ' + str(e))
+
+def parse_args(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Twitch RPG bot, connects to chat unless a mode is given")
+    modes = parser.add_subparsers(dest="mode")
+    export = modes.add_parser("export", help="write characters to a JSON lines file (.gz compresses it)")
+    export.add_argument("file")
+    export.add_argument("--channel", default="", help="only this channel")
+    export.add_argument("--database", default=DATABASE)
+    load = modes.add_parser("import", help="write the characters of an export into the database")
+    load.add_argument("file")
+    load.add_argument("--database", default=DATABASE)
+    simulate = modes.add_parser("simulate", help="fight synthetic encounters offline to check balance and speed")
+    simulate.add_argument("--actions", type=int, default=1000000, help="hero actions in total")
+    simulate.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="processes sharing the actions")
+    simulate.add_argument("--party", type=int, default=5, help="heroes per encounter")
+    simulate.add_argument("--level", type=int, default=10, help="level of the heroes")
+    simulate.add_argument("--table", default="default", help="spawn table of the NPCs")
+    simulate.add_argument("--seed", type=int, default=0)
+    return parser.parse_args(argv)
+
+def main():
+    args = parse_args()
+    if args.mode is not None:
+        run_offline(args)
+        return
+
+    # All channels share the one connection (of each worker)
+    channels = [CHANNEL] + [c for c in CHANNELS if c != CHANNEL]
+    if not all(check_config(HOST, PORT, NAME, OAUTH, c) for c in channels):
+        raise RuntimeError("Incorrect format of config data!")
+
+    if WORKERS > 1:
+        if not DATABASE:
+            raise RuntimeError("Workers can only share a database file, set DATABASE")
+        run_supervisor(channels)
     else:
-        print('[i] UNKNOWN COMMAND: ' + command)
+        start_bot(channels)
+        # Loop waiting for user input
+        while run_command(input()):
+            pass
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,293 @@
+import sys
+import traceback
+from bisect import bisect_left
+from threading import Event, Lock, Thread, enumerate as enumerate_threads, get_ident
+from typing import Any, Dict, List, Tuple
+
+# Instrumented code checks this before doing any work, so while metrics
+# are off the hot paths pay for one global lookup and nothing else
+enabled = False
+
+# Seconds, from a tenth of a millisecond to ten seconds
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_metrics: List[Any] = []
+
+class Counter:
+    """
+    A value that only goes up, exported as <name>_total
+    """
+
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self.value = 0
+        self._lock = Lock()
+        _metrics.append(self)
+
+    def inc(self, amount: int = 1) -> None:
+        self._lock.acquire()
+        try:
+            self.value += amount
+        finally:
+            self._lock.release()
+
+    def render(self) -> List[str]:
+        return [
+            "# HELP %s_total %s" % (self.name, self.help),
+            "# TYPE %s_total counter" % (self.name),
+            "%s_total %s" % (self.name, self.value),
+        ]
+
+class Histogram:
+    """
+    Counts observed values in fixed buckets and keeps their sum. With a
+    label name every label value gets buckets of its own
+    """
+
+    def __init__(self, name: str, help: str, label: str = None, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.label = label
+        self.buckets = buckets
+        # label value -> [bucket counts..., count above the last bucket], sum
+        self._series: Dict[Any, List[Any]] = {}
+        self._lock = Lock()
+        _metrics.append(self)
+
+    def observe(self, value: float, label: str = None) -> None:
+        index = bisect_left(self.buckets, value)
+        self._lock.acquire()
+        try:
+            series = self._series.get(label)
+            if series is None:
+                series = [[0] * (len(self.buckets) + 1), 0.0]
+                self._series[label] = series
+            series[0][index] += 1
+            series[1] += value
+        finally:
+            self._lock.release()
+
+    def render(self) -> List[str]:
+        lines = [
+            "# HELP %s %s" % (self.name, self.help),
+            "# TYPE %s histogram" % (self.name),
+        ]
+        self._lock.acquire()
+        try:
+            series = [(label, list(counts), total) for label, (counts, total) in self._series.items()]
+        finally:
+            self._lock.release()
+
+        for label, counts, total in sorted(series, key=lambda s: str(s[0])):
+            labels = '%s="%s",' % (self.label, _escape(label)) if self.label else ""
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                lines.append('%s_bucket{%sle="%s"} %i' % (self.name, labels, bound, cumulative))
+            cumulative += counts[-1]
+            lines.append('%s_bucket{%sle="+Inf"} %i' % (self.name, labels, cumulative))
+            suffix = "{%s}" % (labels[:-1]) if labels else ""
+            lines.append("%s_sum%s %r" % (self.name, suffix, total))
+            lines.append("%s_count%s %i" % (self.name, suffix, cumulative))
+        return lines
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+# What the bot measures
+RECV_BYTES = Counter("irc_received_bytes", "Bytes read from the chat connection")
+LINES_PARSED = Counter("irc_lines_parsed", "Lines received and parsed")
+HANDLER_SECONDS = Histogram("irc_handler_seconds", "Time spent in each message handler", "handler")
+SEND_WAIT_SECONDS = Histogram("irc_send_queue_wait_seconds", "Time chat messages waited in the outbound queue")
+FLUSH_SECONDS = Histogram("db_flush_seconds", "Time taken by a character flush")
+JOURNAL_SYNC_SECONDS = Histogram("journal_sync_seconds", "Time taken to write and sync a batch of journal events")
+INBOUND_SHED = Counter("irc_inbound_shed", "Chat lines dropped unparsed because the inbound queue was full")
+RECONNECTS = Counter("irc_reconnects", "Connections opened again after being lost")
+COMMANDS_THROTTLED = Counter("irc_commands_throttled", "Chat commands dropped by the throttle before reaching the handlers")
+CHAT_LOG_DROPPED = Counter("chat_log_dropped", "Chat messages not logged because the log queue was full")
+
+def enable() -> None:
+    global enabled
+    enabled = True
+
+def disable() -> None:
+    global enabled
+    enabled = False
+
+def render() -> str:
+    """
+    All metrics in the Prometheus text format
+    """
+
+    lines: List[str] = []
+    for metric in _metrics:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+def _serve(host: str, port: int) -> Any:
+    """
+    An HTTP server for the metrics. http.server is only imported here,
+    most runs never serve metrics and should not pay for it at startup
+    """
+
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class _MetricsRequestHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path != "/metrics":
+                self.send_error(404)
+                return
+            body = render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            # Scrapes every few seconds would flood the console
+            pass
+
+    return ThreadingHTTPServer((host, port), _MetricsRequestHandler)
+
+class MetricsServer():
+    """
+    Serves the metrics on http://host:port/metrics for Prometheus. Only
+    listens on the loopback interface unless told otherwise
+    """
+
+    _instance: Any = None
+
+    def __new__(self):
+        if self._instance == None:
+            self._instance = super(MetricsServer, self).__new__(self)
+            self._server: Any = None
+            self._thread: Any = None
+
+        return self._instance
+
+    def start(self, port: int = 9100, host: str = "127.0.0.1") -> int:
+        """
+        Starts serving and turns metrics on, returns the port
+        """
+
+        if self._server is not None:
+            raise RuntimeError("The metrics server is already running")
+
+        self._server = _serve(host, port)
+        self._server.daemon_threads = True
+        self._thread = Thread(target=self._server.serve_forever, name="MetricsServerThread", daemon=True)
+        self._thread.start()
+        enable()
+        return self._server.server_address[1]
+
+    def stop(self) -> None:
+        """
+        Stops serving and turns metrics off
+        """
+
+        if self._server is None:
+            raise RuntimeError("The metrics server is not running")
+
+        disable()
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+        self._server = None
+        self._thread = None
+
+    def is_running(self) -> bool:
+        return self._server is not None
+
+class SamplingProfiler():
+    """
+    Looks at the stack of every thread a few hundred times a second and
+    counts how often each stack shows up. Nothing is hooked into the
+    code, so the bot runs at full speed while it is off and only pays for
+    the sampling thread while it is on. Results are written in the
+    collapsed stack format flame graph tools read
+    """
+
+    _instance: Any = None
+
+    def __new__(self):
+        if self._instance == None:
+            self._instance = super(SamplingProfiler, self).__new__(self)
+            self._thread: Any = None
+            self._stop = Event()
+            self._stacks: Dict[str, int] = {}
+            self.samples = 0
+
+        return self._instance
+
+    def start(self, interval: float = 0.005) -> None:
+        if self._thread is not None:
+            raise RuntimeError("The profiler is already running")
+
+        self._stacks = {}
+        self.samples = 0
+        self._stop.clear()
+        self._thread = Thread(target=self._run, args=(interval,), name="SamplingProfilerThread", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> Dict[str, int]:
+        """
+        Stops sampling, returns how many times each stack was seen
+        """
+
+        if self._thread is None:
+            raise RuntimeError("The profiler is not running")
+
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        return self._stacks
+
+    def is_running(self) -> bool:
+        return self._thread is not None
+
+    def _run(self, interval: float) -> None:
+        own = get_ident()
+        names: Dict[int, str] = {}
+        while not self._stop.wait(interval):
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = ["%s (%s:%i)" % (f.f_code.co_name, f.f_code.co_filename.rsplit("/", 1)[-1], f.f_lineno)
+                    for f, _ in traceback.walk_stack(frame)]
+                stack.reverse()
+                thread = names.get(ident)
+                if thread is None:
+                    thread = _thread_name(ident)
+                    names[ident] = thread
+                key = thread + ";" + ";".join(stack)
+                self._stacks[key] = self._stacks.get(key, 0) + 1
+            self.samples += 1
+
+    def write(self, filename: str, stacks: Dict[str, int]) -> None:
+        """
+        Writes stacks as 'frame;frame;frame count' lines
+        """
+
+        with open(filename, "w") as f:
+            for stack, count in sorted(stacks.items()):
+                f.write("%s %i\n" % (stack, count))
+
+    @staticmethod
+    def top(stacks: Dict[str, int], count: int = 10) -> List[Tuple[str, int]]:
+        """
+        The functions most often found running (at the top of the stack)
+        """
+
+        leaves: Dict[str, int] = {}
+        for stack, seen in stacks.items():
+            leaf = stack.rsplit(";", 1)[-1]
+            leaves[leaf] = leaves.get(leaf, 0) + seen
+        return sorted(leaves.items(), key=lambda item: -item[1])[:count]
+
+def _thread_name(ident: int) -> str:
+    for thread in enumerate_threads():
+        if thread.ident == ident:
+            return thread.name
+    return "thread-%i" % (ident)
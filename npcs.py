@@ -0,0 +1,222 @@
+import json
+import os
+from threading import Lock
+from typing import Any, Dict, List, Tuple
+from catalog import ChatError, DEFAULT_LOCALE, MessageCatalog
+from combat import hit_threshold
+
+# The NPC definitions and spawn tables loaded at startup, see NpcRegistry
+NPCS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "npcs.json")
+
+# The spawn table of '!game start' without a table name
+DEFAULT_TABLE = "default"
+
+# Rolls are 53 bit integers like the ones of combat
+_ROLL_SCALE = 1.0 / (1 << 53)
+
+class NpcTemplate:
+    """
+    One kind of NPC, built from an entry in the npcs file. There is only
+    one instance per kind, shared by every NPC of it; all that differs
+    between two fights against it is in Npc. Its name is the message
+    npc.<key> of the messages file, so every locale has its own
+    """
+
+    __slots__ = ("id", "key", "description", "hp", "damage", "hit_chance", "hit_threshold", "xp", "message_id")
+
+    def __init__(self, key, data):
+        self.key = key
+        self.id = int(data["id"])
+        self.description = data.get("description", "")
+        # hp when spawned, damage per hit and how likely an attacker gets hit
+        self.hp = int(data["hp"])
+        self.damage = int(data.get("damage", 3))
+        self.hit_chance = float(data.get("hit_chance", 0.25))
+        if self.hp <= 0 or not 0.0 <= self.hit_chance <= 1.0:
+            raise RuntimeError("NPC %s needs hp above 0 and a hit_chance from 0 to 1" % (key))
+        self.hit_threshold = hit_threshold(self.hit_chance)
+        # xp every hero gets per round of a fight against it
+        self.xp = int(data.get("xp", 1))
+        self.message_id = "npc." + key
+
+    def __str__(self):
+        return self.key
+
+class Npc:
+    """
+    An NPC in a fight: the shared template and the hp it has left. A game
+    keeps its Npc and spawns the next one into it, so starting fights in
+    thousands of channels allocates nothing
+    """
+
+    __slots__ = ("template", "hp", "max_hp")
+
+    def __init__(self):
+        self.template: Any = None
+        self.hp = 0
+        self.max_hp = 0
+
+    def spawn(self, template: NpcTemplate, hp: Any = None) -> None:
+        """
+        Becomes a fresh NPC of template, with its own hp unless given
+        """
+
+        self.template = template
+        self.max_hp = hp if hp is not None else template.hp
+        self.hp = self.max_hp
+
+class SpawnTable:
+    """
+    Picks NPC templates by weight in constant time, whatever the number of
+    entries (Vose's alias method). Built once when the file is loaded: every
+    slot holds one template and an alias, a roll picks a slot and then
+    either of the two, so a pick is one multiplication and one comparison
+    """
+
+    __slots__ = ("name", "templates", "_scale", "_prob", "_alias")
+
+    def __init__(self, name: str, entries: List[Tuple[NpcTemplate, float]]):
+        if not entries or any(weight <= 0 for _, weight in entries):
+            raise RuntimeError("Spawn table %s needs NPCs with weights above 0" % (name))
+
+        self.name = name
+        self.templates = [template for template, _ in entries]
+        count = len(entries)
+        total = float(sum(weight for _, weight in entries))
+        scaled = [weight * count / total for _, weight in entries]
+        prob = [1.0] * count
+        alias = list(self.templates)
+
+        small = [i for i in range(count) if scaled[i] < 1.0]
+        large = [i for i in range(count) if scaled[i] >= 1.0]
+        while small and large:
+            less = small.pop()
+            more = large.pop()
+            prob[less] = scaled[less]
+            alias[less] = self.templates[more]
+            # The rest of the big one's weight goes into another slot
+            scaled[more] = scaled[more] + scaled[less] - 1.0
+            if scaled[more] < 1.0:
+                small.append(more)
+            else:
+                large.append(more)
+        # Whatever is left is 1 up to rounding and keeps its own slot
+
+        self._scale = count * _ROLL_SCALE
+        self._prob = prob
+        self._alias = alias
+
+    def pick(self, roll: int) -> NpcTemplate:
+        """
+        The template a 53 bit random roll picks
+        """
+
+        position = roll * self._scale
+        slot = int(position)
+        if position - slot < self._prob[slot]:
+            return self.templates[slot]
+        return self._alias[slot]
+
+    def sample(self, rng: Any) -> NpcTemplate:
+        return self.pick(rng.getrandbits(53))
+
+class NpcRegistry():
+    """
+    All NPC templates and spawn tables, loaded from a JSON file with an
+    "npcs" object (name to definition: id, hp, damage, hit_chance, xp)
+    and a "spawn_tables" object (table name to NPC name to weight).
+
+    reload() swaps everything at once, fights that are on keep the
+    templates they started with. Nothing changes if the file is broken
+    """
+
+    _instance: Any = None
+
+    def __new__(self):
+        if self._instance == None:
+            self._instance = super(NpcRegistry, self).__new__(self)
+            self._filename: str = NPCS_FILE
+            self._lock = Lock()
+            self._templates: Dict[str, NpcTemplate] = {}
+            self._tables: Dict[str, SpawnTable] = {}
+            self._loaded = False
+
+        return self._instance
+
+    def load(self, filename: str = "") -> None:
+        """
+        Reads the npcs file (the default one if no filename given)
+        """
+
+        self._lock.acquire()
+        try:
+            if filename != "":
+                self._filename = filename
+
+            try:
+                with open(self._filename, encoding="utf-8") as f:
+                    data = json.load(f)
+                templates = { key: NpcTemplate(key, entry) for key, entry in data["npcs"].items() }
+                tables = {}
+                for name, weights in data["spawn_tables"].items():
+                    for key in weights:
+                        if key not in templates:
+                            raise RuntimeError("Spawn table %s has an unknown NPC %s" % (name, key))
+                    tables[name] = SpawnTable(name, [(templates[key], float(weight)) for key, weight in weights.items()])
+            except (OSError, ValueError, KeyError, TypeError, AttributeError) as e:
+                raise RuntimeError("Could not load NPCs from %s: %s" % (self._filename, e))
+
+            ids = set()
+            for template in templates.values():
+                if template.id in ids:
+                    raise RuntimeError("NPC id %i is used twice" % (template.id))
+                ids.add(template.id)
+                try:
+                    MessageCatalog().render(DEFAULT_LOCALE, template.message_id)
+                except RuntimeError:
+                    raise RuntimeError("NPC %s has no name (%s) in the messages file" % (template.key, template.message_id))
+            if DEFAULT_TABLE not in tables:
+                raise RuntimeError("There has to be a spawn table named %s" % (DEFAULT_TABLE))
+
+            self._templates = templates
+            self._tables = tables
+            self._loaded = True
+        finally:
+            self._lock.release()
+
+    def reload(self) -> None:
+        self.load()
+
+    def _ensure_loaded(self) -> None:
+        if not self._loaded:
+            self.load()
+
+    def get(self, key: str) -> NpcTemplate:
+        """
+        Returns an NPC template by its name
+        """
+
+        self._ensure_loaded()
+        template = self._templates.get(key)
+        if template is None:
+            raise ChatError("npc.unknown", name=key)
+        return template
+
+    def table(self, name: str = DEFAULT_TABLE) -> SpawnTable:
+        """
+        Returns a spawn table by its name
+        """
+
+        self._ensure_loaded()
+        table = self._tables.get(name)
+        if table is None:
+            raise ChatError("npc.no_table", name=name)
+        return table
+
+    def names(self) -> List[str]:
+        self._ensure_loaded()
+        return list(self._templates)
+
+    def tables(self) -> List[str]:
+        self._ensure_loaded()
+        return list(self._tables)
@@ -0,0 +1,169 @@
+from collections import deque
+from typing import Any, Dict, List, Tuple
+
+# How a received line is treated when the bot cannot keep up, see
+# classify_line. Lower numbers are kept longer
+LINE_CONTROL = 0 # RECONNECT, notices and everything else from the server, never shed
+LINE_COMMAND = 1 # chat starting with the command prefix, never shed
+LINE_CHAT = 2 # other chat, JOIN and PART, shed first
+
+def classify_line(line: str, prefix: str = "!") -> int:
+    """
+    Tells commands, plain chat and server lines apart without parsing
+    the line, so a line that is going to be shed costs next to nothing
+    """
+
+    start = 0
+    if line.startswith("@"):
+        start = line.find(" ") + 1
+    if line.startswith(":", start):
+        start = line.find(" ", start) + 1
+    end = line.find(" ", start)
+    command = line[start:end] if end >= 0 else line[start:]
+
+    if command == "PRIVMSG":
+        text = line.find(" :", end)
+        if text >= 0 and line.startswith(prefix, text + 2):
+            return LINE_COMMAND
+        return LINE_CHAT
+    if command == "JOIN" or command == "PART":
+        return LINE_CHAT
+    return LINE_CONTROL
+
+class InboundQueue:
+    """
+    Received lines waiting to be parsed and dispatched, oldest first.
+    Bounded twice: past limit lines chat is shed as it arrives, commands
+    and server lines still get in; at hard_limit the client stops reading
+    from the socket until the queue is down to resume_at, so a raid
+    slows the connection down instead of filling memory.
+
+    Once anything was shed the queue is overloaded until it is down to
+    resume_at again, meanwhile chat that is already queued is shed as it
+    is taken out too, so commands are not stuck behind it. Lines are only
+    classified then, otherwise they cost a tuple each. Only used on the
+    event loop, it has no lock
+    """
+
+    def __init__(self, limit: int = 10000, hard_limit: int = 0, prefix: str = "!", samples: int = 10000):
+        self.set_limits(limit, hard_limit)
+        self.prefix = prefix
+        # (line, time received)
+        self._lines: Any = deque()
+        self._waits: Any = deque(maxlen=samples)
+        self.queued = 0
+        self.shed = 0
+        # Commands and server lines let in past limit
+        self.kept = 0
+        self.max_depth = 0
+        self.overloaded = False
+
+    def set_limits(self, limit: int, hard_limit: int = 0) -> None:
+        if limit < 1:
+            raise RuntimeError("The inbound queue needs room for at least one line")
+        self.limit = limit
+        self.hard_limit = max(hard_limit or 2 * limit, limit)
+        self.resume_at = limit // 2
+
+    def __len__(self):
+        return len(self._lines)
+
+    def push(self, line: str, now: float) -> bool:
+        """
+        Queues a line, returns False if it was shed
+        """
+
+        lines = self._lines
+        if len(lines) >= self.limit:
+            if classify_line(line, self.prefix) == LINE_CHAT:
+                self.shed += 1
+                self.overloaded = True
+                return False
+            self.kept += 1
+        lines.append((line, now))
+        self.queued += 1
+        if len(lines) > self.max_depth:
+            self.max_depth = len(lines)
+        return True
+
+    def is_full(self) -> bool:
+        return len(self._lines) >= self.hard_limit
+
+    def pop_batch(self, count: int, now: float) -> List[Tuple[str, float]]:
+        """
+        Takes up to count of the oldest lines, fewer if chat among them
+        is shed
+        """
+
+        lines = self._lines
+        if len(lines) <= count:
+            batch = list(lines)
+            lines.clear()
+        else:
+            batch = [lines.popleft() for _ in range(count)]
+        if batch:
+            # The oldest line of the batch waited longest
+            self._waits.append(now - batch[0][1])
+
+        if self.overloaded:
+            prefix = self.prefix
+            kept = [item for item in batch if classify_line(item[0], prefix) != LINE_CHAT]
+            self.shed += len(batch) - len(kept)
+            batch = kept
+            if len(lines) <= self.resume_at:
+                self.overloaded = False
+        return batch
+
+    def stats(self) -> Dict[str, Any]:
+        result: Dict[str, Any] = {
+            "depth": len(self._lines),
+            "max_depth": self.max_depth,
+            "limit": self.limit,
+            "hard_limit": self.hard_limit,
+            "queued": self.queued,
+            "shed": self.shed,
+            "kept": self.kept,
+            "overloaded": self.overloaded,
+        }
+        result.update(percentiles(self._waits))
+        return result
+
+class StageStats:
+    """
+    How many items a pipeline stage handled and the time it took, per
+    item and for the slowest batch
+    """
+
+    __slots__ = ("items", "seconds", "max_batch")
+
+    def __init__(self):
+        self.items = 0
+        self.seconds = 0.0
+        self.max_batch = 0.0
+
+    def observe(self, items: int, seconds: float) -> None:
+        self.items += items
+        self.seconds += seconds
+        if seconds > self.max_batch:
+            self.max_batch = seconds
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "items": self.items,
+            "us_per_item": self.seconds / self.items * 1e6 if self.items else 0.0,
+            "max_batch_ms": self.max_batch * 1000,
+        }
+
+def percentiles(samples: Any) -> Dict[str, float]:
+    """
+    p50, p90, p99 and max of samples in seconds, as milliseconds
+    """
+
+    values = sorted(samples)
+    result = {}
+    for name, fraction in (("p50", 0.5), ("p90", 0.9), ("p99", 0.99), ("max", 1.0)):
+        if values:
+            result[name] = values[min(int(len(values) * fraction), len(values) - 1)] * 1000
+        else:
+            result[name] = 0.0
+    return result
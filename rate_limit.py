@@ -0,0 +1,252 @@
+import time
+from collections import deque
+from threading import Lock
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import metrics
+
+# Outbound lanes, lower numbers are sent first
+PRIORITY_CONTROL = 0 # PONG, PART, not counted against the chat limit
+PRIORITY_MODERATION = 1 # timeouts, bans and other mod actions
+PRIORITY_NORMAL = 2 # regular chat replies, may be coalesced
+
+# Twitch drops chat messages longer than this
+MAX_MESSAGE_LENGTH = 500
+
+COALESCE_SEPARATOR = " | "
+
+# Channels named in one JOIN/PART line, keeps lines well under the 512
+# byte limit. Each channel of a JOIN still counts against the JOIN limit
+CHANNELS_PER_LINE = 15
+
+class TokenBucket:
+    """
+    Classic token bucket: holds up to capacity tokens and regains
+    fill_rate tokens per second. The clock can be swapped out, so
+    the bucket can be driven by a fake clock
+    """
+
+    def __init__(self, capacity: float, fill_rate: float, clock: Callable[[], float] = time.monotonic):
+        self.capacity = capacity
+        self.fill_rate = fill_rate
+        self._clock = clock
+        self._tokens = capacity
+        self._last = clock()
+
+    @classmethod
+    def for_limit(cls, messages: int, period: float, clock: Callable[[], float] = time.monotonic) -> "TokenBucket":
+        """
+        Builds a bucket that never lets more than messages through in any
+        window of period seconds: half the limit is available as a burst,
+        the other half trickles in over the period
+        """
+
+        capacity = max(messages // 2, 1)
+        return cls(capacity, (messages - capacity) / period, clock)
+
+    def _refill(self) -> None:
+        now = self._clock()
+        self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.fill_rate)
+        self._last = now
+
+    def try_take(self, tokens: float = 1) -> bool:
+        """
+        Takes tokens if there are enough, returns whether it did
+        """
+
+        self._refill()
+        if self._tokens >= tokens:
+            self._tokens -= tokens
+            return True
+        return False
+
+    def wait_time(self, tokens: float = 1) -> float:
+        """
+        Seconds until tokens will be available
+        """
+
+        self._refill()
+        if self._tokens >= tokens:
+            return 0.0
+        if self.fill_rate <= 0:
+            return float("inf")
+        return (tokens - self._tokens) / self.fill_rate
+
+class OutboundQueue:
+    """
+    Queue for everything the bot sends. Control lines go out right away,
+    chat messages wait for a token from the bucket, moderation before
+    normal replies. While normal replies pile up they get merged into one
+    line per channel, as long as it stays under MAX_MESSAGE_LENGTH.
+    Chat lanes hold at most max_pending messages, newer ones are dropped
+    and counted.
+
+    Channels to join wait for a token of join_bucket each, Twitch has a
+    limit of its own for them (20 per 10 seconds unless the bot is
+    verified). They go out ahead of chat, but chat is not held up while
+    they wait
+    """
+
+    def __init__(self, bucket: TokenBucket, max_pending: int = 1000, clock: Callable[[], float] = time.monotonic, join_bucket: TokenBucket = None):
+        self.bucket = bucket
+        self.join_bucket = join_bucket if join_bucket is not None else TokenBucket.for_limit(20, 10, clock)
+        self.max_pending = max_pending
+        self._clock = clock
+        self._lock = Lock()
+        self._lanes: Tuple[Any, Any, Any] = (deque(), deque(), deque())
+        self._joins: Any = deque()
+
+        self.sent = 0
+        self.joined = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.max_wait = 0.0
+
+    def push(self, channel: str, text: str, priority: int = PRIORITY_NORMAL) -> bool:
+        """
+        Queues a chat message, returns False if it was dropped
+        """
+
+        self._lock.acquire()
+        try:
+            lane = self._lanes[priority]
+            if len(lane) >= self.max_pending:
+                self.dropped += 1
+                return False
+            lane.append((channel, text, self._clock()))
+            return True
+        finally:
+            self._lock.release()
+
+    def push_control(self, data: bytes) -> None:
+        """
+        Queues a raw protocol line, these are never dropped or delayed
+        """
+
+        self._lock.acquire()
+        try:
+            self._lanes[PRIORITY_CONTROL].append(data)
+        finally:
+            self._lock.release()
+
+    def push_joins(self, channels: List[str], restart: bool = False) -> None:
+        """
+        Queues channels to join. restart drops the ones still queued
+        first, for a new connection that has to join everything again
+        """
+
+        self._lock.acquire()
+        try:
+            if restart:
+                self._joins.clear()
+            for channel in channels:
+                if channel not in self._joins:
+                    self._joins.append(channel)
+        finally:
+            self._lock.release()
+
+    def cancel_join(self, channel: str) -> None:
+        """
+        Forgets a channel that was left before it was joined
+        """
+
+        self._lock.acquire()
+        try:
+            if channel in self._joins:
+                self._joins.remove(channel)
+        finally:
+            self._lock.release()
+
+    def pop(self) -> Tuple[Optional[bytes], Optional[float]]:
+        """
+        Returns the next line to write and None, or None and the number of
+        seconds to wait before trying again (None if the queue is empty)
+        """
+
+        self._lock.acquire()
+        try:
+            control, moderation, normal = self._lanes
+            if control:
+                return control.popleft(), None
+
+            wait = None
+            joins = self._joins
+            if joins:
+                names = []
+                while joins and len(names) < CHANNELS_PER_LINE and self.join_bucket.try_take():
+                    names.append(joins.popleft())
+                if names:
+                    self.joined += len(names)
+                    return f'JOIN {",".join(names)}\r\n'.encode('utf-8'), None
+                wait = self.join_bucket.wait_time()
+
+            if not moderation and not normal:
+                return None, wait
+            if not self.bucket.try_take():
+                chat_wait = self.bucket.wait_time()
+                return None, chat_wait if wait is None else min(wait, chat_wait)
+
+            if moderation:
+                channel, text, queued = moderation.popleft()
+            else:
+                channel, text, queued = self._pop_coalesced(normal)
+
+            self.sent += 1
+            wait = self._clock() - queued
+            self.max_wait = max(self.max_wait, wait)
+            if metrics.enabled:
+                metrics.SEND_WAIT_SECONDS.observe(wait)
+            return f'PRIVMSG {channel} :{text}\r\n'.encode('utf-8'), None
+        finally:
+            self._lock.release()
+
+    def _pop_coalesced(self, lane: Any) -> Tuple[str, str, float]:
+        """
+        Takes the oldest message and merges later ones for the same
+        channel into it while they fit. The first one that does not fit
+        ends it, a later one must never go out before it
+        """
+
+        channel, text, queued = lane.popleft()
+        if not lane:
+            return channel, text, queued
+
+        parts = [text]
+        length = len(text)
+        full = False
+        kept = deque()
+        for item in lane:
+            if item[0] == channel and not full:
+                if length + len(COALESCE_SEPARATOR) + len(item[1]) <= MAX_MESSAGE_LENGTH:
+                    parts.append(item[1])
+                    length += len(COALESCE_SEPARATOR) + len(item[1])
+                    continue
+                full = True
+            kept.append(item)
+
+        if len(parts) > 1:
+            self.coalesced += len(parts) - 1
+            lane.clear()
+            lane.extend(kept)
+        return channel, COALESCE_SEPARATOR.join(parts), queued
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Queue depth per lane and of the channels to join, plus sent,
+        joined, dropped and coalesced counters
+        """
+
+        self._lock.acquire()
+        try:
+            return {
+                "control": len(self._lanes[PRIORITY_CONTROL]),
+                "moderation": len(self._lanes[PRIORITY_MODERATION]),
+                "normal": len(self._lanes[PRIORITY_NORMAL]),
+                "joins": len(self._joins),
+                "sent": self.sent,
+                "joined": self.joined,
+                "dropped": self.dropped,
+                "coalesced": self.coalesced,
+                "max_wait": self.max_wait,
+            }
+        finally:
+            self._lock.release()
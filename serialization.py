@@ -0,0 +1,172 @@
+import io
+import pickle
+import struct
+from typing import Any, Callable, Dict
+from character import Character
+from classes import ClassRegistry
+
+# Bump when the record layout changes and add an upgrade from the previous version
+FORMAT_VERSION = 3
+
+# Class ids come from the classes file (ClassRegistry)
+GENDER_IDS = {"": 0, "male": 1, "m": 1, "female": 2, "f": 2}
+GENDER_NAMES = {0: "", 1: "male", 2: "female"}
+
+# version, class id, gender id, level, hp, max hp, name length; name follows
+_HEADER_V1 = struct.Struct("<BBBHhhH")
+
+# version, class id, gender id, level, hp, max hp, xp, name length; name follows
+_HEADER_V2 = struct.Struct("<BBBHhhIH")
+
+# version, class id, gender id, level, hp, max hp, xp, hero id, name length; name follows
+_HEADER_V3 = struct.Struct("<BBBHhhIQH")
+
+# Pickled rows from before the versioned format all start with the PROTO opcode
+_PICKLE_PROTO = 0x80
+
+def encode_character(char: Character) -> bytes:
+    """
+    Packs the state of a character into a small versioned record
+    """
+
+    name = char.name.encode("utf-8")
+    return _HEADER_V3.pack(
+        FORMAT_VERSION,
+        char.Class.id,
+        GENDER_IDS.get(char.gender, 0),
+        char.level,
+        char.hp,
+        char.max_hp,
+        char.xp,
+        char.hero_id,
+        len(name),
+    ) + name
+
+def decode_character(data: bytes) -> Character:
+    """
+    Rebuilds a character from a record of any known version, older
+    records are upgraded to the current layout on the way
+    """
+
+    version = data[0]
+    if version == _PICKLE_PROTO:
+        fields = _read_pickle(data)
+        version = 0
+    elif version in _READERS:
+        fields = _READERS[version](data)
+    else:
+        raise RuntimeError("Unknown character record version %i" % (version))
+
+    while version < FORMAT_VERSION:
+        fields = _UPGRADES[version](fields)
+        version += 1
+
+    return Character.restore(fields["name"], fields["class"], fields["gender"],
+        fields["level"], fields["hp"], fields["max_hp"], fields["xp"], fields["hero_id"])
+
+def _read_v1(data: bytes) -> Dict[str, Any]:
+    _, class_id, gender_id, level, hp, max_hp, name_length = _HEADER_V1.unpack_from(data)
+    start = _HEADER_V1.size
+    return {
+        "name": data[start:start + name_length].decode("utf-8"),
+        "class": ClassRegistry().get_by_id(class_id).name,
+        "gender": GENDER_NAMES[gender_id],
+        "level": level,
+        "hp": hp,
+        "max_hp": max_hp,
+    }
+
+def _read_v2(data: bytes) -> Dict[str, Any]:
+    _, class_id, gender_id, level, hp, max_hp, xp, name_length = _HEADER_V2.unpack_from(data)
+    start = _HEADER_V2.size
+    return {
+        "name": data[start:start + name_length].decode("utf-8"),
+        "class": ClassRegistry().get_by_id(class_id).name,
+        "gender": GENDER_NAMES[gender_id],
+        "level": level,
+        "hp": hp,
+        "max_hp": max_hp,
+        "xp": xp,
+    }
+
+def _read_v3(data: bytes) -> Dict[str, Any]:
+    _, class_id, gender_id, level, hp, max_hp, xp, hero_id, name_length = _HEADER_V3.unpack_from(data)
+    start = _HEADER_V3.size
+    return {
+        "name": data[start:start + name_length].decode("utf-8"),
+        "class": ClassRegistry().get_by_id(class_id).name,
+        "gender": GENDER_NAMES[gender_id],
+        "level": level,
+        "hp": hp,
+        "max_hp": max_hp,
+        "xp": xp,
+        "hero_id": hero_id,
+    }
+
+class _LegacyObject:
+    """
+    Stands in for the old Character, HeroClass and Action classes when
+    reading pickles, they were plain objects with a __dict__
+    """
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+
+class _LegacyUnpickler(pickle.Unpickler):
+    def find_class(self, module, name):
+        if module in ("character", "classes", "actions"):
+            return _LegacyObject
+        raise pickle.UnpicklingError("Unexpected %s.%s in a character row" % (module, name))
+
+def _read_pickle(data: bytes) -> Dict[str, Any]:
+    """
+    Reads a row written by the old pickle based Database.insert_data
+    """
+
+    char = _LegacyUnpickler(io.BytesIO(data)).load()
+    return {
+        "name": char.name,
+        "class": char.Class.name,
+        "gender": char.Class.gender,
+        "level": char.level,
+        "hp": char.hp,
+        "max_hp": char.max_hp,
+    }
+
+def _upgrade_0(fields: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Pickled characters could have any gender text, only the ones that
+    changed how the hero is shown are kept
+    """
+
+    fields["gender"] = GENDER_NAMES[GENDER_IDS.get(fields["gender"], 0)]
+    return fields
+
+def _upgrade_1(fields: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Heroes from before experience points start with none
+    """
+
+    fields["xp"] = 0
+    return fields
+
+def _upgrade_2(fields: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Heroes from before hero ids all share 0
+    """
+
+    fields["hero_id"] = 0
+    return fields
+
+_READERS: Dict[int, Callable[[bytes], Dict[str, Any]]] = {
+    1: _read_v1,
+    2: _read_v2,
+    3: _read_v3,
+}
+
+# _UPGRADES[n] turns the fields of version n into those of version n + 1
+_UPGRADES: Dict[int, Callable[[Dict[str, Any]], Dict[str, Any]]] = {
+    0: _upgrade_0,
+    1: _upgrade_1,
+    2: _upgrade_2,
+}
@@ -1,8 +1,19 @@
-from pip._internal import main as p
+from setuptools import setup
 
-required_modules = [
-    "certifi"
-]
-
-for module in required_modules:
-    p(['install', module])
\ No newline at end of file
+# The bot runs from its checkout (conf.py, classes.json, messages.json and
+# npcs.json live next to the modules), installing it only pulls in the
+# dependencies, start it with python3 main.py:
+#   pip install -e .            or with NumPy for big fights:   pip install -e .[numpy]
+setup(
+    name="twitch-rpg-bot",
+    version="0.1.0",
+    python_requires=">=3.8",
+    py_modules=[
+        "main", "conf", "util", "irc_client", "irc_message", "rate_limit", "workers", "commands",
+        "handlers", "channel", "character", "classes", "actions", "game", "combat", "npcs",
+        "catalog", "database", "store", "serialization", "journal", "leaderboard", "chatlog", "dump", "simulate",
+        "metrics", "throttle", "sharding", "supervisor", "pipeline", "fake_irc",
+    ],
+    install_requires=["certifi"],
+    extras_require={"numpy": ["numpy"]},
+)
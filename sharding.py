@@ -0,0 +1,70 @@
+import hashlib
+from bisect import bisect
+from typing import Any, Dict, Iterable, List
+
+class HashRing:
+    """
+    Consistent hashing of channels onto workers. Every worker gets
+    replicas points on a ring of 64 bit hashes and a channel belongs to
+    the first point after its own hash. Adding or removing a worker only
+    moves the channels next to its points, about 1/N of them, the rest
+    stay where they are (and keep their warm caches)
+    """
+
+    def __init__(self, nodes: Iterable[Any] = (), replicas: int = 100):
+        self.replicas = replicas
+        self._points: List[int] = []
+        self._owners: List[Any] = []
+        self._nodes: List[Any] = []
+        for node in nodes:
+            self.add_node(node)
+
+    def add_node(self, node: Any) -> None:
+        if node in self._nodes:
+            raise RuntimeError("Worker %s is already on the ring" % (node))
+
+        self._nodes.append(node)
+        for replica in range(self.replicas):
+            point = _hash("%s#%i" % (node, replica))
+            index = bisect(self._points, point)
+            self._points.insert(index, point)
+            self._owners.insert(index, node)
+
+    def remove_node(self, node: Any) -> None:
+        if node not in self._nodes:
+            raise RuntimeError("Worker %s is not on the ring" % (node))
+
+        self._nodes.remove(node)
+        kept = [(point, owner) for point, owner in zip(self._points, self._owners) if owner != node]
+        self._points = [point for point, _ in kept]
+        self._owners = [owner for _, owner in kept]
+
+    def nodes(self) -> List[Any]:
+        return list(self._nodes)
+
+    def node_for(self, key: str) -> Any:
+        """
+        The worker a channel belongs to
+        """
+
+        if not self._points:
+            raise RuntimeError("There are no workers on the ring")
+        index = bisect(self._points, _hash(key))
+        if index == len(self._points):
+            index = 0
+        return self._owners[index]
+
+    def assign(self, keys: Iterable[str]) -> Dict[Any, List[str]]:
+        """
+        Splits channels into the shards of all workers, workers without
+        channels get an empty list
+        """
+
+        shards: Dict[Any, List[str]] = { node: [] for node in self._nodes }
+        for key in keys:
+            shards[self.node_for(key)].append(key)
+        return shards
+
+def _hash(key: str) -> int:
+    # Python's hash() differs between processes, this must not
+    return int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "big")
@@ -0,0 +1,143 @@
+import multiprocessing
+import random
+import time
+from typing import Any, Dict, List
+from character import Character
+from classes import ClassRegistry
+from game import Game
+from npcs import DEFAULT_TABLE
+
+# How synthetic heroes pick what to do every tick: mostly attack, heal
+# if the class can, now and then run away
+ATTACK_CHANCE = 0.8
+RUN_CHANCE = 0.01
+
+def _new_stats() -> Dict[str, Any]:
+    return {
+        "actions": 0,
+        "encounters": 0,
+        "won": 0,
+        "ticks": 0,
+        # NPC -> [encounters, won by the heroes, ticks]
+        "npcs": {},
+        # class -> [heroes, survived, levels gained]
+        "classes": {},
+    }
+
+def merge_stats(total: Dict[str, Any], stats: Dict[str, Any]) -> Dict[str, Any]:
+    for key in ("actions", "encounters", "won", "ticks"):
+        total[key] += stats[key]
+    for group in ("npcs", "classes"):
+        for name, counts in stats[group].items():
+            mine = total[group].setdefault(name, [0] * len(counts))
+            for index, count in enumerate(counts):
+                mine[index] += count
+    return total
+
+def _party(rng: random.Random, size: int) -> List[Any]:
+    registry = ClassRegistry()
+    party = []
+    for i in range(size):
+        hero_class = registry.get(rng.choice(registry.names()))
+        genders = sorted(hero_class.genders) if hero_class.genders is not None else ["male", "female"]
+        party.append(("sim%i" % (i), Character("hero%i" % (i), hero_class.name, rng.choice(genders))))
+    return party
+
+def simulate_shard(seed: int, actions: int, party_size: int = 5, level: int = 10, table: str = DEFAULT_TABLE) -> Dict[str, Any]:
+    """
+    Fights encounters until at least actions hero actions were taken and
+    returns what happened. Every encounter is a fresh party of random
+    classes at the given level against an NPC from the spawn table; each
+    tick every hero still standing does something through Character.do
+    and the game, as a '!do' from chat would. Nothing is sent or saved
+    """
+
+    rng = random.Random(seed)
+    game = Game(seed=seed)
+    stats = _new_stats()
+
+    while stats["actions"] < actions:
+        party = _party(rng, party_size)
+        for _, char in party:
+            char.level = level
+        game.start_new(schedule=False, table=table)
+        npc = game.boss.template.key
+
+        while game.running:
+            acted = False
+            for user, char in party:
+                if char.hp <= 0 or (user in game.combatants.rows and not game.combatants.alive[game.combatants.rows[user]]):
+                    continue
+                roll = rng.random()
+                if roll < RUN_CHANCE:
+                    action = "run"
+                elif roll < ATTACK_CHANCE or "heal" not in char.Class.actions:
+                    action = "attack"
+                else:
+                    action = "heal"
+                char.do([action])
+                game.submit(user, char, action)
+                stats["actions"] += 1
+                acted = True
+            if not acted:
+                # Everyone ran away
+                game.stop()
+                break
+            game.resolve_tick()
+
+        won = game.boss_hp <= 0
+        stats["encounters"] += 1
+        stats["won"] += 1 if won else 0
+        stats["ticks"] += game.tick
+        counts = stats["npcs"].setdefault(npc, [0, 0, 0])
+        counts[0] += 1
+        counts[1] += 1 if won else 0
+        counts[2] += game.tick
+        combatants = game.combatants
+        for row in range(len(combatants)):
+            char = combatants.chars[row]
+            counts = stats["classes"].setdefault(char.class_name, [0, 0, 0])
+            counts[0] += 1
+            counts[1] += combatants.alive[row]
+            counts[2] += char.level - level
+    return stats
+
+def _run_shard(args: Any) -> Dict[str, Any]:
+    return simulate_shard(*args)
+
+def run_simulation(actions: int, workers: int = 1, party_size: int = 5, level: int = 10, table: str = DEFAULT_TABLE, seed: int = 0) -> Dict[str, Any]:
+    """
+    Splits actions over worker processes (each with its own seed, so a
+    run can be repeated exactly) and returns the merged outcome with the
+    time it took in "seconds"
+    """
+
+    if workers < 1:
+        raise RuntimeError("There has to be at least one worker")
+
+    shards = [(seed * workers + index, -(-actions // workers), party_size, level, table) for index in range(workers)]
+    start = time.perf_counter()
+    if workers == 1:
+        results = [_run_shard(shards[0])]
+    else:
+        # Like the supervisor's workers, started clean rather than forked
+        with multiprocessing.get_context("spawn").Pool(workers) as pool:
+            results = pool.map(_run_shard, shards)
+
+    total = _new_stats()
+    for stats in results:
+        merge_stats(total, stats)
+    total["seconds"] = time.perf_counter() - start
+    return total
+
+def print_report(stats: Dict[str, Any]) -> None:
+    seconds = stats["seconds"] or 1e-9
+    print('[i] %i ACTIONS, %i ENCOUNTERS, %i TICKS IN %.2f s: %.0f actions/s, %.0f encounters/s' % (
+        stats["actions"], stats["encounters"], stats["ticks"], stats["seconds"], stats["actions"] / seconds, stats["encounters"] / seconds))
+    print('[i] HEROES WON %.1f%% OF THE FIGHTS' % (100.0 * stats["won"] / max(stats["encounters"], 1)))
+    print('[i] %12s %10s %8s %12s' % ("npc", "fights", "won %", "ticks/fight"))
+    for npc, (fights, won, ticks) in sorted(stats["npcs"].items()):
+        print('[i] %12s %10i %8.1f %12.1f' % (npc, fights, 100.0 * won / fights, ticks / fights))
+    print('[i] %12s %10s %10s %12s' % ("class", "heroes", "survived %", "levels/hero"))
+    for name, (heroes, survived, levels) in sorted(stats["classes"].items()):
+        print('[i] %12s %10i %10.1f %12.3f' % (name, heroes, 100.0 * survived / heroes, levels / heroes))
@@ -0,0 +1,295 @@
+import time
+from collections import OrderedDict
+from threading import Event, Lock, Thread
+from typing import Any, Dict, List, Tuple
+from serialization import decode_character, encode_character
+from journal import CHARACTER_KILLED, CHARACTER_SAVED
+import metrics
+
+# Marks a cache entry for a user known to have no character
+_MISSING = object()
+
+class CharacterStore():
+    """
+    Characters of all channels, kept in the Database. Reads go through an
+    LRU cache (users without a character are cached too, most chatters
+    never create one). Writes only touch the cache and are flushed by a
+    background thread in one transaction, every flush_interval seconds
+    or as soon as flush_threshold characters are dirty. Nothing is loaded
+    up front, a character is read the first time its user shows up.
+
+    With a Journal every change is also appended to it before it counts,
+    a flush is then a snapshot that lets the journal drop what it holds,
+    and on startup the changes after the last snapshot are replayed
+    """
+
+    _instance: Any = None
+
+    def __new__(self):
+        if self._instance == None:
+            self._instance = super(CharacterStore, self).__new__(self)
+            self._database: Any = None
+            self._lock = Lock()
+            self._cache: Any = OrderedDict()
+            self._dirty: Dict[Tuple[str, str], Any] = {}
+            # Dirty entries taken by a flush that is still writing
+            self._flushing: Dict[Tuple[str, str], Any] = {}
+            self._flush_thread: Any = None
+            self._flush_now = Event()
+            self._stopping = False
+            self._journal: Any = None
+
+        return self._instance
+
+    def initialize(self, database: Any, cache_size: int = 10000, flush_interval: float = 5.0, flush_threshold: int = 500, journal: Any = None) -> None:
+        """
+        Attaches the store to an initialized Database and starts the flush
+        thread. A running journal gets its events since the last snapshot
+        replayed first
+        """
+
+        if self._database is not None:
+            raise RuntimeError('The character store is already initialized')
+
+        self._database = database
+        self.cache_size = cache_size
+        self.flush_interval = flush_interval
+        self.flush_threshold = flush_threshold
+        self._stopping = False
+        self._journal = journal
+
+        if journal is not None:
+            replayed = self._replay()
+            if replayed:
+                print('[i] REPLAYED %i JOURNAL EVENTS' % (replayed))
+
+        self._flush_thread = Thread(target=self._flush_loop, name="CharacterFlushThread", daemon=True)
+        self._flush_thread.start()
+
+    def _replay(self) -> int:
+        """
+        Applies the journal events newer than the database's snapshot
+        and writes a new snapshot, returns how many there were
+        """
+
+        journal = self._journal
+        snapshot = self._database.get_journal_seq(journal.name)
+        journal.skip_to(snapshot)
+        replayed = 0
+        for _, kind, channel, user, data in journal.replay(snapshot):
+            char = decode_character(data) if kind == CHARACTER_SAVED else None
+            self._remember((channel, user), char)
+            self._dirty[(channel, user)] = char
+            replayed += 1
+        if replayed:
+            self.flush()
+        return replayed
+
+    def close(self) -> None:
+        """
+        Stops the flush thread and writes everything that is still dirty
+        """
+
+        if self._database is None:
+            raise RuntimeError('The character store is not initialized')
+
+        self._stopping = True
+        self._flush_now.set()
+        self._flush_thread.join()
+        self.flush()
+        self._database = None
+        self._journal = None
+        self._flush_thread = None
+
+    def get(self, channel: str, user: str) -> Any:
+        """
+        Returns the character of a user in a channel, or None
+        """
+
+        key = (channel, user)
+        self._lock.acquire()
+        try:
+            char = self._cache.get(key)
+            if char is not None:
+                self._cache.move_to_end(key)
+                return None if char is _MISSING else char
+            for pending in (self._dirty, self._flushing):
+                if key in pending:
+                    # Evicted from the cache but not written yet
+                    char = pending[key]
+                    self._remember(key, char)
+                    return char
+        finally:
+            self._lock.release()
+
+        data = self._database.get_data(channel, user)
+        char = None if data is None else decode_character(data)
+
+        self._lock.acquire()
+        try:
+            # A write may have happened while we were reading
+            if key not in self._cache and key not in self._dirty:
+                self._remember(key, char)
+        finally:
+            self._lock.release()
+        return char
+
+    def put(self, channel: str, user: str, char: Any) -> None:
+        """
+        Stores a new or changed character, it is written on the next flush
+        """
+
+        self._set([((channel, user), char)])
+
+    def put_many(self, channel: str, chars: List[Tuple[str, Any]], only_current: bool = False) -> List[Tuple[str, Any]]:
+        """
+        Stores many (user, character) pairs of a channel at once: all of
+        them are journaled first and then waited for once, so they share
+        one sync. With only_current characters that were deleted or
+        replaced by another hero since they were read are left out, the
+        same hero read again (after the cache dropped it) is not replaced.
+        Returns the ones stored
+        """
+
+        if only_current:
+            # So the check under the lock finds them in memory
+            for user, _ in chars:
+                self.get(channel, user)
+        return [(key[1], char) for key, char in self._set([((channel, user), char) for user, char in chars], only_current)]
+
+    def delete(self, channel: str, user: str) -> None:
+        """
+        Removes a character, it is deleted from the database on the next flush
+        """
+
+        self._set([((channel, user), None)])
+
+    def _set(self, items: List[Tuple[Tuple[str, str], Any]], only_current: bool = False) -> List[Tuple[Tuple[str, str], Any]]:
+        journal = self._journal
+        if journal is not None:
+            records = [b"" if char is None else encode_character(char) for _, char in items]
+
+        stored = []
+        seq = 0
+        self._lock.acquire()
+        try:
+            for index, (key, char) in enumerate(items):
+                if only_current and not self._is_current(key, char):
+                    continue
+                if journal is not None:
+                    # Under the store's lock, so the journal has changes in the
+                    # same order as the cache and a flush knows what it covers
+                    seq = journal.append(CHARACTER_KILLED if char is None else CHARACTER_SAVED, key[0], key[1], records[index])
+                self._remember(key, char)
+                self._dirty[key] = char
+                stored.append((key, char))
+            dirty = len(self._dirty)
+        finally:
+            self._lock.release()
+
+        if dirty >= self.flush_threshold:
+            self._flush_now.set()
+        if journal is not None and journal.sync and seq:
+            # Group commit, the handlers waiting at once share one fsync
+            journal.wait_synced(seq)
+        return stored
+
+    def _is_current(self, key: Tuple[str, str], char: Any) -> bool:
+        """
+        Whether the hero stored under key is still the one char is a copy
+        of, by hero id: the object may have been read again since. One
+        that is no longer in memory counts as current. Lock must be held
+        """
+
+        if key in self._cache:
+            stored = self._cache[key]
+        elif key in self._dirty:
+            stored = self._dirty[key]
+        elif key in self._flushing:
+            stored = self._flushing[key]
+        else:
+            return True
+        return stored is not None and stored is not _MISSING and stored.hero_id == char.hero_id
+
+    def pending(self, channel: str) -> Dict[str, Any]:
+        """
+        Characters of a channel that changed since the last finished
+        flush, None for deleted ones
+        """
+
+        self._lock.acquire()
+        try:
+            changed = { user: char for (c, user), char in self._flushing.items() if c == channel }
+            changed.update({ user: char for (c, user), char in self._dirty.items() if c == channel })
+            return changed
+        finally:
+            self._lock.release()
+
+    def _remember(self, key: Tuple[str, str], char: Any) -> None:
+        """
+        Puts an entry in the LRU cache, evicting the oldest. Lock must be held
+        """
+
+        self._cache[key] = _MISSING if char is None else char
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def flush(self) -> int:
+        """
+        Writes all dirty characters in one transaction, returns how many
+        """
+
+        self._lock.acquire()
+        try:
+            dirty = self._dirty
+            self._dirty = {}
+            self._flushing = dirty
+            # Every journal event up to here is in dirty or already written
+            snapshot = (self._journal.name, self._journal.seq) if self._journal is not None else None
+        finally:
+            self._lock.release()
+
+        if not dirty:
+            return 0
+
+        start = time.perf_counter()
+        rows: List[Tuple[Any, ...]] = []
+        deleted: List[Tuple[str, str]] = []
+        for (channel, user), char in dirty.items():
+            if char is None:
+                deleted.append((channel, user))
+            else:
+                rows.append((channel, user, encode_character(char), char.level, char.class_name, char.hp, char.xp))
+
+        try:
+            self._database.write_many(rows, deleted, snapshot)
+        except Exception:
+            # Put them back unless they changed again meanwhile
+            self._lock.acquire()
+            try:
+                for key, char in dirty.items():
+                    self._dirty.setdefault(key, char)
+            finally:
+                self._lock.release()
+            raise
+        finally:
+            self._lock.acquire()
+            try:
+                self._flushing = {}
+            finally:
+                self._lock.release()
+        if snapshot is not None:
+            self._journal.truncate(snapshot[1])
+        # A flush every few seconds, no need to check whether metrics are on
+        metrics.FLUSH_SECONDS.observe(time.perf_counter() - start)
+        return len(dirty)
+
+    def _flush_loop(self) -> None:
+        while not self._stopping:
+            self._flush_now.wait(self.flush_interval)
+            self._flush_now.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print('[!] CHARACTER FLUSH FAILED: ' + str(e))
@@ -0,0 +1,159 @@
+import multiprocessing
+import time
+from threading import Lock, Thread
+from typing import Any, Callable, Dict, List
+from sharding import HashRing
+
+class Supervisor:
+    """
+    Runs the bot as several worker processes, so it is no longer bound to
+    one core. Every worker is a full bot with its own connection and owns
+    a shard of the channels, picked by consistent hashing. They share the
+    character database file (SQLite in WAL mode, each writing its own
+    channels in batches). Workers get commands through a pipe and are
+    started again if they die.
+
+    target(index, channels, rate_limit, pipe) runs a worker, it must be
+    importable by the new processes
+    """
+
+    def __init__(self, workers: int, channels: List[str], target: Callable[..., Any], rate_limit: int = 20):
+        if workers < 1:
+            raise RuntimeError("There has to be at least one worker")
+
+        self.workers = workers
+        self.target = target
+        # Twitch counts chat messages per account, whatever the number of connections
+        self.rate_limit = max(rate_limit // workers, 1)
+        self._ring = HashRing(range(workers))
+        self._shards: Dict[int, List[str]] = self._ring.assign(channels)
+        self._processes: Dict[int, Any] = {}
+        self._pipes: Dict[int, Any] = {}
+        self._restarts: Dict[int, int] = { index: 0 for index in range(workers) }
+        self._lock = Lock()
+        self._context = multiprocessing.get_context("spawn")
+        self._watcher: Any = None
+        self._stopping = False
+
+    def start(self) -> None:
+        """
+        Starts every worker and a thread that restarts the ones that die
+        """
+
+        for index in range(self.workers):
+            self._start_worker(index)
+        self._watcher = Thread(target=self._watch, name="SupervisorThread", daemon=True)
+        self._watcher.start()
+
+    def _start_worker(self, index: int) -> None:
+        pipe, child_pipe = self._context.Pipe()
+        process = self._context.Process(target=self.target, args=(index, list(self._shards[index]), self.rate_limit, child_pipe),
+            name="BotWorker%i" % (index))
+        process.start()
+        self._processes[index] = process
+        self._pipes[index] = pipe
+        print('[i] WORKER %i STARTED (pid %i): %s' % (index, process.pid, ", ".join(self._shards[index]) or "no channels"))
+
+    def _watch(self) -> None:
+        while not self._stopping:
+            time.sleep(1.0)
+            self._lock.acquire()
+            try:
+                for index, process in self._processes.items():
+                    if self._stopping or process.is_alive():
+                        continue
+                    self._restarts[index] += 1
+                    print('[!] WORKER %i DIED (exit code %s), RESTARTING' % (index, process.exitcode))
+                    self._start_worker(index)
+            finally:
+                self._lock.release()
+
+    def stop(self, timeout: float = 10.0) -> None:
+        """
+        Tells every worker to exit, kills those that don't in time
+        """
+
+        self._stopping = True
+        self._lock.acquire()
+        try:
+            for index in self._processes:
+                self._send(index, "exit")
+            for process in self._processes.values():
+                process.join(timeout)
+                if process.is_alive():
+                    process.terminate()
+                    process.join()
+        finally:
+            self._lock.release()
+
+    def _send(self, index: int, command: str) -> None:
+        try:
+            self._pipes[index].send(command)
+        except (OSError, ValueError):
+            # The worker is gone, the watcher starts it again
+            pass
+
+    def worker_for(self, channel: str) -> int:
+        return self._ring.node_for(channel)
+
+    def send(self, channel: str, command: str) -> None:
+        """
+        Sends a console command to the worker that owns channel
+        """
+
+        self._lock.acquire()
+        try:
+            self._send(self.worker_for(channel), command)
+        finally:
+            self._lock.release()
+
+    def broadcast(self, command: str) -> None:
+        """
+        Sends a console command to every worker
+        """
+
+        self._lock.acquire()
+        try:
+            for index in self._processes:
+                self._send(index, command)
+        finally:
+            self._lock.release()
+
+    def join(self, channel: str) -> None:
+        index = self.worker_for(channel)
+        self._lock.acquire()
+        try:
+            if channel in self._shards[index]:
+                raise RuntimeError('Already joined %s' % (channel))
+            self._shards[index].append(channel)
+            self._send(index, "join " + channel)
+        finally:
+            self._lock.release()
+
+    def part(self, channel: str) -> None:
+        index = self.worker_for(channel)
+        self._lock.acquire()
+        try:
+            if channel not in self._shards[index]:
+                raise RuntimeError('Not joined to %s' % (channel))
+            self._shards[index].remove(channel)
+            self._send(index, "part " + channel)
+        finally:
+            self._lock.release()
+
+    def status(self) -> List[Dict[str, Any]]:
+        """
+        pid, liveness, restarts and channels of every worker
+        """
+
+        self._lock.acquire()
+        try:
+            return [{
+                "worker": index,
+                "pid": process.pid,
+                "alive": process.is_alive(),
+                "restarts": self._restarts[index],
+                "channels": list(self._shards[index]),
+            } for index, process in self._processes.items()]
+        finally:
+            self._lock.release()
@@ -0,0 +1,39 @@
+import unittest
+from catalog import MessageCatalog, Template
+
+class TemplateTest(unittest.TestCase):
+    def test_static_message_is_rendered_once(self):
+        template = Template("static", "100% static")
+        self.assertEqual(template.rendered, "100% static")
+        self.assertIs(template.render({}), template.rendered)
+
+    def test_fields_in_order(self):
+        template = Template("fields", "{a} and {b}, {a} again at 50%")
+        self.assertEqual(template.order, ("a", "b", "a"))
+        self.assertEqual(template.fields, frozenset(["a", "b"]))
+        self.assertEqual(template.render({ "a": 1, "b": "two", "unused": 3 }), "1 and two, 1 again at 50%")
+
+    def test_single_field_takes_any_value(self):
+        template = Template("single", "got {value}")
+        self.assertEqual(template.render({ "value": "text" }), "got text")
+        self.assertEqual(template.render({ "value": (1, 2) }), "got (1, 2)")
+
+    def test_missing_value(self):
+        with self.assertRaises(KeyError):
+            Template("fields", "{a} and {b}").render({ "a": 1 })
+
+    def test_only_plain_named_fields(self):
+        for text in ("{0}", "{a:>5}", "{a!r}", "{a.b}", "{"):
+            with self.assertRaises(RuntimeError):
+                Template("broken", text)
+
+class MessageCatalogTest(unittest.TestCase):
+    def test_every_message_renders_in_every_locale(self):
+        catalog = MessageCatalog()
+        for locale in catalog.locales():
+            for id, template in catalog.table(locale).items():
+                text = template.render({ field: "x" for field in template.fields })
+                self.assertNotIn("%s", text, "%s in %s" % (id, locale))
+
+if __name__ == "__main__":
+    unittest.main()
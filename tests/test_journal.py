@@ -0,0 +1,70 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest import mock
+from journal import CHARACTER_SAVED, Journal, read_segment
+
+class JournalWriteFailureTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.journal = Journal()
+        self.journal.start(self.directory)
+        self.retry = mock.patch("journal.RETRY_SECONDS", 0.01)
+        self.retry.start()
+
+    def tearDown(self):
+        self.retry.stop()
+        if self.journal.is_running():
+            self.journal.stop()
+        shutil.rmtree(self.directory)
+
+    def events(self):
+        return [event[0] for _, filename in self.journal.segments() for event in read_segment(filename)]
+
+    def test_failed_batch_is_written_again(self):
+        failures = [OSError("No space left on device")]
+        fsync = os.fsync
+        def failing_fsync(fd):
+            if failures:
+                raise failures.pop()
+            fsync(fd)
+
+        with mock.patch("journal.os.fsync", failing_fsync):
+            seq = self.journal.append(CHARACTER_SAVED, "#chan", "alice", b"record")
+            self.journal.wait_synced(seq)
+        self.assertEqual(failures, [])
+        self.assertEqual(self.journal.durable, seq)
+        # Once, the cut off first attempt does not hide it from replay
+        self.assertEqual(self.events(), [seq])
+
+    def test_not_synced_until_written(self):
+        written = threading.Event()
+        def failing_fsync(fd):
+            if not written.is_set():
+                raise OSError("Input/output error")
+            os.fdatasync(fd)
+
+        with mock.patch("journal.os.fsync", failing_fsync):
+            seq = self.journal.append(CHARACTER_SAVED, "#chan", "alice", b"record")
+            waiter = threading.Thread(target=self.journal.wait_synced, args=(seq,))
+            waiter.start()
+            waiter.join(0.2)
+            self.assertTrue(waiter.is_alive())
+            self.assertLess(self.journal.durable, seq)
+            written.set()
+            waiter.join(5)
+        self.assertFalse(waiter.is_alive())
+        self.assertEqual(self.events(), [seq])
+
+    def test_waiters_fail_if_stopped_unwritten(self):
+        with mock.patch("journal.os.fsync", side_effect=OSError("Input/output error")):
+            seq = self.journal.append(CHARACTER_SAVED, "#chan", "alice", b"record")
+            self.journal.stop()
+        with self.assertRaises(RuntimeError):
+            self.journal.wait_synced(seq)
+        self.assertLess(self.journal.durable, seq)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,205 @@
+import unittest
+from rate_limit import (CHANNELS_PER_LINE, COALESCE_SEPARATOR, MAX_MESSAGE_LENGTH, PRIORITY_MODERATION, PRIORITY_NORMAL,
+    OutboundQueue, TokenBucket)
+
+class FakeClock:
+    """
+    A clock that only moves when told to
+    """
+
+    def __init__(self, now: float = 0.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+    def advance(self, seconds: float) -> None:
+        self.now += seconds
+
+def message(data):
+    """
+    channel and text of a PRIVMSG line popped from the queue
+    """
+
+    channel, _, text = data.decode("utf-8")[len("PRIVMSG "):-2].partition(" :")
+    return channel, text
+
+class TokenBucketTest(unittest.TestCase):
+    def test_burst_is_half_the_limit(self):
+        clock = FakeClock()
+        bucket = TokenBucket.for_limit(20, 30, clock)
+        taken = sum(1 for _ in range(20) if bucket.try_take())
+        self.assertEqual(taken, 10)
+        self.assertFalse(bucket.try_take())
+
+    def test_refills_over_the_period(self):
+        clock = FakeClock()
+        bucket = TokenBucket.for_limit(20, 30, clock)
+        while bucket.try_take():
+            pass
+        # 10 tokens trickle in over 30 seconds
+        self.assertAlmostEqual(bucket.wait_time(), 3.0)
+        clock.advance(2.9)
+        self.assertFalse(bucket.try_take())
+        clock.advance(0.2)
+        self.assertTrue(bucket.try_take())
+        self.assertFalse(bucket.try_take())
+
+    def test_never_more_than_twenty_in_thirty_seconds(self):
+        clock = FakeClock()
+        queue = OutboundQueue(TokenBucket.for_limit(20, 30, clock), max_pending=10000, clock=clock)
+        for i in range(1000):
+            # Every message in its own channel, so nothing is coalesced
+            queue.push("#c%i" % (i), "hello")
+
+        sent = []
+        for _ in range(3000):
+            data, _ = queue.pop()
+            while data is not None:
+                sent.append(clock())
+                data, _ = queue.pop()
+            clock.advance(0.05)
+
+        self.assertGreater(len(sent), 50)
+        for index, start in enumerate(sent):
+            in_window = [t for t in sent[index:] if t < start + 30]
+            self.assertLessEqual(len(in_window), 20)
+
+    def test_wait_time_without_refill(self):
+        bucket = TokenBucket(1, 0, FakeClock())
+        self.assertTrue(bucket.try_take())
+        self.assertEqual(bucket.wait_time(), float("inf"))
+
+class OutboundQueueTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.queue = OutboundQueue(TokenBucket.for_limit(20, 30, self.clock), max_pending=3, clock=self.clock)
+
+    def test_empty_queue(self):
+        self.assertEqual(self.queue.pop(), (None, None))
+
+    def test_lanes_in_priority_order(self):
+        self.queue.push("#a", "normal")
+        self.queue.push("#a", "mod", PRIORITY_MODERATION)
+        self.queue.push_control(b"PONG :tmi.twitch.tv\r\n")
+
+        self.assertEqual(self.queue.pop()[0], b"PONG :tmi.twitch.tv\r\n")
+        self.assertEqual(message(self.queue.pop()[0]), ("#a", "mod"))
+        self.assertEqual(message(self.queue.pop()[0]), ("#a", "normal"))
+
+    def test_control_lines_need_no_token(self):
+        while self.queue.bucket.try_take():
+            pass
+        self.queue.push("#a", "waits")
+        self.queue.push_control(b"PART #a\r\n")
+
+        self.assertEqual(self.queue.pop()[0], b"PART #a\r\n")
+        data, wait = self.queue.pop()
+        self.assertIsNone(data)
+        self.assertAlmostEqual(wait, 3.0)
+        self.clock.advance(wait + 0.01)
+        self.assertEqual(message(self.queue.pop()[0]), ("#a", "waits"))
+
+    def test_coalesces_a_channel_up_to_the_length_limit(self):
+        self.queue.push("#a", "one")
+        self.queue.push("#b", "other")
+        self.queue.push("#a", "two")
+
+        self.assertEqual(message(self.queue.pop()[0]), ("#a", "one" + COALESCE_SEPARATOR + "two"))
+        self.assertEqual(message(self.queue.pop()[0]), ("#b", "other"))
+        self.assertEqual(self.queue.stats()["coalesced"], 1)
+
+        long = "x" * (MAX_MESSAGE_LENGTH - 10)
+        self.queue.push("#a", long)
+        self.queue.push("#a", "y" * 20)
+        self.assertEqual(message(self.queue.pop()[0]), ("#a", long))
+        self.assertEqual(message(self.queue.pop()[0]), ("#a", "y" * 20))
+
+    def test_coalescing_keeps_the_order_of_a_channel(self):
+        self.queue.push("#a", "a" * 400)
+        self.queue.push("#a", "b" * 200)
+        self.queue.push("#a", "c" * 10)
+
+        # The short one would fit with the first, but must not overtake the second
+        self.assertEqual(message(self.queue.pop()[0]), ("#a", "a" * 400))
+        self.assertEqual(message(self.queue.pop()[0]), ("#a", "b" * 200 + COALESCE_SEPARATOR + "c" * 10))
+
+    def test_full_lanes_drop_and_count(self):
+        for i in range(3):
+            self.assertTrue(self.queue.push("#a", "normal %i" % (i)))
+        self.assertFalse(self.queue.push("#a", "too many"))
+        self.assertTrue(self.queue.push("#a", "mod", PRIORITY_MODERATION))
+
+        stats = self.queue.stats()
+        self.assertEqual(stats["dropped"], 1)
+        self.assertEqual(stats["normal"], 3)
+        self.assertEqual(stats["moderation"], 1)
+
+    def test_counts_sent_and_longest_wait(self):
+        self.queue.push("#a", "first", PRIORITY_NORMAL)
+        self.clock.advance(2.5)
+        self.queue.pop()
+
+        stats = self.queue.stats()
+        self.assertEqual(stats["sent"], 1)
+        self.assertAlmostEqual(stats["max_wait"], 2.5)
+
+class JoinPacingTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.queue = OutboundQueue(TokenBucket.for_limit(20, 30, self.clock), clock=self.clock,
+            join_bucket=TokenBucket.for_limit(20, 10, self.clock))
+
+    def joined(self):
+        """
+        Channels of every JOIN line popped right now
+        """
+
+        channels = []
+        data, _ = self.queue.pop()
+        while data is not None:
+            if data.startswith(b"JOIN "):
+                channels.extend(data.decode("utf-8")[5:-2].split(","))
+            data, _ = self.queue.pop()
+        return channels
+
+    def test_never_more_than_twenty_joins_in_ten_seconds(self):
+        self.queue.push_joins(["#c%i" % (i) for i in range(300)])
+        joins = []
+        for _ in range(3500):
+            joins.extend((self.clock(), channel) for channel in self.joined())
+            self.clock.advance(0.1)
+
+        self.assertEqual(sorted(channel for _, channel in joins), sorted("#c%i" % (i) for i in range(300)))
+        for index, (start, _) in enumerate(joins):
+            in_window = [t for t, _ in joins[index:] if t < start + 10]
+            self.assertLessEqual(len(in_window), 20)
+
+    def test_lines_hold_a_few_channels(self):
+        self.queue.push_joins(["#c%i" % (i) for i in range(10)])
+        data, _ = self.queue.pop()
+        self.assertEqual(data, ("JOIN " + ",".join("#c%i" % (i) for i in range(10)) + "\r\n").encode("utf-8"))
+        self.assertLessEqual(10, CHANNELS_PER_LINE)
+
+    def test_chat_is_not_held_up_by_joins(self):
+        self.queue.push_joins(["#c%i" % (i) for i in range(30)])
+        self.queue.push("#c0", "hello")
+        self.assertEqual(len(self.joined()), 10)
+
+        # Sent while the other channels wait for the JOIN limit
+        self.queue.push("#c0", "again")
+        data, _ = self.queue.pop()
+        self.assertEqual(message(data), ("#c0", "again"))
+        data, wait = self.queue.pop()
+        self.assertIsNone(data)
+        self.assertAlmostEqual(wait, 1.0)
+        self.assertEqual(self.queue.stats()["joins"], 20)
+
+    def test_restart_and_cancel(self):
+        self.queue.push_joins(["#a", "#b"])
+        self.queue.cancel_join("#a")
+        self.queue.push_joins(["#b", "#c"], restart=True)
+        self.assertEqual(self.joined(), ["#b", "#c"])
+
+if __name__ == "__main__":
+    unittest.main()
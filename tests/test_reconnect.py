@@ -0,0 +1,137 @@
+import time
+import unittest
+from threading import Lock
+from unittest import mock
+from fake_irc import FakeIrcServer
+from irc_client import IrcClient
+
+CHANNELS = ["#one", "#two", "#three"]
+
+def wait_for(condition, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+class ReconnectTest(unittest.TestCase):
+    """
+    IrcClient against a fake server that cuts the connection, backoff
+    delays are shortened so every test takes a second or two
+    """
+
+    def setUp(self):
+        self.backoff = mock.patch.multiple("irc_client", _BACKOFF_BASE=0.05, _BACKOFF_MAX=0.2)
+        self.backoff.start()
+        self.server = FakeIrcServer(drop_chance=0.05, seed=7)
+        self.server.start()
+
+        self.heard = []
+        self.heard_lock = Lock()
+        self.client = IrcClient()
+        self.client.set_rate_limit(1000, 1)
+        # JOIN pacing has tests of its own, here it would only slow down rejoining
+        self.client.set_join_rate_limit(1000, 1)
+        self.client.register_message_handler(self.handler)
+        self.client.connect(self.server.host, self.server.port, "bot", "oauth:fake", CHANNELS, use_ssl=False)
+
+    def tearDown(self):
+        self.client.disconnect()
+        self.client.unregister_message_handler(self.handler)
+        self.server.stop()
+        self.backoff.stop()
+
+    def handler(self, message):
+        if message.command == "PRIVMSG":
+            self.heard_lock.acquire()
+            try:
+                self.heard.append(message.text)
+            finally:
+                self.heard_lock.release()
+
+    def logins(self):
+        """
+        Channels joined after each login, in order
+        """
+
+        logins = []
+        for line in self.server.lines():
+            command, _, rest = line.partition(" ")
+            if command == "PASS":
+                logins.append(set())
+            elif command == "JOIN" and logins:
+                logins[-1].update(rest.split(","))
+        return logins
+
+    def rejoined(self):
+        # The server only passes chat on once it has handled the JOINs
+        logins = self.logins()
+        return (self.client.is_connected() and len(logins) > 0 and logins[-1] == set(CHANNELS)
+            and self.server.joined() == [sorted(CHANNELS)])
+
+    def drop_a_few(self, drops=3):
+        """
+        Chats until the server dropped the connection drops times and the
+        client is back in every channel
+        """
+
+        sent = 0
+        while self.server.drops < drops:
+            self.client.send_message("message %i" % (sent), CHANNELS[sent % len(CHANNELS)])
+            sent += 1
+            time.sleep(0.005)
+            self.assertLess(sent, 5000, "the server never dropped the connection")
+        self.assertTrue(wait_for(self.rejoined))
+
+    def test_every_login_rejoins_all_channels(self):
+        self.drop_a_few()
+        logins = self.logins()
+        self.assertGreater(len(logins), 3)
+        self.assertGreaterEqual(self.client.get_reconnect_count(), 3)
+        for channels in logins:
+            self.assertEqual(channels, set(CHANNELS))
+
+    def test_handlers_survive_reconnects(self):
+        self.drop_a_few()
+        for channel in CHANNELS:
+            self.server.send_chat(channel, "viewer", "hello " + channel)
+        self.assertTrue(wait_for(lambda: len(self.heard) == len(CHANNELS)))
+        self.assertEqual(sorted(self.heard), sorted("hello " + channel for channel in CHANNELS))
+
+    def test_queued_messages_drain_after_reconnect(self):
+        self.assertTrue(wait_for(self.rejoined))
+        # A backoff long enough to queue messages while there is no connection
+        with mock.patch("irc_client.random.uniform", return_value=0.3):
+            self.server.drop_all()
+            self.assertTrue(wait_for(lambda: not self.client.is_connected()))
+            self.server.drop_chance = 0.0
+            for i in range(30):
+                self.client.send_message("queued %i" % (i), CHANNELS[i % len(CHANNELS)])
+
+        def drained():
+            stats = self.client.get_outbound_stats()
+            return self.client.is_connected() and stats["control"] + stats["moderation"] + stats["normal"] == 0
+        self.assertTrue(wait_for(drained))
+
+        def delivered():
+            sent = set()
+            for line in self.server.lines("PRIVMSG"):
+                sent.update(line.partition(" :")[2].split(" | "))
+            return all("queued %i" % (i) in sent for i in range(30))
+        self.assertTrue(wait_for(delivered))
+
+    def test_reconnect_is_followed_without_backoff(self):
+        self.assertTrue(wait_for(self.rejoined))
+        reconnects = self.client.get_reconnect_count()
+        # A backoff this long would fail the test
+        with mock.patch.multiple("irc_client", _BACKOFF_BASE=60.0, _BACKOFF_MAX=60.0):
+            start = time.monotonic()
+            self.server.send_reconnect()
+            self.assertTrue(wait_for(lambda: self.client.get_reconnect_count() > reconnects, timeout=5.0))
+            self.assertLess(time.monotonic() - start, 2.0)
+            self.assertTrue(wait_for(self.rejoined))
+        self.assertEqual(self.server.connections, len(self.logins()))
+
+if __name__ == "__main__":
+    unittest.main()
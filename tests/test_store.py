@@ -0,0 +1,79 @@
+import unittest
+from unittest import mock
+from channel import drop_channel, get_channel
+from character import Character
+from database import Database
+from store import CharacterStore
+
+def setUpModule():
+    if Database().db is None:
+        Database().initialize()
+
+class FinishedGameTest(unittest.TestCase):
+    def setUp(self):
+        self.client = mock.patch("channel.IrcClient")
+        self.client.start()
+        CharacterStore().initialize(Database(), cache_size=2, flush_interval=600)
+        # Every test gets a channel of its own, the database outlives them
+        self.channel = "#" + self._testMethodName
+        self.ctx = get_channel(self.channel)
+        self.ctx.add_character("alice", Character("Alice", "viking", "male"))
+        # Loaded, so it takes updates
+        self.ctx.leaderboard.top(1)
+
+    def tearDown(self):
+        self.ctx.game.running = False
+        CharacterStore().close()
+        drop_channel(self.channel)
+        self.client.stop()
+
+    def win(self):
+        self.ctx.game.start_new(boss_hp=1, schedule=False)
+        self.ctx.game.submit("alice", self.ctx.get_character("alice"), "attack")
+
+    def test_hero_read_again_keeps_the_result(self):
+        self.win()
+        # alice is written, pushed out of the cache and read again as a new object
+        CharacterStore().flush()
+        for user in ("bob", "carol", "dave"):
+            self.ctx.get_character(user)
+        self.ctx.get_character("alice")
+        self.ctx.game.resolve_tick()
+
+        char = self.ctx.get_character("alice")
+        self.assertEqual(char.level, 2)
+        self.assertGreater(char.xp, 0)
+        self.assertEqual(self.ctx.leaderboard.rank("alice")[2][0], 2)
+
+    def test_replaced_hero_is_not_overwritten(self):
+        self.win()
+        old = self.ctx.get_character("alice")
+        self.ctx.kill_character("alice")
+        self.ctx.add_character("alice", Character("Alicia", "viking", "male"))
+        self.ctx.save_heroes([("alice", old)])
+        self.assertEqual(self.ctx.get_character("alice").name, "Alicia")
+
+    def test_kill_while_saving_leaves_no_ghost(self):
+        store = CharacterStore()
+        put_many = store.put_many
+        def killed_during_sync(*args, **kwargs):
+            stored = put_many(*args, **kwargs)
+            self.ctx.kill_character("alice")
+            return stored
+
+        self.win()
+        with mock.patch.object(store, "put_many", killed_during_sync):
+            self.ctx.game.resolve_tick()
+        self.assertIsNone(self.ctx.get_character("alice"))
+        self.assertIsNone(self.ctx.leaderboard.rank("alice"))
+
+    def test_leaving_the_channel_ends_the_game(self):
+        self.win()
+        hero = self.ctx.game.combatants.chars[0]
+        hero.name = "Alice the Brave"
+        drop_channel(self.channel)
+        self.assertFalse(self.ctx.game.running)
+        self.assertEqual(CharacterStore().get(self.channel, "alice").name, "Alice the Brave")
+
+if __name__ == "__main__":
+    unittest.main()
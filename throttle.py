@@ -0,0 +1,146 @@
+import time
+from collections import OrderedDict, deque
+from typing import Any, Callable, Dict, Iterable
+from irc_message import IrcMessage
+import metrics
+
+class _UserWindow:
+    """
+    What the throttle remembers about one chatter
+    """
+
+    __slots__ = ("times", "commands", "last_text", "last_time")
+
+    def __init__(self, limit: int):
+        # When the last accepted commands were used, oldest first
+        self.times: Any = deque(maxlen=limit)
+        self.commands: Dict[str, Any] = {}
+        self.last_text = ""
+        self.last_time = 0.0
+
+class CommandThrottle:
+    """
+    Drops chat commands before they reach the handlers when a viewer uses
+    too many of them: at most user_limit commands in any window seconds,
+    at most command_limit of the same command (command_limits overrides
+    it per command) and never the same line twice within duplicate_window.
+    Rejected commands don't count, so a viewer is let through again once
+    the window has moved on.
+
+    Viewers are kept in an LRU of max_users entries, each holding no more
+    than user_limit timestamps, so memory stays flat however many people
+    chat. The broadcaster and viewers with an exempt badge (needs the
+    twitch.tv/tags capability) are never throttled. Only used from the
+    event loop thread, so there is no locking
+    """
+
+    def __init__(self, prefix: str = "!", user_limit: int = 5, window: float = 30.0, command_limit: int = 3, command_limits: Dict[str, int] = None,
+            duplicate_window: float = 10.0, exempt_badges: Iterable[str] = ("broadcaster", "moderator", "vip"), max_users: int = 100000,
+            clock: Callable[[], float] = time.monotonic):
+        self.prefix = prefix
+        self.user_limit = user_limit
+        self.window = window
+        self.command_limit = command_limit
+        self.command_limits = dict(command_limits or {})
+        self.duplicate_window = duplicate_window
+        self.exempt_badges = frozenset(exempt_badges)
+        self.max_users = max_users
+        self._clock = clock
+        self._users: Any = OrderedDict()
+
+        self.allowed = 0
+        self.limited = 0
+        self.duplicates = 0
+        self.exempted = 0
+
+    def allow(self, message: IrcMessage) -> bool:
+        """
+        Returns whether a PRIVMSG may be handled, lines that are no
+        command always may
+        """
+
+        text = message.text
+        if not text.startswith(self.prefix):
+            return True
+        if self._is_exempt(message):
+            self.exempted += 1
+            return True
+
+        now = self._clock()
+        user = message.nick
+        entry = self._users.get(user)
+        if entry is None:
+            entry = _UserWindow(self.user_limit)
+            self._users[user] = entry
+            if len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+        else:
+            self._users.move_to_end(user)
+
+        if text == entry.last_text and now - entry.last_time < self.duplicate_window:
+            self.duplicates += 1
+            metrics.COMMANDS_THROTTLED.inc()
+            return False
+
+        name = text[len(self.prefix):].split(" ", 1)[0].lower()
+        limit = self.command_limits.get(name, self.command_limit)
+        times = entry.commands.get(name)
+        if times is None:
+            times = deque(maxlen=limit)
+
+        if not self._fits(entry.times, self.user_limit, now) or not self._fits(times, limit, now):
+            self.limited += 1
+            metrics.COMMANDS_THROTTLED.inc()
+            return False
+
+        entry.times.append(now)
+        times.append(now)
+        if name not in entry.commands:
+            if len(entry.commands) >= self.user_limit:
+                self._forget_commands(entry, now)
+            entry.commands[name] = times
+        entry.last_text = text
+        entry.last_time = now
+        self.allowed += 1
+        return True
+
+    def _fits(self, times: Any, limit: int, now: float) -> bool:
+        """
+        Whether one more use fits in the window ending now
+        """
+
+        return len(times) < limit or now - times[0] >= self.window
+
+    def _forget_commands(self, entry: _UserWindow, now: float) -> None:
+        """
+        Drops commands not used within the window, so viewers trying
+        lots of different commands don't pile up entries
+        """
+
+        for name in [name for name, times in entry.commands.items() if now - times[-1] >= self.window]:
+            del entry.commands[name]
+
+    def _is_exempt(self, message: IrcMessage) -> bool:
+        if message.nick == message.channel[1:]:
+            return True
+        badges = message.tags.get("badges")
+        if not badges:
+            return False
+        for badge in badges.split(","):
+            if badge.split("/", 1)[0] in self.exempt_badges:
+                return True
+        return False
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Commands allowed, limited, dropped as duplicates and exempted,
+        plus how many viewers are tracked
+        """
+
+        return {
+            "allowed": self.allowed,
+            "limited": self.limited,
+            "duplicates": self.duplicates,
+            "exempted": self.exempted,
+            "users": len(self._users),
+        }
@@ -1,5 +1,3 @@
-from conf import CHANNEL
-
 def first_char_upper(str):
     """
     This function converts the first char of a string to upper case
@@ -20,27 +18,3 @@ def check_config(H, P, N, O, C):
     if O[:6] != 'oauth:': return False
     if C[0] != '#': return False
     return True
-
-def get_usr(msg: str) -> str:
-    """
-    Gets user from message string
-    """
-
-    end = msg.find('!')
-    return msg[1:end]
-
-def get_msg(msg: str) -> str:
-    """
-    Gets message from message string
-    """
-
-    index = msg.find(CHANNEL) + len(CHANNEL) + 2
-    return msg[index:]
-
-def is_prefixed(msg: str) -> bool:
-    """
-    Checks if the message is prefixed with correct command prefix
-    """
-
-    if get_msg(msg).find("!") == 0: return True
-    return False
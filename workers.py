@@ -0,0 +1,101 @@
+import time
+import traceback
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+from typing import Any, Callable, Dict
+
+class KeyedExecutor:
+    """
+    Runs tasks on a pool of threads. Tasks with the same key (the user
+    who sent a command) run one after another in the order they were
+    submitted, tasks with different keys run in parallel. The time each
+    task waited in the queue is kept for latency percentiles
+    """
+
+    def __init__(self, workers: int = 4, name: str = "HandlerWorker", samples: int = 10000):
+        self.workers = workers
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=name)
+        self._lock = Lock()
+        # Pending tasks of every key that has a worker draining it right now
+        self._queues: Dict[Any, Any] = {}
+        self._waits: Any = deque(maxlen=samples)
+        self.submitted = 0
+        self.completed = 0
+
+    def submit(self, key: Any, function: Callable[..., Any], *args: Any) -> None:
+        """
+        Queues function(*args) behind all earlier tasks of the same key
+        """
+
+        task = (function, args, time.perf_counter())
+        self._lock.acquire()
+        try:
+            self.submitted += 1
+            queue = self._queues.get(key)
+            if queue is not None:
+                queue.append(task)
+                return
+            self._queues[key] = deque((task,))
+        finally:
+            self._lock.release()
+
+        self._pool.submit(self._drain, key)
+
+    def _drain(self, key: Any) -> None:
+        """
+        Runs the tasks of one key until there are none left
+        """
+
+        finished = 0
+        while True:
+            self._lock.acquire()
+            try:
+                self.completed += finished
+                finished = 1
+                queue = self._queues[key]
+                if not queue:
+                    del self._queues[key]
+                    return
+                function, args, queued = queue.popleft()
+            finally:
+                self._lock.release()
+
+            self._waits.append(time.perf_counter() - queued)
+            try:
+                function(*args)
+            except Exception:
+                traceback.print_exc()
+
+    def pending(self) -> int:
+        """
+        Tasks submitted but not finished yet
+        """
+
+        return self.submitted - self.completed
+
+    def shutdown(self, wait: bool = True) -> None:
+        """
+        Stops accepting work, with wait everything queued is finished first
+        """
+
+        self._pool.shutdown(wait=wait)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Queue latency percentiles in milliseconds plus task counters
+        """
+
+        waits = sorted(self._waits)
+        result: Dict[str, Any] = {
+            "workers": self.workers,
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "pending": self.submitted - self.completed,
+        }
+        for name, fraction in (("p50", 0.5), ("p90", 0.9), ("p99", 0.99), ("max", 1.0)):
+            if waits:
+                result[name] = waits[min(int(len(waits) * fraction), len(waits) - 1)] * 1000
+            else:
+                result[name] = 0.0
+        return result